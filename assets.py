@@ -0,0 +1,105 @@
+"""Fingerprinted, precompressed static assets and cached page renders.
+
+At startup every CSS/JS file in static/ is read once, named after its content
+hash (`style.3f2a9c1b7e.css`) and compressed with gzip and, when the optional
+`brotli` package is installed, brotli. /assets/<hashed name> then serves the
+best encoding the client accepts straight from memory with immutable caching:
+a changed file gets a new name, so browsers never revalidate old ones.
+
+Pages that do not depend on the request (the empty-state index) are rendered
+once and kept in the same precompressed form behind an ETag.
+"""
+import gzip
+import hashlib
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+try:
+    import brotli
+except ImportError:  # brotli is optional; gzip is always available
+    brotli = None
+
+FINGERPRINT_SUFFIXES = ('.css', '.js')
+IMMUTABLE = 'public, max-age=31536000, immutable'
+CONTENT_TYPES = {'.css': 'text/css; charset=utf-8', '.js': 'text/javascript; charset=utf-8',
+                 '.html': 'text/html; charset=utf-8'}
+# Below this size the encoding overhead is not worth it
+MIN_COMPRESS = 256
+
+
+class CompressedBody:
+    """One response body in every encoding we serve."""
+
+    def __init__(self, data: bytes, content_type: str):
+        self.content_type = content_type
+        self.digest = hashlib.sha256(data).hexdigest()
+        self.encodings: Dict[str, bytes] = {'identity': data}
+        if len(data) >= MIN_COMPRESS:
+            gz = gzip.compress(data, compresslevel=9, mtime=0)
+            if len(gz) < len(data):
+                self.encodings['gzip'] = gz
+            if brotli is not None:
+                br = brotli.compress(data, quality=11)
+                if len(br) < len(data):
+                    self.encodings['br'] = br
+
+    def negotiate(self, accept_encoding: Optional[str]) -> Tuple[str, bytes]:
+        """Pick br > gzip > identity from an Accept-Encoding header."""
+        accepted = set()
+        for part in (accept_encoding or '').split(','):
+            token, _, params = part.strip().partition(';')
+            if params.strip().replace(' ', '') in ('q=0', 'q=0.0', 'q=0.00', 'q=0.000'):
+                continue
+            accepted.add(token.strip().lower())
+        for enc in ('br', 'gzip'):
+            if enc in self.encodings and (enc in accepted or '*' in accepted):
+                return enc, self.encodings[enc]
+        return 'identity', self.encodings['identity']
+
+    def etag(self, encoding: str) -> str:
+        """Strong ETag of one encoding: each is a different byte sequence, so each gets its own tag."""
+        return f'"{self.digest[:16]}"' if encoding == 'identity' else f'"{self.digest[:16]}-{encoding}"'
+
+    def not_modified(self, if_none_match: Optional[str], encoding: str) -> bool:
+        """Whether an If-None-Match header names the variant negotiated for this request."""
+        if not if_none_match:
+            return False
+        tags = {tag.strip().removeprefix('W/') for tag in if_none_match.split(',')}
+        return '*' in tags or self.etag(encoding) in tags
+
+    def headers(self, encoding: str, cache_control: str) -> Dict[str, str]:
+        headers = {'ETag': self.etag(encoding), 'Cache-Control': cache_control, 'Vary': 'Accept-Encoding'}
+        if encoding != 'identity':
+            headers['Content-Encoding'] = encoding
+        return headers
+
+
+class AssetManifest:
+    def __init__(self, static_dir: Path):
+        self.static_dir = Path(static_dir)
+        self.urls: Dict[str, str] = {}
+        self.bodies: Dict[str, CompressedBody] = {}
+        self.build()
+
+    def build(self):
+        urls, bodies = {}, {}
+        for path in sorted(self.static_dir.rglob('*')):
+            if not path.is_file() or path.suffix not in FINGERPRINT_SUFFIXES:
+                continue
+            body = CompressedBody(path.read_bytes(), CONTENT_TYPES[path.suffix])
+            logical = path.relative_to(self.static_dir).as_posix()
+            hashed = f"{logical[:-len(path.suffix)]}.{body.digest[:10]}{path.suffix}"
+            urls[logical] = f"/assets/{hashed}"
+            bodies[hashed] = body
+        self.urls, self.bodies = urls, bodies
+
+    def url(self, logical: str) -> str:
+        """Fingerprinted URL for a file in static/ (falls back to the plain /static path)."""
+        return self.urls.get(logical) or f"/static/{logical}"
+
+    def get(self, hashed: str) -> Optional[CompressedBody]:
+        return self.bodies.get(hashed)
+
+    def stats(self) -> dict:
+        return {name: {enc: len(data) for enc, data in body.encodings.items()}
+                for name, body in self.bodies.items()}
@@ -0,0 +1,280 @@
+"""Process-wide bandwidth budgets.
+
+Two budgets exist per process: INGRESS for upstream downloads (yt-dlp and our
+own TikTok streaming) and EGRESS for bytes we serve back to clients. Every
+transfer opens a Flow on a budget; the budget splits its rate between open
+flows by weight (water-filling, so capped flows hand their leftover to the
+others) and reserves a minimum rate for interactive flows so a bulk batch
+cannot push a user-facing download to a crawl.
+
+A rate of 0 means "unlimited" everywhere in this module.
+"""
+import asyncio
+import os
+import re
+import threading
+import time
+from typing import AsyncIterable, AsyncIterator, Callable, Dict, Iterable, Iterator, Optional
+
+PRIORITY_WEIGHTS = {'interactive': 4.0, 'bulk': 1.0}
+
+_RATE_RE = re.compile(r'^\s*(\d+(?:\.\d+)?)\s*([kmg]?)i?b?\s*$', re.IGNORECASE)
+_UNITS = {'': 1, 'k': 1024, 'm': 1024 ** 2, 'g': 1024 ** 3}
+
+
+def parse_rate(value) -> int:
+    """Parse '2M', '500k', '1048576' into bytes/sec. Empty/invalid -> 0 (unlimited)."""
+    if value is None:
+        return 0
+    if isinstance(value, (int, float)):
+        return max(0, int(value))
+    m = _RATE_RE.match(str(value))
+    if not m:
+        return 0
+    return int(float(m.group(1)) * _UNITS[m.group(2).lower()])
+
+
+class TokenBucket:
+    """Blocking token bucket. Allows going into debt so large chunks still pass."""
+
+    def __init__(self, rate: float = 0, burst: Optional[float] = None):
+        self._lock = threading.Lock()
+        self.rate = float(rate)
+        self.burst = float(burst) if burst else max(self.rate * 0.25, 64 * 1024)
+        self._tokens = self.burst
+        self._stamp = time.monotonic()
+
+    def set_rate(self, rate: float):
+        with self._lock:
+            self._refill()
+            self.rate = float(rate)
+            self.burst = max(self.rate * 0.25, 64 * 1024)
+            self._tokens = min(self._tokens, self.burst)
+
+    def _refill(self):
+        now = time.monotonic()
+        if self.rate > 0:
+            self._tokens = min(self.burst, self._tokens + (now - self._stamp) * self.rate)
+        self._stamp = now
+
+    def consume(self, amount: int, should_stop: Optional[Callable[[], bool]] = None) -> float:
+        """Take `amount` tokens, sleeping while in debt. Returns seconds slept."""
+        slept = 0.0
+        with self._lock:
+            self._refill()
+            if self.rate <= 0:
+                return 0.0
+            self._tokens -= amount
+        while True:
+            with self._lock:
+                self._refill()
+                if self.rate <= 0 or self._tokens >= 0:
+                    return slept
+                wait = -self._tokens / self.rate
+            if should_stop and should_stop():
+                return slept
+            # Sleep in short slices so rebalancing and cancellation apply quickly
+            wait = min(wait, 0.25)
+            time.sleep(wait)
+            slept += wait
+
+    def reserve(self, amount: int) -> float:
+        """Take `amount` tokens without blocking; returns how long the caller should wait."""
+        with self._lock:
+            self._refill()
+            if self.rate <= 0:
+                return 0.0
+            self._tokens -= amount
+            return max(0.0, -self._tokens / self.rate)
+
+
+class Flow:
+    """One transfer's share of a BandwidthBudget."""
+
+    def __init__(self, budget: 'BandwidthBudget', flow_id: str, weight: float, cap: int, interactive: bool):
+        self.budget = budget
+        self.flow_id = flow_id
+        self.weight = max(float(weight), 0.01)
+        self.cap = int(cap or 0)
+        self.interactive = interactive
+        self.bucket = TokenBucket(0)
+        self.bytes = 0
+        self.throttled = 0.0
+        self.opened = time.monotonic()
+        self.closed = False
+
+    @property
+    def rate(self) -> float:
+        return self.bucket.rate
+
+    def consume(self, amount: int, should_stop: Optional[Callable[[], bool]] = None):
+        if amount <= 0 or self.closed:
+            return
+        self.bytes += amount
+        self.throttled += self.bucket.consume(amount, should_stop)
+
+    def reserve(self, amount: int) -> float:
+        """Non-blocking consume for async callers: returns the delay to sleep."""
+        if amount <= 0 or self.closed:
+            return 0.0
+        self.bytes += amount
+        delay = self.bucket.reserve(amount)
+        self.throttled += delay
+        return delay
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            self.budget._release(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def snapshot(self) -> dict:
+        elapsed = max(time.monotonic() - self.opened, 1e-6)
+        return {
+            'id': self.flow_id,
+            'weight': self.weight,
+            'cap': self.cap or None,
+            'interactive': self.interactive,
+            'rate': int(self.rate) or None,
+            'bytes': self.bytes,
+            'avg_bps': int(self.bytes / elapsed),
+            'throttled_s': round(self.throttled, 3),
+        }
+
+
+class BandwidthBudget:
+    """A shared rate (bytes/sec) split between open flows by weight."""
+
+    def __init__(self, name: str, rate: int = 0, interactive_floor: int = 0):
+        self.name = name
+        self.rate = int(rate or 0)
+        self.interactive_floor = int(interactive_floor or 0)
+        self._lock = threading.Lock()
+        self._flows: Dict[int, Flow] = {}
+        self.total_bytes = 0
+
+    def open(self, flow_id: str, weight: Optional[float] = None, cap: int = 0, interactive: bool = True) -> Flow:
+        if weight is None:
+            weight = PRIORITY_WEIGHTS['interactive' if interactive else 'bulk']
+        flow = Flow(self, flow_id, weight, cap, interactive)
+        with self._lock:
+            self._flows[id(flow)] = flow
+            self._rebalance()
+        return flow
+
+    def set_rate(self, rate: int):
+        with self._lock:
+            self.rate = int(rate or 0)
+            self._rebalance()
+
+    def _release(self, flow: Flow):
+        with self._lock:
+            self._flows.pop(id(flow), None)
+            self.total_bytes += flow.bytes
+            self._rebalance()
+
+    def _rebalance(self):
+        flows = list(self._flows.values())
+        if not flows:
+            return
+        if self.rate <= 0:
+            for f in flows:
+                f.bucket.set_rate(f.cap)
+            return
+        # Reserve the interactive floor first (scaled down if it would exceed the budget)
+        floors = {}
+        for f in flows:
+            floor = self.interactive_floor if f.interactive else 0
+            if f.cap:
+                floor = min(floor, f.cap)
+            floors[id(f)] = floor
+        reserved = sum(floors.values())
+        if reserved > self.rate:
+            scale = self.rate / reserved
+            floors = {k: v * scale for k, v in floors.items()}
+            reserved = self.rate
+        remaining = self.rate - reserved
+        alloc = dict(floors)
+        # Water-fill the rest by weight; capped flows return their surplus
+        active = list(flows)
+        while active and remaining > 0:
+            total_weight = sum(f.weight for f in active)
+            capped = [f for f in active
+                      if f.cap and alloc[id(f)] + remaining * f.weight / total_weight >= f.cap]
+            if not capped:
+                for f in active:
+                    alloc[id(f)] += remaining * f.weight / total_weight
+                break
+            for f in capped:
+                remaining -= f.cap - alloc[id(f)]
+                alloc[id(f)] = f.cap
+                active.remove(f)
+        for f in flows:
+            f.bucket.set_rate(max(alloc[id(f)], 1))
+
+    def throttle(self, chunks: Iterable[bytes], flow_id: str, weight: Optional[float] = None,
+                 cap: int = 0, interactive: bool = True,
+                 should_stop: Optional[Callable[[], bool]] = None) -> Iterator[bytes]:
+        """Yield chunks at a new flow's rate. The flow lives exactly as long as the iteration."""
+        with self.open(flow_id, weight, cap, interactive) as flow:
+            for chunk in chunks:
+                flow.consume(len(chunk), should_stop)
+                yield chunk
+
+    async def athrottle(self, chunks: AsyncIterable[bytes], flow_id: str, weight: Optional[float] = None,
+                        cap: int = 0, interactive: bool = True) -> AsyncIterator[bytes]:
+        """Async variant of throttle(): waits with asyncio.sleep so no thread is held."""
+        with self.open(flow_id, weight, cap, interactive) as flow:
+            async for chunk in chunks:
+                delay = flow.reserve(len(chunk))
+                if delay:
+                    await asyncio.sleep(delay)
+                yield chunk
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            flows = [f.snapshot() for f in self._flows.values()]
+            total = self.total_bytes + sum(f['bytes'] for f in flows)
+        return {
+            'name': self.name,
+            'rate': self.rate or None,
+            'interactive_floor': self.interactive_floor or None,
+            'active_flows': len(flows),
+            'total_bytes': total,
+            'flows': flows,
+        }
+
+
+def ytdlp_throttle_hook(flow: Flow, should_stop: Optional[Callable[[], bool]] = None):
+    """Build a yt-dlp progress hook that charges downloaded bytes to `flow`.
+
+    Sleeping inside the hook stalls the downloader thread, which is what
+    enforces the fair share (yt-dlp's own `ratelimit` only knows static caps).
+    """
+    seen: Dict[str, int] = {}
+    lock = threading.Lock()
+
+    def hook(d):
+        if d.get('status') != 'downloading':
+            return
+        key = d.get('tmpfilename') or d.get('filename') or ''
+        done = d.get('downloaded_bytes') or 0
+        with lock:
+            delta = done - seen.get(key, 0)
+            seen[key] = done
+        if delta > 0:
+            flow.consume(delta, should_stop)
+    return hook
+
+
+INGRESS = BandwidthBudget('ingress',
+                          parse_rate(os.environ.get('MPD_INGRESS_LIMIT')),
+                          parse_rate(os.environ.get('MPD_INTERACTIVE_FLOOR')))
+EGRESS = BandwidthBudget('egress',
+                         parse_rate(os.environ.get('MPD_EGRESS_LIMIT')),
+                         parse_rate(os.environ.get('MPD_INTERACTIVE_FLOOR')))
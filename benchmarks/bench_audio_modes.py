@@ -0,0 +1,74 @@
+"""CPU cost per job: MP3 transcode ('audio') vs stream-copy remux ('audio_fast').
+
+Generates synthetic AAC and Opus sources with ffmpeg (the same kinds of tracks
+YouTube serves as m4a / webm), then runs the post-processing tasks the web app
+would submit and reports ffmpeg CPU-seconds and wall time per job.
+
+    python benchmarks/bench_audio_modes.py --duration 300 --runs 3
+"""
+import argparse
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import postprocess  # noqa: E402
+
+SOURCES = {
+    # name: (extension, ffmpeg encoder args)
+    'aac': ('m4a', ['-c:a', 'aac', '-b:a', '128k']),
+    'opus': ('webm', ['-c:a', 'libopus', '-b:a', '128k']),
+}
+
+
+def make_source(workdir: Path, name: str, duration: int) -> Path:
+    ext, codec_args = SOURCES[name]
+    out = workdir / f"src_{name}.{ext}"
+    subprocess.run(['ffmpeg', '-y', '-hide_banner', '-loglevel', 'error',
+                    '-f', 'lavfi', '-i', f'sine=frequency=440:duration={duration}',
+                    '-ac', '2', *codec_args, str(out)], check=True)
+    return out
+
+
+def bench(task: dict, runs: int) -> dict:
+    cpu, wall = [], []
+    for _ in range(runs):
+        result = postprocess.run_task(task)
+        if not result['ok']:
+            raise SystemExit(f"{task['op']} failed: {result['error']}")
+        cpu.append(result['cpu_s'])
+        wall.append(result['finished'] - result['started'])
+        Path(task['output']).unlink()
+    return {'cpu_s': statistics.median(cpu), 'wall_s': statistics.median(wall)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--duration', type=int, default=300, help='source length in seconds')
+    parser.add_argument('--runs', type=int, default=3)
+    args = parser.parse_args()
+    if not shutil.which('ffmpeg'):
+        raise SystemExit('ffmpeg not found on PATH')
+
+    with tempfile.TemporaryDirectory() as tmp:
+        workdir = Path(tmp)
+        print(f"{'source':<6} {'mode':<11} {'cpu_s/job':>10} {'wall_s/job':>11}")
+        for name in SOURCES:
+            src = make_source(workdir, name, args.duration)
+            transcode = bench({'op': 'extract_audio', 'inputs': [str(src)], 'bitrate': '192k',
+                               'output': str(workdir / 'out.mp3')}, args.runs)
+            container = postprocess.audio_container(name)
+            remux = bench({'op': 'remux_audio', 'inputs': [str(src)],
+                           'output': str(workdir / f'out.{container}')}, args.runs)
+            for mode, r in (('audio', transcode), ('audio_fast', remux)):
+                print(f"{name:<6} {mode:<11} {r['cpu_s']:>10.3f} {r['wall_s']:>11.3f}")
+            if remux['cpu_s']:
+                print(f"{'':<6} {'speedup':<11} {transcode['cpu_s'] / remux['cpu_s']:>9.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+"""Follow-up formats of already downloaded media: fetched from upstream vs derived locally.
+
+Starts the load test's upstream stand-in and a `uvicorn web_app:app` wired to
+it, downloads one video as `best`, then asks for the same video in the other
+formats, once with MPD_DERIVE=0 (every job goes upstream) and once with
+derivation on. Each row gives a job's wall time, the bytes the upstream
+actually sent for it and, for derived jobs, the operation used and the upstream
+bytes the job reports it avoided.
+
+    python benchmarks/bench_derive.py --rate 2M
+    python benchmarks/bench_derive.py --downscale --formats audio,720p
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import requests
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(ROOT / 'benchmarks' / 'loadtest'))
+
+from bandwidth import parse_rate  # noqa: E402
+from loadtest import start_server  # noqa: E402
+from upstreams import Upstreams, build_media  # noqa: E402
+
+
+def run_job(base: str, upstreams: Upstreams, url: str, fmt: str, timeout: float = 300) -> dict:
+    sent = upstreams.bytes_sent
+    started = time.perf_counter()
+    job_id = requests.post(base + '/api/start_download', data={'url': url, 'format': fmt}).json()['job_id']
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        job = requests.get(f"{base}/api/job/{job_id}").json()['job']
+        if job['status'] in ('finished', 'error', 'canceled'):
+            break
+        time.sleep(0.1)
+    else:
+        raise SystemExit(f"{fmt} job did not finish within {timeout:.0f}s")
+    if job['status'] != 'finished':
+        raise SystemExit(f"{fmt} job failed: {job['error']}")
+    return {'wall_s': time.perf_counter() - started, 'upstream': upstreams.bytes_sent - sent,
+            'derived': job['derived']}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--formats', default='audio,audio_fast,720p,best', help='requested after best')
+    parser.add_argument('--downscale', action='store_true', help='MPD_DERIVE_DOWNSCALE=1 (720p from 1080p)')
+    parser.add_argument('--rate', default='2M', help='per-connection upstream rate, e.g. 2M')
+    parser.add_argument('--media-seconds', type=float, default=20)
+    parser.add_argument('--media-dir', default=str(Path(tempfile.gettempdir()) / 'mpd-loadtest-media'))
+    args = parser.parse_args()
+
+    media = build_media(Path(args.media_dir), args.media_seconds)
+    upstreams = Upstreams(media, rate=parse_rate(args.rate), seconds=args.media_seconds).start()
+    os.environ['MPD_DERIVE_DOWNSCALE'] = '1' if args.downscale else '0'
+    print(f"upstream {args.rate}/s per connection; downscale {'on' if args.downscale else 'off'}")
+    print(f"{'derive':<7} {'format':<11} {'wall s':>7} {'upstream MB':>12}  {'op':<14} {'avoided MB':>10}  basis")
+    try:
+        for index, derive in enumerate(('0', '1')):
+            os.environ['MPD_DERIVE'] = derive
+            with tempfile.TemporaryDirectory(prefix='mpd-bench-derive-') as scratch:
+                server = start_server(args, upstreams, scratch)
+                try:
+                    url = f"https://www.youtube.com/watch?v=lt{900_000_000 + index}"
+                    for fmt in ['best'] + args.formats.split(','):
+                        r = run_job(server.base, upstreams, url, fmt)
+                        d = r['derived'] or {}
+                        avoided = f"{d['upstream_bytes_avoided'] / 1e6:>10.2f}" if d else f"{'-':>10}"
+                        print(f"{'on' if derive == '1' else 'off':<7} {fmt:<11} {r['wall_s']:>7.2f} "
+                              f"{r['upstream'] / 1e6:>12.2f}  {d.get('op', 'fetch'):<14} {avoided}  {d.get('basis', '')}")
+                finally:
+                    server.terminate()
+                    server.wait(timeout=15)
+    finally:
+        upstreams.stop()
+
+
+if __name__ == '__main__':
+    main()
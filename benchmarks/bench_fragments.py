@@ -0,0 +1,134 @@
+"""Fragmented (HLS / DASH) download time: one fragment at a time vs fixed vs adaptive concurrency.
+
+Starts the load test's upstream stand-in with a per-request latency and a
+per-connection rate (the shape of a distant CDN), resolves its `fragmented`
+test video and downloads one HLS or DASH format through the app's own fetch
+stage once per strategy:
+
+    1        yt-dlp's default, fragments one after another
+    N        a fixed number of concurrent fragments
+    auto     the AIMD gate (starts at 2, moves within MPD_FRAGMENT_MAX)
+
+Each run reports wall time, throughput, fragment errors (503s when
+--max-connections makes the upstream refuse connections), the gate's final and
+peak limit, whether the job's progress only ever moved forward, and whether
+the output matches the source byte for byte.
+
+    python benchmarks/bench_fragments.py --media-latency 0.1 --rate 1M
+    python benchmarks/bench_fragments.py --format hls-720 --strategies 1,4,auto
+    python benchmarks/bench_fragments.py --max-connections 3   # a CDN that refuses a 4th connection
+"""
+import argparse
+import contextlib
+import hashlib
+import io
+import json
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(ROOT / 'benchmarks' / 'loadtest'))
+
+# Downloads go to a scratch directory, not the app's downloads/
+os.environ.setdefault('MPD_DOWNLOAD_DIR', tempfile.mkdtemp(prefix='mpd-bench-fragments-'))
+
+import yt_dlp  # noqa: E402
+
+import web_app  # noqa: E402
+from bandwidth import parse_rate  # noqa: E402
+from fragments import FRAGMENTS  # noqa: E402
+from upstreams import Upstreams, build_media  # noqa: E402
+
+SOURCES = {'dash-1080': 'video_1080.mp4', 'hls-720': 'video_720.mp4', 'dash-audio': 'audio.m4a'}
+
+
+def digest(path: Path) -> str:
+    with open(path, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--format', default='dash-1080', choices=sorted(SOURCES))
+    parser.add_argument('--strategies', default='1,4,8,auto')
+    parser.add_argument('--media-latency', type=float, default=0.1, help='seconds before each response')
+    parser.add_argument('--rate', default='1M', help='per-connection rate, e.g. 1M')
+    parser.add_argument('--max-connections', type=int, default=0, help='upstream refuses more (503)')
+    parser.add_argument('--fragment-size', default='128k')
+    parser.add_argument('--media-seconds', type=float, default=20)
+    parser.add_argument('--media-dir', default=str(Path(tempfile.gettempdir()) / 'mpd-loadtest-media'))
+    parser.add_argument('--runs', type=int, default=1)
+    args = parser.parse_args()
+
+    media = build_media(Path(args.media_dir), args.media_seconds)
+    upstreams = Upstreams(media, rate=parse_rate(args.rate), media_latency=args.media_latency,
+                          max_connections=args.max_connections,
+                          fragment_size=parse_rate(args.fragment_size)).start()
+    source = digest(media[SOURCES[args.format]])
+    print(f"{args.format}: {media[SOURCES[args.format]].stat().st_size / 1e6:.1f} MB in "
+          f"{-(-upstreams.sizes[SOURCES[args.format]] // upstreams.fragment_size)} fragments, "
+          f"{args.media_latency * 1000:.0f} ms per request, {args.rate}/s per connection"
+          + (f", at most {args.max_connections} connections" if args.max_connections else ''))
+    print(f"{'strategy':<9} {'wall s':>7} {'MB/s':>6} {'errors':>6} {'limit':>6} {'peak':>5} "
+          f"{'progress':>9} {'output':>7}")
+    try:
+        for strategy in args.strategies.split(','):
+            for i in range(args.runs):
+                result = bench(upstreams, args.format, strategy, i, source)
+                print(f"{strategy:<9} {result['wall_s']:>7.2f} {result['mb_s']:>6.2f} {result['errors']:>6} "
+                      f"{result['limit']:>6} {result['peak']:>5} {result['progress']:>9} {result['output']:>7}")
+    finally:
+        upstreams.stop()
+
+
+def bench(upstreams: Upstreams, fmt: str, strategy: str, run_index: int, source: str) -> dict:
+    url = f"https://loadtest.invalid/fragmented/{strategy}-{run_index}"
+    with yt_dlp.YoutubeDL({'quiet': True, 'no_warnings': True, 'format': fmt}) as ydl:
+        raw = ydl.urlopen(f"{upstreams.base}/ytdlp/fragmented/{strategy}-{run_index}").read()
+        resolved = ydl.process_ie_result(dict(json.loads(raw), webpage_url=url, extractor='loadtest',
+                                              extractor_key='LoadTest'), download=False)
+    percents = []
+
+    def hook(d):
+        if d.get('status') == 'downloading':
+            percents.append(progress.update(d)['percent'])
+
+    progress = web_app.FetchProgress()
+    gate = FRAGMENTS.gate(f"bench:{strategy}", None if strategy == 'auto' else int(strategy))
+    refused = upstreams.refused
+    base = f"bench_{strategy}_{run_index}"
+    started = time.perf_counter()
+    try:
+        # yt-dlp prints every refused request; the errors column counts them
+        with contextlib.redirect_stderr(io.StringIO()):
+            fetched = web_app.fetch_stage(url, fmt, base, [hook], resolved=resolved, gate=gate, progress=progress)
+    except Exception as e:
+        return {'wall_s': time.perf_counter() - started, 'mb_s': 0.0, 'errors': upstreams.refused - refused,
+                'limit': gate.limit, 'peak': gate.peak_limit, 'progress': '-', 'output': 'FAILED',
+                'error': str(e)}
+    finally:
+        gate.close()
+    wall = time.perf_counter() - started
+    path = fetched['paths'][0]
+    size = path.stat().st_size
+    output = 'ok' if digest(path) == source else 'DIFFERS'
+    path.unlink()
+    seen = [p for p in percents if p is not None]
+    forward = all(b >= a for a, b in zip(seen, seen[1:]))
+    return {
+        'wall_s': wall,
+        'mb_s': size / wall / 1e6,
+        'errors': upstreams.refused - refused,
+        'limit': gate.limit,
+        'peak': gate.peak_limit,
+        'progress': f"{'fwd' if forward else 'BACK'} {seen[-1]:.0f}%" if seen else '-',
+        'output': output,
+    }
+
+
+if __name__ == '__main__':
+    main()
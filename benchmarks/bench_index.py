@@ -0,0 +1,94 @@
+"""Index page and static asset throughput: per-request rendering vs cached assets.
+
+"before" is how the app used to answer: `GET /` re-rendered index.html through
+Jinja2's TemplateResponse and the stylesheet came uncompressed from
+StaticFiles. "after" is the cached empty-state page and the fingerprinted,
+precompressed /assets files. Requests are driven straight through the ASGI
+app in-process, so the numbers measure server work, not the network.
+
+    python benchmarks/bench_index.py --requests 5000 --concurrency 32
+"""
+import argparse
+import asyncio
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from fastapi import Request  # noqa: E402
+
+import web_app  # noqa: E402
+
+HEADERS = [(b'accept-encoding', b'br, gzip')]
+
+
+@web_app.app.get('/__bench/rendered_index')
+async def rendered_index(request: Request):
+    return web_app.templates.TemplateResponse('index.html', {"request": request, 'preview': None, 'url': ''})
+
+
+async def request(path: str) -> int:
+    """One GET straight through the ASGI app; returns the bytes it sent."""
+    scope = {'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET',
+             'scheme': 'http', 'path': path, 'raw_path': path.encode(), 'query_string': b'',
+             'root_path': '', 'headers': HEADERS, 'client': ('127.0.0.1', 50000), 'server': ('bench', 80)}
+    sent = 0
+    status = 0
+
+    async def receive():
+        return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+    async def send(message):
+        nonlocal sent, status
+        if message['type'] == 'http.response.start':
+            status = message['status']
+        elif message['type'] == 'http.response.body':
+            sent += len(message.get('body', b''))
+
+    await web_app.app(scope, receive, send)
+    if status != 200:
+        raise SystemExit(f"GET {path} -> {status}")
+    return sent
+
+
+async def run(path: str, total: int, concurrency: int) -> dict:
+    remaining = total
+    wire = 0
+
+    async def worker():
+        nonlocal remaining, wire
+        while remaining > 0:
+            remaining -= 1
+            sent = await request(path)
+            wire += sent
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    return {'rps': total / elapsed, 'bytes': wire / total}
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--requests', type=int, default=5000)
+    parser.add_argument('--concurrency', type=int, default=32)
+    args = parser.parse_args()
+
+    cases = [
+        ('index', '/__bench/rendered_index', '/'),
+        ('style.css', '/static/style.css', web_app.ASSETS.url('style.css')),
+        ('app.js', '/static/app.js', web_app.ASSETS.url('app.js')),
+    ]
+    print(f"{'resource':<10} {'before req/s':>13} {'after req/s':>12} {'speedup':>8} "
+          f"{'before B':>9} {'after B':>8}")
+    for name, before_path, after_path in cases:
+        await run(after_path, 200, args.concurrency)  # warm up (first render)
+        before = await run(before_path, args.requests, args.concurrency)
+        after = await run(after_path, args.requests, args.concurrency)
+        print(f"{name:<10} {before['rps']:>13.0f} {after['rps']:>12.0f} "
+              f"{after['rps'] / before['rps']:>7.1f}x {before['bytes']:>9.0f} {after['bytes']:>8.0f}")
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
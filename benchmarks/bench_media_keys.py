@@ -0,0 +1,148 @@
+"""URL -> media key throughput and cache effectiveness on a synthetic URL corpus.
+
+The corpus spells each of --media distinct videos many ways: youtu.be vs
+watch?v= vs shorts/ vs m./music. hosts, tracking parameters (si=, feature=,
+is_from_webapp=, igsh=), parameter order, missing scheme, and vm.tiktok.com
+short links.
+
+"before" is what the app did per request: three unanchored platform regexes,
+the TikTok id regex and the raw URL as cache key. "after" is one
+media_keys.parse() call and its canonical key. Besides URLs/s the benchmark
+reports how many distinct cache keys each approach produces for the same
+traffic (fewer keys means more stream cache hits), and how many redirect
+lookups short links cost with the TTL cache.
+
+    python benchmarks/bench_media_keys.py --urls 200000 --media 5000
+"""
+import argparse
+import random
+import re
+import string
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import media_keys  # noqa: E402
+
+YOUTUBE_RE = re.compile(r"(youtu.be/|youtube.com)")
+TIKTOK_RE = re.compile(r"tiktok.com")
+INSTAGRAM_RE = re.compile(r"instagram.com")
+VIDEO_ID_RE = re.compile(r'/(?:video|photo)/(\d+)')
+
+
+def random_token(rng: random.Random, n: int, alphabet: str = string.ascii_letters + string.digits) -> str:
+    return ''.join(rng.choice(alphabet) for _ in range(n))
+
+
+def build_corpus(total: int, media: int, seed: int):
+    rng = random.Random(seed)
+    items = []
+    for i in range(media):
+        platform = rng.choice(('youtube', 'tiktok', 'instagram'))
+        if platform == 'youtube':
+            items.append(('youtube', random_token(rng, 11, string.ascii_letters + string.digits + '-_')))
+        elif platform == 'tiktok':
+            items.append(('tiktok', str(7_200_000_000_000_000_000 + i), random_token(rng, 9)))
+        else:
+            items.append(('instagram', random_token(rng, 11)))
+    short_links = {}
+    corpus = []
+    for _ in range(total):
+        item = rng.choice(items)
+        tracking = rng.choice(('', 'si=' + random_token(rng, 16), 'feature=share', 'utm_source=copy'))
+        scheme = rng.choice(('https://', 'https://', 'http://', ''))
+        if item[0] == 'youtube':
+            vid = item[1]
+            corpus.append(rng.choice((
+                f"{scheme}youtu.be/{vid}" + (f"?{tracking}" if tracking else ''),
+                f"{scheme}www.youtube.com/watch?v={vid}" + (f"&{tracking}" if tracking else ''),
+                f"{scheme}m.youtube.com/watch?{tracking + '&' if tracking else ''}v={vid}",
+                f"{scheme}www.youtube.com/shorts/{vid}",
+                f"{scheme}music.youtube.com/watch?v={vid}&list=RD{vid}",
+            )))
+        elif item[0] == 'tiktok':
+            vid, code = item[1], item[2]
+            if rng.random() < 0.25:
+                corpus.append(f"https://vm.tiktok.com/{code}/")
+                short_links[code] = vid
+            else:
+                user = rng.choice(('someone', 'some.one', 'user_1'))
+                corpus.append(f"{scheme}www.tiktok.com/@{user}/video/{vid}"
+                              + rng.choice(('', '?is_from_webapp=1&sender_device=pc', f"?{tracking}")))
+        else:
+            code = item[1]
+            corpus.append(f"{scheme}www.instagram.com/{rng.choice(('p', 'reel'))}/{code}/"
+                          + rng.choice(('', '?igsh=' + random_token(rng, 12), '?utm_source=ig_web_copy_link')))
+    return corpus, short_links
+
+
+def before(url: str) -> str:
+    # Platform detection and id extraction as the old code did them; only their cost matters here
+    if TIKTOK_RE.search(url):
+        VIDEO_ID_RE.search(url)
+    else:
+        YOUTUBE_RE.search(url) or INSTAGRAM_RE.search(url)
+    re.sub(r'[^a-zA-Z0-9_-]+', '_', url)[:40]
+    return url  # the raw URL was the cache key
+
+
+def after(url: str) -> str:
+    key = media_keys.parse(url)
+    media_keys.filename_base(key, url)
+    return key.key if key is not None and key.resolved else url
+
+
+class FakeRedirects:
+    """Stands in for the HTTP session: answers a short link with its final video URL."""
+
+    def __init__(self, targets: dict):
+        self.targets = targets
+        self.calls = 0
+
+    def get(self, url, **kwargs):
+        self.calls += 1
+        code = url.rstrip('/').rsplit('/', 1)[1]
+
+        class Response:
+            history = []
+
+            def close(self):
+                pass
+        r = Response()
+        r.url = f"https://www.tiktok.com/@someone/video/{self.targets[code]}"
+        return r
+
+
+def measure(fn, corpus) -> tuple:
+    started = time.perf_counter()
+    keys = set(fn(url) for url in corpus)
+    return len(corpus) / (time.perf_counter() - started), len(keys)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--urls', type=int, default=200_000)
+    parser.add_argument('--media', type=int, default=5_000)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    corpus, short_links = build_corpus(args.urls, args.media, args.seed)
+    print(f"{len(corpus)} URLs for {args.media} videos ({len(set(corpus))} distinct strings)")
+    print(f"{'':<8} {'URLs/s':>12} {'cache keys':>11} {'hit rate':>9}")
+    for name, fn in (('before', before), ('after', after)):
+        rate, keys = measure(fn, corpus)
+        print(f"{name:<8} {rate:>12,.0f} {keys:>11} {1 - keys / len(corpus):>8.1%}")
+
+    session = FakeRedirects(short_links)
+    shorts = [u for u in corpus if 'vm.tiktok.com' in u]
+    started = time.perf_counter()
+    resolved = set(media_keys.resolve(u, session).key for u in shorts)
+    elapsed = time.perf_counter() - started
+    print(f"\nshort links: {len(shorts)} resolved to {len(resolved)} videos with {session.calls} redirect "
+          f"lookups ({len(shorts) / elapsed:,.0f}/s with the TTL cache)")
+
+
+if __name__ == '__main__':
+    main()
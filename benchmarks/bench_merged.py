@@ -0,0 +1,123 @@
+"""Merged-format jobs (`bv*+ba`): video and audio fetched one after the other vs side by side.
+
+Starts the load test's upstream stand-in with a per-request latency and a
+per-connection rate, resolves a video+audio format pair and runs the app's
+fetch stage followed by the ffmpeg merge, once with MPD_PARALLEL_COMPONENTS off
+and once on. `--source youtube` uses the plain HTTP formats (137+140),
+`--source fragmented` the DASH ones (dash-1080+dash-audio), where the audio
+track is many round trips of its own.
+
+Each run reports fetch and merge wall time, whether the combined progress only
+moved forward and ended at 100%, how far it ever ran ahead of the bytes
+actually downloaded (`lead`), and the largest per-component percentages the
+job record showed.
+
+    python benchmarks/bench_merged.py --media-latency 0.3 --rate 1M
+    python benchmarks/bench_merged.py --source fragmented --runs 3
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(ROOT / 'benchmarks' / 'loadtest'))
+
+# Downloads go to a scratch directory, not the app's downloads/
+os.environ.setdefault('MPD_DOWNLOAD_DIR', tempfile.mkdtemp(prefix='mpd-bench-merged-'))
+
+import yt_dlp  # noqa: E402
+
+import postprocess  # noqa: E402
+import web_app  # noqa: E402
+from bandwidth import parse_rate  # noqa: E402
+from fragments import FRAGMENTS  # noqa: E402
+from upstreams import Upstreams, build_media  # noqa: E402
+
+FORMATS = {'youtube': '137+140', 'fragmented': 'dash-1080+dash-audio'}
+
+
+def resolve(upstreams: Upstreams, source: str, video_id: str) -> dict:
+    with yt_dlp.YoutubeDL({'quiet': True, 'no_warnings': True, 'format': FORMATS[source]}) as ydl:
+        raw = json.loads(ydl.urlopen(f"{upstreams.base}/ytdlp/{source}/{video_id}").read())
+        return ydl.process_ie_result(dict(raw, webpage_url=f"https://loadtest.invalid/{video_id}",
+                                          extractor='loadtest', extractor_key='LoadTest'), download=False)
+
+
+def run(upstreams: Upstreams, source: str, parallel: bool, index: int) -> dict:
+    web_app.PARALLEL_COMPONENTS = parallel
+    video_id = f"merged{int(parallel)}{index}"
+    resolved = resolve(upstreams, source, video_id)
+    progress = web_app.FetchProgress()
+    seen = []
+
+    def hook(d):
+        if d.get('status') in ('downloading', 'finished'):
+            seen.append(progress.update(d))
+
+    gate = FRAGMENTS.gate(f"bench:{video_id}")
+    started = time.perf_counter()
+    try:
+        fetched = web_app.fetch_stage(resolved['webpage_url'], FORMATS[source], video_id, [hook],
+                                      resolved=resolved, gate=gate, progress=progress)
+    finally:
+        gate.close()
+    fetch_s = time.perf_counter() - started
+    task = web_app.plan_postprocess('best', fetched)
+    result = postprocess.run_task(task)
+    if not result['ok']:
+        raise SystemExit(f"merge failed: {result['error']}")
+    merge_s = result['finished'] - result['started']
+    for p in [*task['inputs'], task['output']]:
+        Path(p).unlink(missing_ok=True)
+    percents = [s['percent'] for s in seen if s['percent'] is not None]
+    forward = all(b >= a for a, b in zip(percents, percents[1:]))
+    final_total = seen[-1]['total'] if seen else 0
+    lead = max((s['percent'] - s['downloaded'] / final_total * 100 for s in seen
+                if s['percent'] is not None and final_total), default=0.0)
+    peaks = {}
+    for s in seen:
+        for c in s['components'] or []:
+            peaks[c['format_id']] = max(peaks.get(c['format_id'], 0), c['percent'])
+    return {'fetch_s': fetch_s, 'merge_s': merge_s,
+            'progress': f"{'fwd' if forward else 'BACK'} {percents[-1]:.0f}%" if percents else '-', 'lead': lead,
+            'components': ' '.join(f"{k}:{v:.0f}%" for k, v in peaks.items())}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--source', default='youtube', choices=sorted(FORMATS))
+    parser.add_argument('--media-latency', type=float, default=0.3, help='seconds before each response')
+    parser.add_argument('--rate', default='1M', help='per-connection rate, e.g. 1M')
+    parser.add_argument('--fragment-size', default='128k')
+    parser.add_argument('--media-seconds', type=float, default=20)
+    parser.add_argument('--media-dir', default=str(Path(tempfile.gettempdir()) / 'mpd-loadtest-media'))
+    parser.add_argument('--runs', type=int, default=1)
+    args = parser.parse_args()
+    if not web_app.FFMPEG_AVAILABLE:
+        raise SystemExit('ffmpeg is required for the merge step')
+
+    media = build_media(Path(args.media_dir), args.media_seconds)
+    upstreams = Upstreams(media, rate=parse_rate(args.rate), media_latency=args.media_latency,
+                          fragment_size=parse_rate(args.fragment_size)).start()
+    print(f"{FORMATS[args.source]}: {args.media_latency * 1000:.0f} ms per request, {args.rate}/s per connection")
+    print(f"{'components':<11} {'fetch s':>8} {'merge s':>8} {'total s':>8}  {'progress':<9} {'lead':>5}  per component")
+    try:
+        for parallel in (False, True):
+            results = [run(upstreams, args.source, parallel, i) for i in range(args.runs)]
+            fetch_s = statistics.median(r['fetch_s'] for r in results)
+            merge_s = statistics.median(r['merge_s'] for r in results)
+            print(f"{'parallel' if parallel else 'sequential':<11} {fetch_s:>8.2f} {merge_s:>8.2f} "
+                  f"{fetch_s + merge_s:>8.2f}  {results[-1]['progress']:<9} {results[-1]['lead']:>4.1f}%  "
+                  f"{results[-1]['components']}")
+    finally:
+        upstreams.stop()
+
+
+if __name__ == '__main__':
+    main()
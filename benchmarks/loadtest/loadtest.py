@@ -0,0 +1,438 @@
+"""Load test for one `web_app:app` instance, with SLO gating.
+
+Starts the local upstream stand-ins (upstreams.py) and, unless --target is
+given, a uvicorn server wired to them (MPD_TIKWM_API, the load test yt-dlp
+extractors, a scratch MPD_DOWNLOAD_DIR). Virtual users then replay a weighted
+mix of sessions for --duration seconds:
+
+    browse     GET /api/preview, then the preview thumbnail
+    download   preview, POST /api/start_download, poll until the job ends
+               (GET /api/job/{id} or long-polled /api/jobs), GET /api/job/{id}/file
+
+URLs are drawn from a pool of --videos synthetic TikTok and YouTube videos,
+so previews and downloads repeat the way real traffic does. The report gives
+p50/p95/p99 latency and error rate per endpoint, jobs/min, job duration and
+file bytes/s, plus what the instance's own /capacity report said during the
+run (peak utilization, its bottleneck, the largest recommended replica delta
+and how often /readyz would have failed); the exit status is 1 when a threshold in the SLO file (see
+slo.json) is violated, or when --baseline is given and a metric regressed
+by more than --max-regression against that earlier report.
+
+    python benchmarks/loadtest/loadtest.py --users 20 --duration 60 --report loadtest.json
+"""
+import argparse
+import bisect
+import json
+import os
+import random
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import requests
+
+HERE = Path(__file__).resolve().parent
+ROOT = HERE.parent.parent
+sys.path.insert(0, str(ROOT))
+
+from bandwidth import parse_rate  # noqa: E402
+from upstreams import Upstreams, build_media  # noqa: E402
+
+TERMINAL = ('finished', 'error', 'canceled', 'interrupted')
+LATENCY_METRICS = ('preview', 'thumb', 'start_download', 'poll', 'watch', 'file')
+
+
+def parse_weights(spec: str) -> Dict[str, float]:
+    """'browse=3,download=1' -> {'browse': 3.0, 'download': 1.0}"""
+    weights = {}
+    for part in spec.split(','):
+        name, _, weight = part.partition('=')
+        if name.strip():
+            weights[name.strip()] = float(weight or 1)
+    return weights
+
+
+def percentile(sorted_values: List[float], q: float) -> Optional[float]:
+    if not sorted_values:
+        return None
+    return sorted_values[min(len(sorted_values) - 1, int(q / 100 * len(sorted_values)))]
+
+
+class Metrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latency: Dict[str, List[float]] = defaultdict(list)
+        self.errors: Dict[str, int] = defaultdict(int)
+        self.job_seconds: List[float] = []
+        self.jobs_started = 0
+        self.jobs_failed = 0
+        self.file_bytes = 0
+
+    def observe(self, name: str, seconds: float, ok: bool = True):
+        with self._lock:
+            bisect.insort(self.latency[name], seconds)
+            if not ok:
+                self.errors[name] += 1
+
+    def fail(self, name: str):
+        """Count an error for a request already observed as successful (e.g. an empty answer)."""
+        with self._lock:
+            self.errors[name] += 1
+
+    def add(self, field: str, value: int = 1):
+        with self._lock:
+            setattr(self, field, getattr(self, field) + value)
+
+    def job_done(self, seconds: float):
+        with self._lock:
+            self.job_seconds.append(seconds)
+
+    def report(self, elapsed: float) -> dict:
+        with self._lock:
+            endpoints = {}
+            requests_total = errors_total = 0
+            for name in sorted(self.latency, key=lambda n: (n not in LATENCY_METRICS, n)):
+                values = self.latency[name]
+                requests_total += len(values)
+                errors_total += self.errors[name]
+                endpoints[name] = {
+                    'requests': len(values), 'errors': self.errors[name],
+                    'error_rate': round(self.errors[name] / len(values), 4) if values else 0.0,
+                    **{f"p{q}_ms": round(percentile(values, q) * 1000, 1) for q in (50, 95, 99)},
+                }
+            jobs = sorted(self.job_seconds)
+            return {
+                'elapsed_s': round(elapsed, 1),
+                'requests': requests_total,
+                'error_rate': round(errors_total / requests_total, 4) if requests_total else 0.0,
+                'endpoints': endpoints,
+                'jobs': {
+                    'started': self.jobs_started, 'finished': len(jobs), 'failed': self.jobs_failed,
+                    'failure_rate': round(self.jobs_failed / self.jobs_started, 4) if self.jobs_started else 0.0,
+                    'per_min': round(len(jobs) / elapsed * 60, 1),
+                    **{f"p{q}_s": round(percentile(jobs, q), 2) if jobs else None for q in (50, 95, 99)},
+                },
+                'file_bytes': self.file_bytes,
+                'bytes_per_s': round(self.file_bytes / elapsed),
+            }
+
+
+class CapacityWatcher(threading.Thread):
+    """Samples the instance's /capacity report while the load runs."""
+
+    def __init__(self, base: str, interval: float, stop: threading.Event):
+        super().__init__(daemon=True)
+        self.base = base
+        self.interval = interval
+        self.stop = stop
+        self.samples: List[dict] = []
+
+    def run(self):
+        while not self.stop.wait(self.interval):
+            try:
+                r = requests.get(self.base + '/capacity', timeout=5)
+            except requests.RequestException:
+                continue
+            if r.status_code == 200:
+                self.samples.append(r.json())
+
+    def report(self) -> Optional[dict]:
+        if not self.samples:
+            return None  # an instance without /capacity
+        peak = max(self.samples, key=lambda c: c['utilization'])
+        bottlenecks = defaultdict(int)
+        for c in self.samples:
+            bottlenecks[c['bottleneck']] += 1
+        return {
+            'samples': len(self.samples),
+            'peak_utilization': peak['utilization'],
+            'peak_bottleneck': peak['bottleneck'],
+            'bottlenecks': dict(bottlenecks),
+            'max_replica_delta': max(c['recommended_replica_delta'] for c in self.samples),
+            'not_ready_share': round(sum(not c['ready'] for c in self.samples) / len(self.samples), 3),
+            'peak_queued': max(c['jobs']['queued'] for c in self.samples),
+        }
+
+
+class VirtualUser(threading.Thread):
+    def __init__(self, index: int, args, base: str, urls: List[str], metrics: Metrics,
+                 start_at: float, deadline: float):
+        super().__init__(name=f"user-{index}", daemon=True)
+        self.args = args
+        self.base = base
+        self.urls = urls
+        self.metrics = metrics
+        self.start_at = start_at
+        self.deadline = deadline
+        self.client = f"loadtest-{index}"
+        self.rng = random.Random(args.seed + index)
+        self.session = requests.Session()
+        self.scenarios = parse_weights(args.mix)
+        self.formats = parse_weights(args.formats)
+
+    def pick(self, weights: Dict[str, float]) -> str:
+        return self.rng.choices(list(weights), weights=list(weights.values()))[0]
+
+    def call(self, name: str, method: str, path: str, ok_status=(200,), **kwargs) -> Optional[requests.Response]:
+        started = time.perf_counter()
+        try:
+            r = self.session.request(method, self.base + path, timeout=self.args.request_timeout, **kwargs)
+            if kwargs.get('stream'):
+                received = sum(len(chunk) for chunk in r.iter_content(256 * 1024))
+                if r.status_code in ok_status:
+                    self.metrics.add('file_bytes', received)
+        except requests.RequestException:
+            self.metrics.observe(name, time.perf_counter() - started, ok=False)
+            return None
+        ok = r.status_code in ok_status
+        self.metrics.observe(name, time.perf_counter() - started, ok=ok)
+        return r if ok else None
+
+    def run(self):
+        time.sleep(max(0.0, self.start_at - time.time()))
+        while time.time() < self.deadline:
+            url = self.rng.choice(self.urls)
+            if self.pick(self.scenarios) == 'download':
+                self.download(url)
+            else:
+                self.browse(url)
+            if self.args.think:
+                time.sleep(min(self.rng.expovariate(1 / self.args.think), max(0.0, self.deadline - time.time())))
+
+    def browse(self, url: str) -> bool:
+        r = self.call('preview', 'GET', '/api/preview', params={'url': url})
+        preview = r.json().get('preview') if r is not None else None
+        if not preview:
+            if r is not None:  # 200 but no preview: the extraction failed
+                self.metrics.fail('preview')
+            return False
+        if (preview.get('thumbnail') or '').startswith('/'):
+            self.call('thumb', 'GET', preview['thumbnail'], ok_status=(200, 304))
+        return True
+
+    def download(self, url: str):
+        if not self.browse(url):
+            return
+        r = self.call('start_download', 'POST', '/api/start_download',
+                      data={'url': url, 'format': self.pick(self.formats), 'client': self.client})
+        job_id = r.json().get('job_id') if r is not None else None
+        if not job_id:
+            return
+        self.metrics.add('jobs_started')
+        started = time.perf_counter()
+        job = self.wait_for_job(job_id)
+        if not job or job.get('status') != 'finished':
+            self.metrics.add('jobs_failed')
+            return
+        self.metrics.job_done(time.perf_counter() - started)
+        self.call('file', 'GET', f"/api/job/{job_id}/file", stream=True)
+
+    def wait_for_job(self, job_id: str) -> Optional[dict]:
+        give_up = time.time() + self.args.job_timeout
+        cursor = 0
+        while time.time() < give_up:
+            if self.args.poll == 'jobs':
+                # Long-poll latency is mostly the wait itself, so it is kept apart from 'poll'
+                r = self.call('watch', 'GET', '/api/jobs', ok_status=(200, 304),
+                              params={'ids': job_id, 'since': cursor, 'wait': 10})
+                if r is not None and r.status_code == 200:
+                    data = r.json()
+                    cursor = data.get('cursor', cursor)
+                    job = next((j for j in data.get('jobs') or [] if j.get('id') == job_id), None)
+                    if job and job.get('status') in TERMINAL:
+                        return job
+                elif r is None:
+                    time.sleep(self.args.poll_interval)
+            else:
+                r = self.call('poll', 'GET', f"/api/job/{job_id}")
+                job = r.json().get('job') if r is not None else None
+                if job and job.get('status') in TERMINAL:
+                    return job
+                time.sleep(self.args.poll_interval)
+        return None
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def start_server(args, upstreams: Upstreams, download_dir: str) -> subprocess.Popen:
+    port = free_port()
+    env = dict(os.environ,
+               MPD_TIKWM_API=f"{upstreams.base}/tikwm/api/",
+               MPD_LOADTEST_UPSTREAM=upstreams.base,
+               MPD_DOWNLOAD_DIR=download_dir,
+               MPD_SHUTDOWN_GRACE='2',
+               PYTHONPATH=os.pathsep.join(filter(None, [str(HERE), str(ROOT), os.environ.get('PYTHONPATH')])))
+    server = subprocess.Popen([sys.executable, '-m', 'uvicorn', 'web_app:app', '--host', '127.0.0.1',
+                               '--port', str(port), '--log-level', 'warning'], cwd=str(ROOT), env=env)
+    server.base = f"http://127.0.0.1:{port}"
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        if server.poll() is not None:
+            raise SystemExit(f"server exited with {server.returncode}")
+        try:
+            if requests.get(server.base + '/readyz', timeout=1).status_code == 200:
+                return server
+        except requests.RequestException:
+            pass
+        time.sleep(0.2)
+    server.kill()
+    raise SystemExit('server did not come up within 30s')
+
+
+def check_slo(report: dict, slo: dict, baseline: Optional[dict], max_regression: float) -> List[str]:
+    """Human-readable violations; empty when every threshold holds."""
+    violations = []
+    if report['error_rate'] > slo.get('max_error_rate', 1.0):
+        violations.append(f"error rate {report['error_rate']:.2%} > {slo['max_error_rate']:.2%}")
+    jobs = report['jobs']
+    if jobs['failure_rate'] > slo.get('max_job_failure_rate', 1.0):
+        violations.append(f"job failure rate {jobs['failure_rate']:.2%} > {slo['max_job_failure_rate']:.2%}")
+    if jobs['per_min'] < slo.get('min_jobs_per_min', 0):
+        violations.append(f"jobs/min {jobs['per_min']} < {slo['min_jobs_per_min']}")
+    if report['bytes_per_s'] < slo.get('min_bytes_per_s', 0):
+        violations.append(f"bytes/s {report['bytes_per_s']} < {slo['min_bytes_per_s']}")
+    for name, limits in (slo.get('latency_ms') or {}).items():
+        stats = report['endpoints'].get(name)
+        for q, limit in limits.items():
+            if stats and stats[f"{q}_ms"] > limit:
+                violations.append(f"{name} {q} {stats[f'{q}_ms']}ms > {limit}ms")
+    for q, limit in (slo.get('job_s') or {}).items():
+        if jobs.get(f"{q}_s") is not None and jobs[f"{q}_s"] > limit:
+            violations.append(f"job {q} {jobs[f'{q}_s']}s > {limit}s")
+    if baseline:
+        worse = 1 + max_regression
+        for name, stats in report['endpoints'].items():
+            old = (baseline.get('endpoints') or {}).get(name)
+            # Sub-10ms percentiles are noise on a shared CI agent
+            if old and stats['p95_ms'] > max(old['p95_ms'], 10) * worse:
+                violations.append(f"{name} p95 {stats['p95_ms']}ms regressed from {old['p95_ms']}ms")
+        old_jobs = (baseline.get('jobs') or {}).get('per_min') or 0
+        if jobs['per_min'] * worse < old_jobs:
+            violations.append(f"jobs/min {jobs['per_min']} regressed from {old_jobs}")
+    return violations
+
+
+def print_report(report: dict, upstreams: Upstreams):
+    print(f"{'endpoint':<16} {'requests':>8} {'errors':>7} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+    for name, s in report['endpoints'].items():
+        print(f"{name:<16} {s['requests']:>8} {s['errors']:>7} {s['p50_ms']:>8} {s['p95_ms']:>8} {s['p99_ms']:>8}")
+    jobs = report['jobs']
+    print(f"\nrequests {report['requests']} in {report['elapsed_s']}s, error rate {report['error_rate']:.2%}")
+    print(f"jobs: {jobs['started']} started, {jobs['finished']} finished, {jobs['failed']} failed; "
+          f"{jobs['per_min']} jobs/min; duration p50 {jobs['p50_s']}s p95 {jobs['p95_s']}s p99 {jobs['p99_s']}s")
+    print(f"files: {report['file_bytes'] / 1e6:.1f} MB served, {report['bytes_per_s'] / 1e6:.2f} MB/s; "
+          f"upstreams: {upstreams.requests} requests, {upstreams.bytes_sent / 1e6:.1f} MB")
+    cap = report.get('capacity')
+    if cap:
+        print(f"capacity: peak utilization {cap['peak_utilization']} ({cap['peak_bottleneck']}), "
+              f"max replica delta {cap['max_replica_delta']:+d}, not ready {cap['not_ready_share']:.0%} "
+              f"of {cap['samples']} samples, peak queue {cap['peak_queued']}")
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--target', help='URL of an already running instance (started with the same '
+                        'MPD_TIKWM_API / MPD_LOADTEST_UPSTREAM / PYTHONPATH wiring); default: start one')
+    parser.add_argument('--users', type=int, default=10, help='concurrent virtual users')
+    parser.add_argument('--duration', type=float, default=60, help='seconds of load after ramp-up starts')
+    parser.add_argument('--ramp', type=float, default=5, help='seconds over which users are started')
+    parser.add_argument('--think', type=float, default=1.0, help='mean think time between sessions (s)')
+    parser.add_argument('--mix', default='browse=3,download=2', help='session weights')
+    parser.add_argument('--formats', default='best=2,720p=1,audio=1,audio_fast=1', help='download format weights')
+    parser.add_argument('--platforms', default='tiktok=1,youtube=1', help='URL platform weights')
+    parser.add_argument('--videos', type=int, default=50, help='distinct videos in the URL pool')
+    parser.add_argument('--poll', choices=('job', 'jobs'), default='job',
+                        help='poll GET /api/job/{id} or long-poll /api/jobs')
+    parser.add_argument('--poll-interval', type=float, default=0.8)
+    parser.add_argument('--job-timeout', type=float, default=120)
+    parser.add_argument('--request-timeout', type=float, default=60)
+    parser.add_argument('--media-seconds', type=float, default=20, help='length of the generated media')
+    parser.add_argument('--media-dir', default=str(Path(tempfile.gettempdir()) / 'mpd-loadtest-media'))
+    parser.add_argument('--upstream-port', type=int, default=0, help='fixed port for the stand-ins (for --target)')
+    parser.add_argument('--upstream-latency', type=float, default=0.05, help='seconds added to metadata calls')
+    parser.add_argument('--upstream-rate', default='0', help='per-response media rate, e.g. 20M (bytes/s)')
+    parser.add_argument('--slo', default=str(HERE / 'slo.json'), help='SLO thresholds (JSON)')
+    parser.add_argument('--baseline', help='earlier --report to compare against')
+    parser.add_argument('--max-regression', type=float, default=0.25, help='allowed relative regression')
+    parser.add_argument('--report', help='write the report (JSON) here')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--capacity-interval', type=float, default=2.0, help='seconds between /capacity samples')
+    args = parser.parse_args(argv)
+
+    media = build_media(Path(args.media_dir), args.media_seconds)
+    upstreams = Upstreams(media, port=args.upstream_port, latency=args.upstream_latency,
+                          rate=parse_rate(args.upstream_rate), seconds=args.media_seconds).start()
+    platforms = parse_weights(args.platforms)
+    rng = random.Random(args.seed)
+    urls = []
+    for i in range(args.videos):
+        platform = rng.choices(list(platforms), weights=list(platforms.values()))[0]
+        if platform == 'youtube':
+            urls.append(f"https://www.youtube.com/watch?v=lt{i:09d}")
+        else:
+            urls.append(f"https://www.tiktok.com/@loadtest/video/{7_000_000_000_000_000_000 + i}")
+
+    server = None
+    scratch = tempfile.TemporaryDirectory(prefix='mpd-loadtest-')
+    try:
+        if args.target:
+            base = args.target.rstrip('/')
+        else:
+            server = start_server(args, upstreams, scratch.name)
+            base = server.base
+        print(f"load test: {args.users} users for {args.duration:.0f}s against {base} "
+              f"(upstreams {upstreams.base}, mix {args.mix}, poll {args.poll})")
+        metrics = Metrics()
+        watching = threading.Event()
+        watcher = CapacityWatcher(base, args.capacity_interval, watching)
+        watcher.start()
+        started = time.time()
+        deadline = started + args.duration
+        users = [VirtualUser(i, args, base, urls, metrics, started + args.ramp * i / max(1, args.users), deadline)
+                 for i in range(args.users)]
+        for user in users:
+            user.start()
+        for user in users:
+            # Sessions in flight at the deadline may finish, bounded by the job timeout
+            user.join(timeout=max(0.0, deadline - time.time()) + args.job_timeout)
+        report = metrics.report(time.time() - started)
+        watching.set()
+        report['capacity'] = watcher.report()
+    finally:
+        if server is not None:
+            server.send_signal(signal.SIGINT)
+            try:
+                server.wait(timeout=15)
+            except subprocess.TimeoutExpired:
+                server.kill()
+        upstreams.stop()
+        scratch.cleanup()
+
+    print_report(report, upstreams)
+    slo = json.loads(Path(args.slo).read_text()) if args.slo else {}
+    baseline = json.loads(Path(args.baseline).read_text()) if args.baseline else None
+    violations = check_slo(report, slo, baseline, args.max_regression)
+    report['slo'] = {'file': args.slo, 'baseline': args.baseline, 'violations': violations}
+    report['config'] = {k: v for k, v in vars(args).items() if k not in ('report',)}
+    if args.report:
+        Path(args.report).write_text(json.dumps(report, indent=2))
+    if violations:
+        print('\nSLO violations:\n  ' + '\n  '.join(violations))
+        return 1
+    print('\nSLO: all thresholds met')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,317 @@
+"""Local stand-ins for TikWM, the TikTok CDN and the sites yt-dlp extracts from.
+
+One threaded HTTP server answers:
+
+    /tikwm/api/?url=...            TikWM lookup (point MPD_TIKWM_API here)
+    /ytdlp/<platform>/<id>         info dict for the load test yt-dlp extractors
+                                   (youtube, tiktok, playlist: LT<n>... has n entries,
+                                   fragmented: HLS and DASH formats only)
+    /media/<file>                  media files, with Range support (CDN)
+    /hls/<file>.m3u8               HLS media playlist over the fragments of a media file
+    /frag/<file>/<n>               n-th `fragment_size` slice of a media file (HLS / DASH segment)
+    /cover/<id>.jpg                thumbnails
+
+Media files are generated once into a work directory: real (tiny) H.264/AAC
+files when ffmpeg is available, so merges and conversions in the app do real
+work, otherwise random bytes of the same sizes. `latency` delays every
+metadata answer, `media_latency` every media or fragment response and `rate`
+paces each response, to model upstreams slower than loopback. With
+`max_connections` set, media requests beyond that many at once are refused with
+503, like a CDN's per-client connection limit.
+"""
+import json
+import os
+import re
+import shutil
+import subprocess
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Dict, Optional
+from urllib.parse import parse_qs, urlparse
+
+MEDIA_CHUNK = 64 * 1024
+FRAGMENT_SIZE = 256 * 1024
+# file name -> (ffmpeg arguments, fallback size in bytes); the `height` of the
+# video tracks is what the format selectors see, not the encoded resolution
+MEDIA = {
+    'video_1080.mp4': (['-f', 'lavfi', '-i', 'testsrc2=size=640x360:rate=25', '-an',
+                        '-c:v', 'libx264', '-preset', 'ultrafast', '-b:v', '2M'], 5_000_000),
+    'video_720.mp4': (['-f', 'lavfi', '-i', 'testsrc2=size=480x270:rate=25', '-an',
+                       '-c:v', 'libx264', '-preset', 'ultrafast', '-b:v', '1M'], 2_500_000),
+    'audio.m4a': (['-f', 'lavfi', '-i', 'sine=frequency=440:sample_rate=44100', '-vn',
+                   '-c:a', 'aac', '-b:a', '128k'], 320_000),
+    'progressive.mp4': (['-f', 'lavfi', '-i', 'testsrc2=size=480x270:rate=25',
+                         '-f', 'lavfi', '-i', 'sine=frequency=440:sample_rate=44100',
+                         '-c:v', 'libx264', '-preset', 'ultrafast', '-b:v', '1M',
+                         '-c:a', 'aac', '-b:a', '128k', '-shortest'], 2_800_000),
+    'cover.jpg': (['-f', 'lavfi', '-i', 'testsrc2=size=720x1280', '-frames:v', '1'], 60_000),
+}
+_RANGE_RE = re.compile(r'bytes=(\d*)-(\d*)$')
+
+
+def build_media(work_dir: Path, seconds: float = 20, ffmpeg: Optional[str] = None) -> Dict[str, Path]:
+    """Create the media files in `work_dir` (kept across runs); returns name -> path."""
+    work_dir.mkdir(parents=True, exist_ok=True)
+    ffmpeg = ffmpeg or shutil.which('ffmpeg')
+    files = {}
+    for name, (args, fallback_size) in MEDIA.items():
+        path = work_dir / name
+        if not path.exists():
+            tmp = path.with_name(f"tmp.{name}")
+            if ffmpeg:
+                duration = [] if name.endswith('.jpg') else ['-t', str(seconds)]
+                subprocess.run([ffmpeg, '-y', '-loglevel', 'error', *args, *duration, str(tmp)], check=True)
+            else:
+                tmp.write_bytes(os.urandom(int(fallback_size * seconds / 20)))
+            os.replace(tmp, path)
+        files[name] = path
+    return files
+
+
+def youtube_info(base: str, video_id: str, sizes: Dict[str, int], seconds: float) -> dict:
+    def fmt(format_id, name, **extra):
+        return {'format_id': format_id, 'url': f"{base}/media/{name}?v={video_id}",
+                'filesize': sizes[name], 'ext': name.rsplit('.', 1)[1], 'protocol': 'https', **extra}
+    return {
+        'id': video_id, 'title': f"Load test video {video_id}", 'duration': seconds,
+        'thumbnail': f"{base}/cover/{video_id}.jpg",
+        'formats': [
+            fmt('140', 'audio.m4a', vcodec='none', acodec='mp4a.40.2', abr=128),
+            fmt('18', 'progressive.mp4', vcodec='avc1.42001E', acodec='mp4a.40.2', width=640, height=360),
+            fmt('136', 'video_720.mp4', vcodec='avc1.4d401f', acodec='none', width=1280, height=720),
+            fmt('137', 'video_1080.mp4', vcodec='avc1.640028', acodec='none', width=1920, height=1080),
+        ],
+    }
+
+
+def tiktok_info(base: str, video_id: str, sizes: Dict[str, int], seconds: float) -> dict:
+    return {
+        'id': video_id, 'title': f"Load test TikTok {video_id}", 'duration': seconds,
+        'thumbnail': f"{base}/cover/{video_id}.jpg",
+        'formats': [{'format_id': 'play', 'url': f"{base}/media/progressive.mp4?v={video_id}",
+                     'filesize': sizes['progressive.mp4'], 'ext': 'mp4', 'vcodec': 'h264',
+                     'acodec': 'aac', 'width': 405, 'height': 720}],
+    }
+
+
+def playlist_info(base: str, playlist_id: str, sizes: Dict[str, int], seconds: float) -> dict:
+    m = re.match(r'LT(\d+)', playlist_id)
+    count = int(m.group(1)) if m else 5
+    return {
+        '_type': 'playlist', 'id': playlist_id, 'title': f"Load test playlist {playlist_id}",
+        'entries': [{'_type': 'url', 'id': f"lt{count % 1000:03d}{i:06d}",
+                     'url': f"https://www.youtube.com/watch?v=lt{count % 1000:03d}{i:06d}",
+                     'title': f"Load test video {i}"} for i in range(count)],
+    }
+
+
+def fragmented_info(base: str, video_id: str, sizes: Dict[str, int], seconds: float,
+                    fragment_size: int = FRAGMENT_SIZE) -> dict:
+    def count(name):
+        return -(-sizes[name] // fragment_size)
+
+    def dash(format_id, name, **extra):
+        return {'format_id': format_id, 'url': f"{base}/frag/{name}/0", 'protocol': 'http_dash_segments',
+                'fragment_base_url': f"{base}/frag/{name}/", 'filesize': sizes[name],
+                'fragments': [{'path': str(i)} for i in range(count(name))],
+                'ext': name.rsplit('.', 1)[1], **extra}
+
+    return {
+        'id': video_id, 'title': f"Load test fragmented video {video_id}", 'duration': seconds,
+        'formats': [
+            dash('dash-audio', 'audio.m4a', vcodec='none', acodec='mp4a.40.2', abr=128),
+            {'format_id': 'hls-720', 'url': f"{base}/hls/video_720.mp4.m3u8", 'protocol': 'm3u8_native',
+             'ext': 'mp4', 'vcodec': 'avc1.4d401f', 'acodec': 'none', 'width': 1280, 'height': 720},
+            dash('dash-1080', 'video_1080.mp4', vcodec='avc1.640028', acodec='none', width=1920, height=1080),
+        ],
+    }
+
+
+def tikwm_data(base: str, video_id: str, sizes: Dict[str, int], seconds: float) -> dict:
+    return {'id': video_id, 'title': f"Load test TikTok {video_id}", 'duration': int(seconds),
+            'cover': f"{base}/cover/{video_id}.jpg", 'size': sizes['progressive.mp4'],
+            'play': f"{base}/media/progressive.mp4?v={video_id}"}
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # Clients dropping a connection (a refused fragment, a canceled job) is expected here
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+
+class Upstreams:
+    def __init__(self, media: Dict[str, Path], host: str = '127.0.0.1', port: int = 0,
+                 latency: float = 0.0, rate: int = 0, seconds: float = 20, media_latency: float = 0.0,
+                 max_connections: int = 0, fragment_size: int = FRAGMENT_SIZE):
+        self.media = media
+        self.sizes = {name: path.stat().st_size for name, path in media.items()}
+        self.latency = latency
+        self.rate = rate
+        self.seconds = seconds
+        self.media_latency = media_latency
+        self.max_connections = max_connections
+        self.fragment_size = fragment_size
+        self.requests = 0
+        self.bytes_sent = 0
+        self.refused = 0
+        self.active = 0
+        self._lock = threading.Lock()
+        self.server = _Server((host, port), self._handler())
+        self.base = f"http://{host}:{self.server.server_address[1]}"
+        self._thread = threading.Thread(target=self.server.serve_forever, name='upstreams', daemon=True)
+
+    def start(self) -> 'Upstreams':
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def _count(self, sent: int):
+        with self._lock:
+            self.requests += 1
+            self.bytes_sent += sent
+
+    def _open_media(self) -> bool:
+        with self._lock:
+            if self.max_connections and self.active >= self.max_connections:
+                self.refused += 1
+                return False
+            self.active += 1
+            return True
+
+    def _close_media(self):
+        with self._lock:
+            self.active -= 1
+
+    def _handler(self):
+        upstreams = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, *args):
+                pass
+
+            def send_json(self, status: int, payload: dict):
+                body = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+                upstreams._count(len(body))
+
+            def do_GET(self):
+                parsed = urlparse(self.path)
+                parts = parsed.path.strip('/').split('/')
+                if parts[0] in ('tikwm', 'ytdlp') and upstreams.latency:
+                    time.sleep(upstreams.latency)
+                if parts[:2] == ['tikwm', 'api']:
+                    url = (parse_qs(parsed.query).get('url') or [''])[0]
+                    m = re.search(r'/video/(\d+)', url)
+                    if not m:
+                        return self.send_json(200, {'code': -1, 'msg': 'Url parsing is failed!'})
+                    data = tikwm_data(upstreams.base, m.group(1), upstreams.sizes, upstreams.seconds)
+                    return self.send_json(200, {'code': 0, 'msg': 'success', 'data': data})
+                if parts[0] == 'ytdlp' and len(parts) == 3:
+                    if parts[1] == 'fragmented':
+                        return self.send_json(200, fragmented_info(upstreams.base, parts[2], upstreams.sizes,
+                                                                   upstreams.seconds, upstreams.fragment_size))
+                    build = {'youtube': youtube_info, 'tiktok': tiktok_info, 'playlist': playlist_info}.get(parts[1])
+                    if build:
+                        return self.send_json(200, build(upstreams.base, parts[2], upstreams.sizes,
+                                                         upstreams.seconds))
+                if parts[0] == 'media' and len(parts) == 2 and parts[1] in upstreams.media:
+                    return self.send_file(upstreams.media[parts[1]])
+                if parts[0] == 'hls' and len(parts) == 2 and parts[1].endswith('.m3u8') \
+                        and parts[1][:-5] in upstreams.media:
+                    return self.send_playlist(parts[1][:-5])
+                if parts[0] == 'frag' and len(parts) == 3 and parts[1] in upstreams.media and parts[2].isdigit():
+                    start = int(parts[2]) * upstreams.fragment_size
+                    if start < upstreams.sizes[parts[1]]:
+                        return self.send_file(upstreams.media[parts[1]], start, upstreams.fragment_size)
+                if parts[0] == 'cover' and len(parts) == 2:
+                    return self.send_file(upstreams.media['cover.jpg'])
+                self.send_json(404, {'error': 'not found'})
+
+            def send_playlist(self, name: str):
+                count = -(-upstreams.sizes[name] // upstreams.fragment_size)
+                lines = ['#EXTM3U', '#EXT-X-VERSION:3', '#EXT-X-MEDIA-SEQUENCE:0',
+                         f'#EXT-X-TARGETDURATION:{max(1, round(upstreams.seconds / count))}']
+                for i in range(count):
+                    lines += [f'#EXTINF:{upstreams.seconds / count:.3f},', f'/frag/{name}/{i}']
+                body = '\n'.join(lines + ['#EXT-X-ENDLIST', '']).encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/vnd.apple.mpegurl')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+                upstreams._count(len(body))
+
+            def send_file(self, path: Path, offset: int = 0, limit: Optional[int] = None):
+                if upstreams.media_latency:
+                    time.sleep(upstreams.media_latency)
+                if not upstreams._open_media():
+                    return self.send_json(503, {'error': 'too many connections'})
+                try:
+                    self._send_file(path, offset, limit)
+                finally:
+                    upstreams._close_media()
+
+            def _send_file(self, path: Path, offset: int, limit: Optional[int]):
+                # A fragment is the slice [offset, offset + limit) served as a file of its own
+                size = path.stat().st_size - offset
+                if limit is not None:
+                    size = min(size, limit)
+                start, end = 0, size - 1
+                m = _RANGE_RE.match(self.headers.get('Range') or '')
+                if m and (m.group(1) or m.group(2)):
+                    if m.group(1):
+                        start = int(m.group(1))
+                        end = min(int(m.group(2)), size - 1) if m.group(2) else size - 1
+                    else:  # suffix range: the last N bytes
+                        start = max(0, size - int(m.group(2)))
+                    if start >= size or start > end:
+                        self.send_response(416)
+                        self.send_header('Content-Range', f'bytes */{size}')
+                        self.send_header('Content-Length', '0')
+                        self.end_headers()
+                        return
+                    self.send_response(206)
+                    self.send_header('Content-Range', f'bytes {start}-{end}/{size}')
+                else:
+                    self.send_response(200)
+                length = end - start + 1
+                self.send_header('Content-Type', 'image/jpeg' if path.suffix == '.jpg' else 'video/mp4')
+                self.send_header('Content-Length', str(length))
+                self.send_header('Accept-Ranges', 'bytes')
+                self.end_headers()
+                sent = 0
+                started = time.monotonic()
+                try:
+                    with open(path, 'rb') as f:
+                        f.seek(offset + start)
+                        while sent < length:
+                            chunk = f.read(min(MEDIA_CHUNK, length - sent))
+                            if not chunk:
+                                break
+                            self.wfile.write(chunk)
+                            sent += len(chunk)
+                            if upstreams.rate:
+                                ahead = sent / upstreams.rate - (time.monotonic() - started)
+                                if ahead > 0:
+                                    time.sleep(ahead)
+                except (BrokenPipeError, ConnectionResetError):
+                    self.close_connection = True
+                finally:
+                    upstreams._count(sent)
+
+        return Handler
@@ -0,0 +1,46 @@
+"""yt-dlp extractors for the load test's stand-in upstreams.
+
+Loaded by yt-dlp's plugin system only when benchmarks/loadtest is on the
+server's PYTHONPATH (the load test sets that up). They claim the synthetic
+YouTube ids (`lt` + 9 characters; `ltf...` ones only have HLS / DASH
+formats), playlists whose id starts with `LT` and TikTok videos of the
+`@loadtest` user before the real extractors see them, and fetch the info dict
+from MPD_LOADTEST_UPSTREAM, whose format URLs point at local media files.
+"""
+import os
+
+from yt_dlp.extractor.common import InfoExtractor
+
+
+class _LoadTestBaseIE(InfoExtractor):
+    _PLATFORM = None
+
+    def _real_extract(self, url):
+        video_id = self._match_id(url)
+        upstream = os.environ.get('MPD_LOADTEST_UPSTREAM', 'http://127.0.0.1:8790').rstrip('/')
+        return self._download_json(f"{upstream}/ytdlp/{self._PLATFORM}/{video_id}", video_id,
+                                   note='Downloading load test metadata')
+
+
+class LoadTestYoutubeIE(_LoadTestBaseIE):
+    IE_NAME = 'loadtest:youtube'
+    _PLATFORM = 'youtube'
+    _VALID_URL = r'https?://(?:www\.)?youtube\.com/watch\?v=(?P<id>lt(?!f)[0-9A-Za-z_-]{9})'
+
+
+class LoadTestFragmentedIE(_LoadTestBaseIE):
+    IE_NAME = 'loadtest:fragmented'
+    _PLATFORM = 'fragmented'
+    _VALID_URL = r'https?://(?:www\.)?youtube\.com/watch\?v=(?P<id>ltf[0-9A-Za-z_-]{8})'
+
+
+class LoadTestYoutubePlaylistIE(_LoadTestBaseIE):
+    IE_NAME = 'loadtest:youtube:playlist'
+    _PLATFORM = 'playlist'
+    _VALID_URL = r'https?://(?:www\.)?youtube\.com/playlist\?list=(?P<id>LT[0-9A-Za-z_-]+)'
+
+
+class LoadTestTikTokIE(_LoadTestBaseIE):
+    IE_NAME = 'loadtest:tiktok'
+    _PLATFORM = 'tiktok'
+    _VALID_URL = r'https?://(?:www\.)?tiktok\.com/@loadtest/video/(?P<id>\d+)'
@@ -0,0 +1,83 @@
+"""Readiness and capacity signals for an orchestrator.
+
+Answering HTTP says little about whether an instance should get more work:
+its fetch workers, ffmpeg processes, disk or ingress budget may already be
+full. The app reports what each of those is doing against its limit, and this
+module turns that into the two numbers an orchestrator acts on:
+
+- utilization: demand over capacity of the busiest resource (running plus
+  queued work over workers, recent ingress over the budget). 1.0 means that
+  resource is exactly full and anything above it is backlog.
+- a recommended replica delta: how many instances this one's load calls for
+  at MPD_TARGET_UTILIZATION, minus itself. It is -1 only when the instance has
+  nothing to do, so an autoscaler never removes one that still runs jobs.
+
+Rates (bytes in / out, jobs ended) come from ThroughputMeter, which keeps
+samples of the app's monotonic counters over the last MPD_CAPACITY_WINDOW
+seconds.
+"""
+import math
+import os
+import threading
+import time
+from collections import deque
+from typing import Deque, Dict, Optional, Tuple
+
+from bandwidth import parse_rate
+
+# Readiness: below this much free disk (after in-flight downloads land) new jobs go elsewhere
+MIN_FREE_DISK = parse_rate(os.environ.get('MPD_MIN_FREE_DISK', '1G'))
+# Readiness: jobs waiting for a fetch worker; 0 = twice the number of fetch workers
+MAX_QUEUED_JOBS = int(os.environ.get('MPD_MAX_QUEUED_JOBS', '0'))
+TARGET_UTILIZATION = float(os.environ.get('MPD_TARGET_UTILIZATION', '0.7'))
+THROUGHPUT_WINDOW_S = float(os.environ.get('MPD_CAPACITY_WINDOW', '60'))
+SAMPLE_INTERVAL_S = 5.0
+
+
+class ThroughputMeter:
+    """Per-second rates of monotonic counters over a sliding window of samples."""
+
+    def __init__(self, window: float = THROUGHPUT_WINDOW_S):
+        self.window = window
+        self._lock = threading.Lock()
+        self._samples: Deque[Tuple[float, Dict[str, int]]] = deque()
+
+    def sample(self, **counters: int) -> dict:
+        """Record the counters' current values; returns their rates since the oldest sample kept."""
+        now = time.monotonic()
+        with self._lock:
+            self._samples.append((now, counters))
+            # Keep one sample at least `window` old so the rate always spans the full window
+            while len(self._samples) > 2 and now - self._samples[1][0] >= self.window:
+                self._samples.popleft()
+            start, first = self._samples[0]
+        elapsed = now - start
+        rates = {name: (value - first.get(name, 0)) / elapsed if elapsed >= 1.0 else None
+                 for name, value in counters.items()}
+        return {'window_s': round(elapsed, 1), 'rates': rates}
+
+
+def utilization(loads: Dict[str, Optional[float]]) -> Tuple[float, Optional[str]]:
+    """The highest load and the resource it belongs to; resources without a limit report None."""
+    known = {name: load for name, load in loads.items() if load is not None}
+    if not known:
+        return 0.0, None
+    bottleneck = max(known, key=known.get)
+    return known[bottleneck], bottleneck
+
+
+def replica_delta(load: float, draining: bool, low_disk: bool, target: float = TARGET_UTILIZATION) -> int:
+    """Instances to add (or -1: this one may go) for `load` to sit at `target`.
+
+    A draining instance is on its way out by decision of whoever drained it,
+    so it does not ask for anything. One short of disk cannot take new jobs
+    whatever its load, so it asks for at least one more instance.
+    """
+    if draining:
+        return 0
+    # The epsilon keeps float noise (2.1 / 0.7 = 3.0000000000000004) from asking for a spare instance
+    delta = max(math.ceil(load / target - 1e-9), 0) - 1 if target > 0 else 0
+    return max(delta, 1) if low_disk else delta
+
+
+THROUGHPUT = ThroughputMeter()
@@ -0,0 +1,122 @@
+"""Bulkhead executors: one bounded thread pool per workload class.
+
+Previews, blocking downloads and file I/O each get their own pool, so a burst
+of multi-minute downloads can no longer fill the loop's shared default
+executor and make every preview wait behind them. Each bulkhead tracks its
+queue depth and saturation and refuses work that waited in its queue longer
+than `queue_timeout` seconds.
+"""
+import asyncio
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Dict, Optional
+
+
+class BulkheadTimeout(Exception):
+    """Work waited in a bulkhead queue longer than its queue timeout."""
+
+
+class Bulkhead:
+    def __init__(self, name: str, max_workers: int, queue_timeout: Optional[float] = None):
+        self.name = name
+        self.max_workers = max_workers
+        self.queue_timeout = queue_timeout or None
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=name)
+        self._lock = threading.Lock()
+        self.queued = 0
+        self.running = 0
+        self.completed = 0
+        self.timed_out = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+
+    def submit(self, fn: Callable, *args, **kwargs) -> Future:
+        return self._submit(fn, args, kwargs, self.queue_timeout)
+
+    def submit_admitted(self, fn: Callable, *args, **kwargs) -> Future:
+        """Submit follow-up work of an already admitted request (e.g. the next chunk
+        of a file being streamed); it queues normally but is never timed out."""
+        return self._submit(fn, args, kwargs, None)
+
+    def _submit(self, fn: Callable, args: tuple, kwargs: dict, queue_timeout: Optional[float]) -> Future:
+        enqueued = time.monotonic()
+        with self._lock:
+            self.queued += 1
+
+        def run():
+            waited = time.monotonic() - enqueued
+            with self._lock:
+                self.queued -= 1
+                self._wait_total += waited
+                self._wait_max = max(self._wait_max, waited)
+                if queue_timeout and waited > queue_timeout:
+                    self.timed_out += 1
+                    raise BulkheadTimeout(f"{self.name}: waited {waited:.1f}s in queue")
+                self.running += 1
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                with self._lock:
+                    self.running -= 1
+                    self.completed += 1
+
+        return self._pool.submit(run)
+
+    async def run(self, fn: Callable, *args, **kwargs):
+        """Await `fn(*args)` on this bulkhead; give up early if it is still queued at the timeout."""
+        future = self.submit(fn, *args, **kwargs)
+        wrapped = asyncio.wrap_future(future)
+        if self.queue_timeout:
+            done, _ = await asyncio.wait({wrapped}, timeout=self.queue_timeout)
+            if not done and future.cancel():
+                with self._lock:
+                    self.queued -= 1
+                    self.timed_out += 1
+                raise BulkheadTimeout(f"{self.name}: still queued after {self.queue_timeout:.1f}s")
+        return await wrapped
+
+    def stats(self) -> dict:
+        with self._lock:
+            started = self.completed + self.running
+            return {
+                'workers': self.max_workers,
+                'running': self.running,
+                'queued': self.queued,
+                'saturation': round(self.running / self.max_workers, 3),
+                'completed': self.completed,
+                'timed_out': self.timed_out,
+                'queue_timeout_s': self.queue_timeout,
+                'avg_wait_s': round(self._wait_total / started, 4) if started else 0.0,
+                'max_wait_s': round(self._wait_max, 4),
+            }
+
+    def shutdown(self, wait: bool = True):
+        self._pool.shutdown(wait=wait, cancel_futures=not wait)
+
+
+def _env_float(name: str, default: str) -> float:
+    return float(os.environ.get(name, default))
+
+
+# Preview extraction (yt-dlp info, TikWM lookups) and speculative stream resolution
+METADATA = Bulkhead('metadata', int(os.environ.get('MPD_METADATA_WORKERS', '8')),
+                    _env_float('MPD_METADATA_QUEUE_TIMEOUT', '10'))
+# Synchronous /download route: yt-dlp runs while the client waits
+DOWNLOADS = Bulkhead('downloads', int(os.environ.get('MPD_DOWNLOAD_WORKERS', '4')),
+                     _env_float('MPD_DOWNLOAD_QUEUE_TIMEOUT', '30'))
+# Disk reads for served files and the thumbnail cache
+FILE_IO = Bulkhead('file_io', int(os.environ.get('MPD_FILE_IO_WORKERS', '8')),
+                   _env_float('MPD_FILE_IO_QUEUE_TIMEOUT', '5'))
+
+BULKHEADS: Dict[str, Bulkhead] = {b.name: b for b in (METADATA, DOWNLOADS, FILE_IO)}
+
+
+def register(bulkhead: Bulkhead) -> Bulkhead:
+    BULKHEADS[bulkhead.name] = bulkhead
+    return bulkhead
+
+
+def stats() -> dict:
+    return {name: b.stats() for name, b in BULKHEADS.items()}
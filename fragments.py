@@ -0,0 +1,333 @@
+"""Adaptive fragment concurrency for HLS / DASH downloads.
+
+yt-dlp fetches the fragments of an HLS or DASH format one after another unless
+`concurrent_fragment_downloads` is raised, so on a high-latency link most of
+the time goes to request round trips. A fixed higher number is not right
+either: what helps depends on the link and on the upstream, and too many
+connections trip per-client limits (403 / 429 / 503) that only add retries.
+
+Each job gets a FragmentGate. The downloader gets the gate's ceiling as its
+thread count, but every fragment request first takes a connection from the
+gate, which admits `limit` requests of that job at a time and never more than
+MPD_FRAGMENT_CONNECTIONS across the process. For adaptive gates the limit
+follows AIMD on what the job measures: after each window of fragments it grows
+by one while throughput keeps improving and the window actually used all its
+connections, drops by one when throughput fell, and is halved when more than
+MAX_ERROR_RATE of the window's requests failed. A 429 or 403 answer halves it
+at once (at most once per window): the upstream is telling this client to slow
+down. Until the first window that does not improve, growth doubles instead
+(slow start), so short downloads reach a useful limit before they end.
+
+A refused fragment request (503, 429, reset, truncated body, ...) is retried
+here, with backoff (at least what Retry-After asks for) and after giving its
+connection back. yt-dlp's own immediate retries are turned off for gated
+downloads: they would hammer an upstream that just said it is overloaded, and
+the controller would never see the errors.
+"""
+import os
+import threading
+import time
+from typing import Callable, Dict, Optional
+
+from bandwidth import parse_rate
+
+FRAGMENT_CONNECTIONS = int(os.environ.get('MPD_FRAGMENT_CONNECTIONS', '32'))
+FRAGMENT_MAX = int(os.environ.get('MPD_FRAGMENT_MAX', '8'))
+# Byte-range chunking for plain HTTP formats; 0 leaves it to the extractor
+HTTP_CHUNK_SIZE = parse_rate(os.environ.get('MPD_HTTP_CHUNK_SIZE'))
+
+INITIAL_LIMIT = 2
+MAX_ERROR_RATE = 0.1
+# Throughput changes smaller than this are noise, not a reason to move the limit
+MIN_GAIN = 0.1
+WINDOW_MIN_S = 0.5
+FRAGMENT_RETRIES = 8
+RETRY_BACKOFF_S = 0.25
+RETRY_BACKOFF_MAX_S = 4.0
+# Upper bound on an upstream's Retry-After we are willing to sit out per attempt
+RETRY_AFTER_MAX_S = 30.0
+# Statuses by which an upstream asks this client to back off
+CONGESTION_STATUSES = (403, 429)
+
+
+class FragmentsStopped(Exception):
+    pass
+
+
+class ConnectionBudget:
+    """Fragment connections open at once across all jobs."""
+
+    def __init__(self, connections: int = FRAGMENT_CONNECTIONS):
+        self.connections = max(1, int(connections))
+        self.in_use = 0
+        self.waits = 0
+        self._cond = threading.Condition()
+        self._gates: Dict[int, 'FragmentGate'] = {}
+
+    def gate(self, gate_id: str, ceiling: Optional[int] = None,
+             should_stop: Optional[Callable[[], bool]] = None,
+             on_change: Optional[Callable[[int], None]] = None) -> 'FragmentGate':
+        """Open a gate; `ceiling` None adapts up to FRAGMENT_MAX, a number fixes the limit."""
+        gate = FragmentGate(self, gate_id, ceiling, should_stop, on_change)
+        with self._cond:
+            self._gates[id(gate)] = gate
+        return gate
+
+    def _release_gate(self, gate: 'FragmentGate'):
+        with self._cond:
+            self._gates.pop(id(gate), None)
+
+    def snapshot(self) -> dict:
+        with self._cond:
+            return {
+                'connections': self.connections,
+                'in_use': self.in_use,
+                'waits': self.waits,
+                'gates': [g.snapshot() for g in self._gates.values()],
+            }
+
+
+class FragmentGate:
+    """One job's share of the connection budget, with its AIMD-controlled limit."""
+
+    def __init__(self, budget: ConnectionBudget, gate_id: str, ceiling: Optional[int],
+                 should_stop: Optional[Callable[[], bool]], on_change: Optional[Callable[[int], None]]):
+        self.budget = budget
+        self.gate_id = gate_id
+        self.adaptive = ceiling is None
+        self.ceiling = max(1, min(FRAGMENT_MAX if ceiling is None else int(ceiling), budget.connections))
+        self.limit = min(INITIAL_LIMIT, self.ceiling) if self.adaptive else self.ceiling
+        self.should_stop = should_stop
+        self.on_change = on_change
+        self.in_flight = 0
+        self.fragments = 0
+        self.errors = 0
+        self.bytes = 0
+        self.increases = 0
+        self.decreases = 0
+        self.peak_limit = self.limit
+        self._last_bps: Optional[float] = None
+        self._slow_start = True
+        self._reset_window()
+
+    def _reset_window(self):
+        self._window_start = time.monotonic()
+        self._window_bytes = 0
+        self._window_ok = 0
+        self._window_errors = 0
+        self._window_peak = self.in_flight
+        self._window_congested = False
+
+    def acquire(self):
+        cond = self.budget._cond
+        with cond:
+            waited = False
+            while self.in_flight >= self.limit or self.budget.in_use >= self.budget.connections:
+                if self.should_stop and self.should_stop():
+                    raise FragmentsStopped('Download stopped')
+                if not waited and self.in_flight < self.limit:
+                    self.budget.waits += 1  # held back by other jobs, not by our own limit
+                waited = True
+                cond.wait(0.25)
+            self.in_flight += 1
+            self.budget.in_use += 1
+            self._window_peak = max(self._window_peak, self.in_flight)
+
+    def release(self, nbytes: int, ok: bool, congested: bool = False):
+        """Give the connection back; `congested` marks a refusal that asks us to slow down."""
+        cond = self.budget._cond
+        with cond:
+            self.in_flight -= 1
+            self.budget.in_use -= 1
+            self.fragments += 1
+            self.bytes += nbytes
+            self._window_bytes += nbytes
+            if ok:
+                self._window_ok += 1
+            else:
+                self.errors += 1
+                self._window_errors += 1
+            if not self.adaptive:
+                changed = None
+            elif congested:
+                changed = self._back_off()
+            else:
+                changed = self._adjust()
+            cond.notify_all()
+        if changed is not None and self.on_change:
+            self.on_change(changed)
+
+    def _adjust(self) -> Optional[int]:
+        """Close the window once it saw `limit` requests; returns the new limit if it moved."""
+        done = self._window_ok + self._window_errors
+        elapsed = time.monotonic() - self._window_start
+        if done < max(self.limit, 2) or elapsed < WINDOW_MIN_S:
+            return None
+        bps = self._window_bytes / elapsed
+        error_rate = self._window_errors / done
+        old = self.limit
+        if error_rate > MAX_ERROR_RATE:
+            self.limit = max(1, self.limit // 2)
+            self._slow_start = False
+        elif self._last_bps is None or bps > self._last_bps * (1 + MIN_GAIN):
+            # Only probe higher when the window was actually limited by us
+            if self._window_peak >= self.limit:
+                step = self.limit if self._slow_start else 1
+                self.limit = min(self.ceiling, self.limit + step)
+        else:
+            self._slow_start = False
+            if bps < self._last_bps * (1 - MIN_GAIN):
+                self.limit = max(1, self.limit - 1)
+        self._last_bps = bps if error_rate <= MAX_ERROR_RATE else None
+        self._reset_window()
+        if self.limit == old:
+            return None
+        if self.limit > old:
+            self.increases += 1
+        else:
+            self.decreases += 1
+        self.peak_limit = max(self.peak_limit, self.limit)
+        return self.limit
+
+    def _back_off(self) -> Optional[int]:
+        """Multiplicative decrease on a congestion signal, once per window: the
+        requests already in flight when it came are likely refused as well."""
+        if self._window_congested:
+            return None
+        old = self.limit
+        self.limit = max(1, self.limit // 2)
+        self._slow_start = False
+        self._last_bps = None
+        self._reset_window()
+        self._window_congested = True
+        if self.limit == old:
+            return None
+        self.decreases += 1
+        return self.limit
+
+    def pause(self, seconds: float):
+        """Back off before a retry, giving up early when the download is stopped."""
+        deadline = time.monotonic() + seconds
+        while True:
+            if self.should_stop and self.should_stop():
+                raise FragmentsStopped('Download stopped')
+            left = deadline - time.monotonic()
+            if left <= 0:
+                return
+            time.sleep(min(left, 0.25))
+
+    def close(self):
+        self.budget._release_gate(self)
+
+    def snapshot(self) -> dict:
+        return {
+            'id': self.gate_id,
+            'adaptive': self.adaptive,
+            'limit': self.limit,
+            'ceiling': self.ceiling,
+            'peak_limit': self.peak_limit,
+            'in_flight': self.in_flight,
+            'fragments': self.fragments,
+            'errors': self.errors,
+            'bytes': self.bytes,
+            'increases': self.increases,
+            'decreases': self.decreases,
+        }
+
+
+FRAGMENTS = ConnectionBudget()
+
+
+class _GatedFragments:
+    """Mixed into a yt-dlp fragment downloader: each fragment request holds a gate connection."""
+
+    def __init__(self, ydl, params, gate: FragmentGate):
+        super().__init__(ydl, params)
+        self.gate = gate
+
+    def _download_fragment(self, ctx, frag_url, info_dict, headers=None, request_data=None):
+        from yt_dlp.networking.exceptions import HTTPError, IncompleteRead
+        from yt_dlp.utils import DownloadError
+
+        for attempt in range(FRAGMENT_RETRIES + 1):
+            self.gate.acquire()
+            ok = False
+            size = 0
+            error = None
+            try:
+                ok = super()._download_fragment(ctx, frag_url, info_dict, headers, request_data)
+                if ok:
+                    size = self.filesize_or_none(ctx['fragment_filename_sanitized'])
+            except (DownloadError, HTTPError, IncompleteRead) as e:
+                error = e
+            finally:
+                status = getattr(error, 'status', None)
+                self.gate.release(size, ok, congested=status in CONGESTION_STATUSES)
+            if ok:
+                return True
+            if attempt == FRAGMENT_RETRIES:
+                if error:
+                    raise error
+                return False
+            self.gate.pause(max(min(RETRY_BACKOFF_S * 2 ** attempt, RETRY_BACKOFF_MAX_S), retry_after(error)))
+
+
+def retry_after(error: Optional[Exception]) -> float:
+    """Seconds an HTTP error's Retry-After header asks for (0 if none, capped at RETRY_AFTER_MAX_S)."""
+    response = getattr(error, 'response', None)
+    try:
+        seconds = float(response.headers.get('Retry-After'))
+    except (AttributeError, TypeError, ValueError):
+        return 0.0  # absent, or an HTTP date, which CDNs rarely send for fragments
+    return min(max(seconds, 0.0), RETRY_AFTER_MAX_S)
+
+
+_GATED_CLASSES: Dict[type, type] = {}
+
+
+def download(ydl, name: str, info: dict, gate: Optional[FragmentGate] = None):
+    """`ydl.dl(name, info)`, with HLS / DASH fragment requests admitted by `gate`.
+
+    Formats that are not fragmented (or carry no resolved headers) go through
+    `ydl.dl` unchanged.
+    """
+    # yt-dlp is optional for the app as a whole; only callers of this need it
+    from yt_dlp.downloader import get_suitable_downloader
+    from yt_dlp.downloader.fragment import FragmentFD
+
+    fd_cls = get_suitable_downloader(info, ydl.params)
+    if gate is None or not issubclass(fd_cls, FragmentFD) or info.get('http_headers') is None:
+        return ydl.dl(name, info)
+    gated = _GATED_CLASSES.get(fd_cls)
+    if gated is None:
+        gated = _GATED_CLASSES[fd_cls] = type(f"Gated{fd_cls.__name__}", (_GatedFragments, fd_cls), {})
+    # The thread pool is sized for the ceiling; the gate decides how many of them transfer
+    # and retries refused fragments itself, so neither yt-dlp retry loop may run
+    fd = gated(ydl, dict(ydl.params, concurrent_fragment_downloads=gate.ceiling, retries=0,
+                         fragment_retries=0), gate)
+    for hook in ydl.params.get('progress_hooks') or []:
+        fd.add_progress_hook(hook)
+    return fd.download(name, dict(info))
+
+
+def expected_size(d: dict) -> int:
+    """Size of the file a yt-dlp progress dict is about: exact when the format states it."""
+    info = d.get('info_dict') or {}
+    return (d.get('total_bytes') or info.get('filesize') or info.get('filesize_approx')
+            or d.get('total_bytes_estimate') or 0)
+
+
+def progress_fraction(d: dict) -> Optional[float]:
+    """0..1 progress of a yt-dlp progress dict, or None when nothing says how big it is.
+
+    For fragmented downloads yt-dlp extrapolates the total from the fragments
+    finished so far, which swings while several are in flight; the share of
+    finished fragments is a floor that does not.
+    """
+    total = expected_size(d)
+    fraction = (d.get('downloaded_bytes') or 0) / total if total else None
+    count = d.get('fragment_count')
+    if count:
+        floor = (d.get('fragment_index') or 0) / count
+        fraction = max(fraction or 0.0, floor)
+    return min(fraction, 1.0) if fraction is not None else None
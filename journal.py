@@ -0,0 +1,127 @@
+"""Durable job journal: what survives a deploy or a crash.
+
+Every state transition of a job (status, stage, result file, error) appends a
+full snapshot of the job as one JSON line and fsyncs it; progress ticks are
+not journaled. Playlist entry transitions append only the entry that changed
+(`{'id', 'version', 'entry': {...}, 'entries_done'}`) so a long playlist does
+not rewrite its whole entry list on every step. On startup the latest snapshot
+per job wins, with the entry records newer than it applied on top: finished
+jobs are restored as they were, interrupted ones are resumed from their
+partial files.
+
+Lines from different threads may land out of version order; replay sorts that
+out by version. The file is compacted on load, after recovery and whenever it
+grows past MPD_JOURNAL_COMPACT_MB or well past the number of jobs it held at
+the last compaction, so it stays proportional to the jobs kept, not to their
+history.
+"""
+import json
+import os
+import threading
+from pathlib import Path
+from typing import Dict, Iterable, List
+
+KEEP_FINISHED = int(os.environ.get('MPD_JOURNAL_KEEP', '1000'))
+COMPACT_BYTES = int(float(os.environ.get('MPD_JOURNAL_COMPACT_MB', '16')) * 1024 * 1024)
+# Records appended since the last compaction before it is redone, per job it kept (and at least)
+COMPACT_RECORDS_PER_JOB = 8
+COMPACT_MIN_RECORDS = 1000
+TERMINAL_STATUSES = ('finished', 'error', 'canceled')
+
+
+class JobJournal:
+    def __init__(self, path: Path, keep_finished: int = KEEP_FINISHED, compact_bytes: int = COMPACT_BYTES):
+        self.path = Path(path)
+        self.keep_finished = keep_finished
+        self.compact_bytes = compact_bytes
+        self._lock = threading.Lock()
+        self._kept = self._kept_bytes = 0  # jobs and bytes written by the last compaction
+        self._appended = 0  # records appended since
+        try:
+            self._bytes = self.path.stat().st_size
+        except FileNotFoundError:
+            self._bytes = 0
+
+    def append(self, record: dict):
+        """Append a job snapshot (or an entry record) and fsync; compacts past the thresholds."""
+        line = json.dumps(record, default=str) + '\n'
+        with self._lock:
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(line)
+                f.flush()
+                os.fsync(f.fileno())
+            self._appended += 1
+            self._bytes += len(line)
+            # Relative to what the last compaction kept, so a large live set does not compact on every append
+            if self._bytes > max(self.compact_bytes, 2 * self._kept_bytes) or \
+                    self._appended > max(COMPACT_MIN_RECORDS, COMPACT_RECORDS_PER_JOB * self._kept):
+                self._write(self._prune(self._replay()).values())
+
+    def append_entry(self, job_id: str, version: int, entry: dict, **fields):
+        """Journal one playlist entry's transition (plus job fields derived from it, e.g. entries_done)."""
+        self.append({'id': job_id, 'version': version, 'entry': entry, **fields})
+
+    def load(self) -> Dict[str, dict]:
+        """Latest state per job id (by version); also compacts the file."""
+        with self._lock:
+            if not self.path.exists():
+                return {}
+            jobs = self._prune(self._replay())
+            self._write(jobs.values())
+        return jobs
+
+    def rewrite(self, jobs: Iterable[dict]):
+        """Replace the journal with exactly these snapshots (e.g. the jobs just recovered)."""
+        with self._lock:
+            self._write(jobs)
+
+    def _replay(self) -> Dict[str, dict]:
+        snapshots: Dict[str, dict] = {}
+        entries: Dict[str, List[dict]] = {}
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue  # torn write from a crash
+                    if 'entry' in record:
+                        entries.setdefault(record['id'], []).append(record)
+                        continue
+                    old = snapshots.get(record.get('id'))
+                    if old is None or record.get('version', 0) >= old.get('version', 0):
+                        snapshots[record['id']] = record
+        except FileNotFoundError:
+            return {}
+        for job_id, records in entries.items():
+            job = snapshots.get(job_id)
+            if job is None or not job.get('entries'):
+                continue
+            for record in sorted(records, key=lambda r: r['version']):
+                if record['version'] <= job.get('version', 0):
+                    continue  # the snapshot already contains it
+                index = record['entry']['index']
+                job['entries'] = [record['entry'] if e['index'] == index else e for e in job['entries']]
+                job.update({k: v for k, v in record.items() if k not in ('id', 'entry')})
+        return snapshots
+
+    def _prune(self, jobs: Dict[str, dict]) -> Dict[str, dict]:
+        finished = sorted((j for j in jobs.values() if j.get('status') in TERMINAL_STATUSES),
+                          key=lambda j: j.get('created') or 0)
+        for job in finished[:max(0, len(finished) - self.keep_finished)]:
+            del jobs[job['id']]
+        return jobs
+
+    def _write(self, jobs: Iterable[dict]):
+        tmp = self.path.with_suffix('.tmp')
+        kept = size = 0
+        with open(tmp, 'w', encoding='utf-8') as f:
+            for job in jobs:
+                line = json.dumps(job, default=str) + '\n'
+                f.write(line)
+                kept += 1
+                size += len(line)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.path)
+        self._kept, self._kept_bytes, self._appended, self._bytes = kept, size, 0, size
@@ -0,0 +1,235 @@
+"""Canonical media keys: which video a URL points at, independent of how it is spelled.
+
+`parse()` reads a URL once with one anchored pattern, dispatches on the
+normalized host and matches the path with that platform's anchored pattern. It
+returns (platform, canonical id, kind), so `youtu.be/ID`, `m.youtube.com/watch
+?v=ID&si=...` and `youtube.com/shorts/ID` are the same key, and tracking
+parameters never leak into it. Nothing here touches the network except
+`resolve()`, which follows vm./vt.tiktok.com short links once and caches the
+answer for MPD_SHORT_LINK_TTL seconds.
+
+The stream cache, job records and output file names are keyed by
+`MediaKey.key`, so every spelling of a video shares one entry.
+"""
+import functools
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, NamedTuple, Optional, Tuple
+
+import requests
+
+SHORT_LINK_TTL = int(os.environ.get('MPD_SHORT_LINK_TTL', '86400'))
+# Links that led nowhere are retried sooner than resolved ones
+SHORT_LINK_NEGATIVE_TTL = 300
+SHORT_LINK_CACHE_SIZE = 4096
+PARSE_CACHE_SIZE = 8192
+
+PLATFORM_NAMES = {'youtube': 'YouTube', 'tiktok': 'TikTok', 'instagram': 'Instagram'}
+
+
+class MediaKey(NamedTuple):
+    platform: str
+    id: Optional[str]
+    kind: str  # video, photo, playlist, channel, profile, post, story, short_link, unknown
+
+    @property
+    def key(self) -> str:
+        return f"{self.platform}:{self.kind}:{self.id}"
+
+    @property
+    def resolved(self) -> bool:
+        """True when the key names one piece of media without further lookups."""
+        return self.id is not None and self.kind not in ('short_link', 'unknown')
+
+
+# scheme, host without the www./m./music. prefix, port, path, query
+_URL_RE = re.compile(r'\s*(?:(?:https?:)?//)?(?:www\.|m\.|music\.|mobile\.)?(?P<host>[A-Za-z0-9.-]+)(?::\d+)?'
+                     r'(?P<path>/[^?#\s]*)?(?:\?(?P<query>[^#\s]*))?', re.IGNORECASE)
+
+_UNSAFE_RE = re.compile(r'[^a-zA-Z0-9_-]+')
+
+_YT_ID = r'[A-Za-z0-9_-]{11}'
+_YT_PATH_RE = re.compile(
+    rf'/(?:(?:shorts|embed|live|v|e)/(?P<video>{_YT_ID})'
+    r'|(?P<watch>watch)'
+    r'|(?P<playlist>playlist)'
+    r'|(?P<channel>@[\w.-]+|channel/UC[\w-]{22}|c/[\w.-]+|user/[\w.-]+))/?$')
+_YT_SHORT_PATH_RE = re.compile(rf'/(?P<video>{_YT_ID})/?$')
+_YT_QUERY_V_RE = re.compile(rf'(?:^|&)v=({_YT_ID})(?:&|$)')
+_YT_QUERY_LIST_RE = re.compile(r'(?:^|&)list=([A-Za-z0-9_-]+)(?:&|$)')
+
+_TT_PATH_RE = re.compile(
+    r'/(?:@[\w.-]*/(?P<kind>video|photo)/(?P<id>\d+)'
+    r'|embed(?:/v2)?/(?P<embed>\d+)'
+    r'|v/(?P<v>\d+)(?:\.html)?'
+    r'|t/(?P<code>[A-Za-z0-9]+)'
+    r'|@(?P<profile>[\w.-]+))/?$')
+_TT_SHORT_PATH_RE = re.compile(r'/(?P<code>[A-Za-z0-9]+)/?$')
+
+# Posts, reels and IGTV share one shortcode namespace: /p/X and /reel/X are the same media
+_IG_PATH_RE = re.compile(
+    r'/(?:[\w.]+/)?(?:(?:p|reels?|tv)/(?P<id>[A-Za-z0-9_-]+)'
+    r'|stories/[\w.]+/(?P<story>\d+))/?$')
+
+
+def _youtube(path: str, query: str) -> MediaKey:
+    m = _YT_PATH_RE.match(path)
+    if m:
+        if m.group('video'):
+            return MediaKey('youtube', m.group('video'), 'video')
+        if m.group('watch'):
+            v = _YT_QUERY_V_RE.search(query)
+            if v:
+                return MediaKey('youtube', v.group(1), 'video')
+        elif m.group('playlist'):
+            lst = _YT_QUERY_LIST_RE.search(query)
+            if lst:
+                return MediaKey('youtube', lst.group(1), 'playlist')
+        elif m.group('channel'):
+            channel = m.group('channel')
+            # Handles are case-insensitive, channel ids are not
+            return MediaKey('youtube', channel.lower() if channel.startswith('@') else channel, 'channel')
+    return MediaKey('youtube', None, 'unknown')
+
+
+def _youtu_be(path: str, query: str) -> MediaKey:
+    m = _YT_SHORT_PATH_RE.match(path)
+    return MediaKey('youtube', m.group('video'), 'video') if m else MediaKey('youtube', None, 'unknown')
+
+
+def _tiktok(path: str, query: str) -> MediaKey:
+    m = _TT_PATH_RE.match(path)
+    if not m:
+        return MediaKey('tiktok', None, 'unknown')
+    if m.group('id'):
+        return MediaKey('tiktok', m.group('id'), m.group('kind'))
+    if m.group('embed') or m.group('v'):
+        return MediaKey('tiktok', m.group('embed') or m.group('v'), 'video')
+    if m.group('code'):
+        return MediaKey('tiktok', m.group('code'), 'short_link')
+    return MediaKey('tiktok', m.group('profile').lower(), 'profile')
+
+
+def _tiktok_short(path: str, query: str) -> MediaKey:
+    m = _TT_SHORT_PATH_RE.match(path)
+    return MediaKey('tiktok', m.group('code'), 'short_link') if m else MediaKey('tiktok', None, 'unknown')
+
+
+def _instagram(path: str, query: str) -> MediaKey:
+    m = _IG_PATH_RE.match(path)
+    if not m:
+        return MediaKey('instagram', None, 'unknown')
+    if m.group('story'):
+        return MediaKey('instagram', m.group('story'), 'story')
+    return MediaKey('instagram', m.group('id'), 'post')
+
+
+_HOSTS: Dict[str, Callable[[str, str], MediaKey]] = {
+    'youtube.com': _youtube,
+    'youtube-nocookie.com': _youtube,
+    'youtu.be': _youtu_be,
+    'tiktok.com': _tiktok,
+    'vm.tiktok.com': _tiktok_short,
+    'vt.tiktok.com': _tiktok_short,
+    'instagram.com': _instagram,
+}
+
+
+# Popular videos arrive as the same string over and over (shared links)
+@functools.lru_cache(maxsize=PARSE_CACHE_SIZE)
+def parse(url: str) -> Optional[MediaKey]:
+    """Key of `url` without any network access; None for hosts we do not handle.
+
+    Supported hosts with an unrecognized path give kind 'unknown' and id None.
+    """
+    m = _URL_RE.match(url or '')
+    if not m:
+        return None
+    host, path, query = m.group('host', 'path', 'query')
+    handler = _HOSTS.get(host.lower())
+    if handler is None:
+        return None
+    return handler(path or '/', query or '')
+
+
+def platform_of(url: str) -> Optional[str]:
+    key = parse(url)
+    return key.platform if key else None
+
+
+def filename_base(key: Optional[MediaKey], url: str = '', limit: int = 40) -> str:
+    """Readable file name stem: `<platform>_<id>` for known media, else the mangled URL."""
+    if key is not None and key.id:
+        stem = f"{key.platform}_{key.id}"
+    else:
+        stem = url
+    return _UNSAFE_RE.sub('_', stem)[:limit] or 'video'
+
+
+class ShortLinkCache:
+    """code -> resolved MediaKey (or None), each entry valid for its own TTL."""
+
+    def __init__(self, max_entries: int = SHORT_LINK_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries: 'OrderedDict[Tuple[str, str], Tuple[Optional[MediaKey], float]]' = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, short: MediaKey) -> Tuple[bool, Optional[MediaKey]]:
+        """(found, key); found is False when the link must be resolved (again)."""
+        with self._lock:
+            entry = self._entries.get((short.platform, short.id))
+            if entry and entry[1] > time.time():
+                self._entries.move_to_end((short.platform, short.id))
+                self.hits += 1
+                return True, entry[0]
+            self.misses += 1
+            return False, None
+
+    def put(self, short: MediaKey, key: Optional[MediaKey]):
+        ttl = SHORT_LINK_TTL if key is not None else SHORT_LINK_NEGATIVE_TTL
+        with self._lock:
+            self._entries[(short.platform, short.id)] = (key, time.time() + ttl)
+            self._entries.move_to_end((short.platform, short.id))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {'entries': len(self._entries), 'hits': self.hits, 'misses': self.misses}
+
+
+SHORT_LINKS = ShortLinkCache()
+
+
+def resolve(url: str, session: Optional[requests.Session] = None, timeout: float = 10) -> Optional[MediaKey]:
+    """Like parse(), but short links are followed (once per TTL) to the media they point at.
+
+    When the redirect cannot be followed right now, the short-link key itself is
+    returned and nothing is cached.
+    """
+    key = parse(url)
+    if key is None or key.kind != 'short_link':
+        return key
+    found, target = SHORT_LINKS.get(key)
+    if found:
+        return target or key
+    try:
+        # Only the redirect target matters; stream=True avoids reading the HTML body
+        r = (session or requests).get(url.strip() if '://' in url else f'https://{url.strip()}',
+                                      allow_redirects=True, stream=True, timeout=timeout)
+        r.close()
+    except requests.RequestException:
+        return key
+    target = None
+    for hop in [r.url] + [h.headers.get('Location', '') for h in r.history]:
+        hop_key = parse(hop or '')
+        if hop_key is not None and hop_key.resolved:
+            target = hop_key
+            break
+    SHORT_LINKS.put(key, target)
+    return target or key
@@ -0,0 +1,154 @@
+"""CPU-bound ffmpeg post-processing on a dedicated process pool.
+
+The download job only fetches bytes; merging video+audio and audio conversion
+are described as small task dicts and executed here, so transcodes never hold
+a network slot and slow networks never hold a CPU slot.
+
+Task dicts are plain data so they pickle cleanly into the worker processes:
+
+    {'op': 'merge', 'inputs': [video, audio], 'output': path, 'args': [...]}
+    {'op': 'fixup', 'inputs': [src], 'output': path, 'args': [...]}
+    {'op': 'extract_audio', 'inputs': [src], 'output': path, 'bitrate': '192k'}
+    {'op': 'remux_audio', 'inputs': [src], 'output': path}
+    {'op': 'downscale', 'inputs': [src], 'output': path, 'height': 720}
+
+A task may also carry `keep_inputs` (the input is another job's finished file,
+see derived formats in web_app.py); the runner itself ignores it.
+"""
+import multiprocessing
+import os
+import subprocess
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Callable, List, Optional
+
+POSTPROCESS_WORKERS = int(os.environ.get('MPD_POSTPROCESS_WORKERS') or os.cpu_count() or 1)
+
+_pool: Optional[ProcessPoolExecutor] = None
+_dispatcher: Optional[ThreadPoolExecutor] = None
+_pool_lock = threading.Lock()
+_pending = 0
+_running = 0
+
+
+def build_command(task: dict) -> List[str]:
+    op = task['op']
+    inputs = task['inputs']
+    out = task['output']
+    base = ['ffmpeg', '-y', '-hide_banner', '-loglevel', 'error', '-nostdin']
+    if op == 'merge':
+        return base + ['-i', inputs[0], '-i', inputs[1],
+                       '-map', '0:v:0', '-map', '1:a:0', '-c', 'copy', *task.get('args', []), out]
+    if op == 'fixup':
+        # Stream copy of everything, with the corrections yt-dlp's fixup post-processors apply
+        return base + ['-i', inputs[0], '-map', '0', '-dn', '-ignore_unknown', '-c', 'copy',
+                       *task.get('args', []), out]
+    if op == 'remux_audio':
+        # Stream copy: no decode/encode, only the container changes
+        cmd = base + ['-i', inputs[0], '-vn', '-map', '0:a:0', '-c:a', 'copy']
+        if out.endswith('.m4a'):
+            cmd += ['-movflags', '+faststart']
+        return cmd + [out]
+    if op == 'downscale':
+        # Audio is stream-copied; only the video is re-encoded
+        return base + ['-i', inputs[0], '-map', '0:v:0', '-map', '0:a:0?',
+                       '-vf', f"scale=-2:{int(task.get('height', 720))}", '-c:v', 'libx264',
+                       '-preset', task.get('preset', 'veryfast'), '-crf', str(task.get('crf', 23)),
+                       '-c:a', 'copy', '-movflags', '+faststart', out]
+    if op == 'extract_audio':
+        return base + ['-i', inputs[0], '-vn', '-c:a', 'libmp3lame',
+                       '-b:a', task.get('bitrate', '192k'), out]
+    raise ValueError(f"Unknown post-processing op '{op}'")
+
+
+# Native audio codec -> container it can be stream-copied into
+AUDIO_CONTAINERS = {'mp4a': 'm4a', 'aac': 'm4a', 'opus': 'opus', 'vorbis': 'ogg', 'mp3': 'mp3'}
+
+
+def audio_container(acodec: Optional[str], ext: Optional[str] = None) -> Optional[str]:
+    """Extension to remux `acodec` into, or None if it needs transcoding.
+
+    Extractors that do not report codecs (e.g. direct links) fall back to the
+    file extension when it already pins the codec.
+    """
+    if acodec and acodec != 'none':
+        return AUDIO_CONTAINERS.get(acodec.split('.')[0].lower())
+    return ext if ext in ('m4a', 'opus', 'ogg', 'mp3') else None
+
+
+def run_task(task: dict) -> dict:
+    """Runs inside a pool worker. Never raises; errors are reported in the result."""
+    started = time.time()
+    cpu_before = os.times()
+    try:
+        proc = subprocess.run(build_command(task), capture_output=True, text=True)
+        ok = proc.returncode == 0 and os.path.exists(task['output'])
+        error = None if ok else (proc.stderr.strip()[-400:] or f'ffmpeg exited {proc.returncode}')
+    except Exception as e:
+        ok, error = False, str(e)
+    cpu_after = os.times()
+    return {
+        'ok': ok,
+        'error': error,
+        'output': task['output'],
+        'started': started,
+        'finished': time.time(),
+        # ffmpeg runs as our child, so its CPU time lands in children_*
+        'cpu_s': round((cpu_after.children_user - cpu_before.children_user)
+                       + (cpu_after.children_system - cpu_before.children_system), 3),
+    }
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool, _dispatcher
+    with _pool_lock:
+        if _pool is None:
+            # Never fork the threaded web server directly; forkserver (or spawn on Windows)
+            # gives workers a clean interpreter
+            method = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+            _pool = ProcessPoolExecutor(max_workers=POSTPROCESS_WORKERS,
+                                        mp_context=multiprocessing.get_context(method))
+            # One dispatcher thread per worker process: a task only leaves our queue when a
+            # worker is free, so "queued" and "running" are observable from this process.
+            _dispatcher = ThreadPoolExecutor(max_workers=POSTPROCESS_WORKERS, thread_name_prefix='postprocess')
+        return _pool
+
+
+def _dispatch(task: dict, on_start: Optional[Callable[[], None]]) -> dict:
+    global _pending, _running
+    with _pool_lock:
+        _pending -= 1
+        _running += 1
+    try:
+        if on_start:
+            on_start()
+        return _pool.submit(run_task, task).result()
+    finally:
+        with _pool_lock:
+            _running -= 1
+
+
+def submit(task: dict, on_start: Optional[Callable[[], None]] = None) -> Future:
+    """Queue `task`; `on_start` fires when a worker picks it up."""
+    global _pending
+    _get_pool()
+    with _pool_lock:
+        _pending += 1
+    return _dispatcher.submit(_dispatch, task, on_start)
+
+
+def stats() -> dict:
+    with _pool_lock:
+        return {'workers': POSTPROCESS_WORKERS, 'queued': _pending, 'running': _running}
+
+
+def shutdown(wait: bool = True):
+    global _pool, _dispatcher
+    with _pool_lock:
+        pool, _pool = _pool, None
+        dispatcher, _dispatcher = _dispatcher, None
+    if dispatcher is not None:
+        dispatcher.shutdown(wait=wait, cancel_futures=not wait)
+    if pool is not None:
+        pool.shutdown(wait=wait, cancel_futures=not wait)
@@ -0,0 +1,45 @@
+const urlInput=document.getElementById('url');
+const statusEl=document.getElementById('status');
+const previewContent=document.getElementById('previewContent');
+const downloadBtn=document.getElementById('downloadBtn');
+const cancelBtn=document.getElementById('cancelBtn');
+const formatSelect=document.getElementById('formatSelect');
+const formatBar=document.getElementById('formatBar');
+const clearBtn=document.getElementById('clearBtn');
+const detailsCard=document.getElementById('detailsCard');
+const detailsMeta=document.getElementById('detailsMeta');
+const detailsBody=document.getElementById('detailsBody');
+const progressWrap=document.getElementById('progressWrap');
+const progressFill=document.getElementById('progressFill');
+const progressMeta=document.getElementById('progressMeta');
+let lastValue='';let pendingController=null;let metaCache={};let activeJob=null;let pollTimer=null;let canceled=false;let cancelInFlight=false;
+
+function platformIcon(p){if(!p)return'';const map={tiktok:'🎵',youtube:'▶️',instagram:'📸'};return map[p]||'📹';}
+function debounce(fn,ms){let t;return(...a)=>{clearTimeout(t);t=setTimeout(()=>fn(...a),ms);};}
+function formatDuration(sec){if(!sec)return'';const m=Math.floor(sec/60);const s=Math.floor(sec%60);return `${m}:${s.toString().padStart(2,'0')}`;}
+function formatSize(bytes){if(!bytes)return'';const u=['B','KB','MB','GB','TB'];let i=0,v=bytes;while(v>1024&&i<u.length-1){v/=1024;i++;}return v.toFixed(i>1?1:0)+' '+u[i];}
+function escapeHtml(str){return str.replace(/[&<>"']/g,c=>({"&":"&amp;","<":"&lt;",">":"&gt;","\"":"&quot;","'":"&#39;"}[c]));}
+
+async function fetchPreview(u){if(pendingController)pendingController.abort();pendingController=new AbortController();statusEl.textContent='Fetching preview...';try{const res=await fetch(`/api/preview?url=${encodeURIComponent(u)}`,{signal:pendingController.signal});if(!res.ok)throw new Error('HTTP '+res.status);const data=await res.json();if(urlInput.value.trim()!==u)return;if(!data.ok){renderEmpty('No preview available.');return;}metaCache[u]=data.preview;renderPreview(data.preview,u);}catch(e){if(e.name==='AbortError')return;renderEmpty('Error: '+e.message);} }
+function renderEmpty(msg){previewContent.innerHTML=`<div id='previewPlaceholder'>${msg}</div>`;detailsCard.classList.add('hidden');downloadBtn.disabled=true;formatBar.classList.add('hidden');statusEl.textContent='Preview failed';}
+
+function renderPreview(meta,url){const {title,thumbnail,preview_url,embed_url,video_type,platform,duration,filesize}=meta;let mediaHTML='';if(video_type==='video'&&preview_url){mediaHTML=`<video class='player' controls poster='${thumbnail||''}'><source src='${preview_url}'></video>`;}else if(embed_url){mediaHTML=`<div class='embed-wrap'><iframe src='${embed_url}' frameborder='0' allowfullscreen loading='lazy'></iframe></div>`;}else{mediaHTML='<div id="previewPlaceholder">No playable preview.</div>';}previewContent.innerHTML=`<div class='media-wrapper-inner' style='position:relative;width:100%;height:100%;display:flex;align-items:center;justify-content:center;'>${mediaHTML}${title?`<div class='title-bar'>${escapeHtml(title)}</div>`:''}</div>`;const metaBadges=[];if(platform)metaBadges.push(`${platformIcon(platform)} ${platform}`);if(duration)metaBadges.push(`⏱ ${formatDuration(duration)}`);if(filesize)metaBadges.push(`💾 ${formatSize(filesize)}`);detailsMeta.innerHTML=metaBadges.map(b=>`<span>${b}</span>`).join('');detailsBody.innerHTML='<small class="muted">Confirm the preview then click Download.</small>';if(metaBadges.length||title){detailsCard.classList.remove('hidden');}else{detailsCard.classList.add('hidden');}statusEl.textContent='Preview ready';downloadBtn.disabled=false;formatBar.classList.remove('hidden');}
+
+const debounced=debounce(()=>{const v=urlInput.value.trim();if(!v){statusEl.textContent='Waiting for URL...';renderEmpty('Paste a supported link to auto-load preview.');return;}if(v===lastValue)return;lastValue=v;fetchPreview(v);},600);
+urlInput.addEventListener('input',debounced);
+clearBtn.addEventListener('click',()=>{urlInput.value='';lastValue='';debounced();urlInput.focus();});
+
+async function startDownload(){const u=urlInput.value.trim();if(!u)return;downloadBtn.disabled=true;cancelBtn.style.display='inline-flex';canceled=false;downloadBtn.textContent='Starting...';progressWrap.style.display='flex';progressFill.style.width='0%';progressMeta.children[0].textContent='0%';progressMeta.children[1].textContent='';try{const form=new FormData();form.append('url',u);form.append('format',formatSelect.value);const res=await fetch('/api/start_download',{method:'POST',body:form});const data=await res.json();if(!data.ok) throw new Error(data.error||'Failed to start job');activeJob=data.job_id;downloadBtn.textContent='Downloading...';pollJob();}catch(e){alert(e.message);downloadBtn.textContent='Download';downloadBtn.disabled=false;cancelBtn.style.display='none';}}
+
+async function pollJob(){if(!activeJob)return;try{const res=await fetch(`/api/job/${activeJob}`);const data=await res.json();if(!data.ok)throw new Error(data.error||'Job error');const job=data.job;updateProgress(job);if(['finished','error','canceled'].includes(job.status)){if(job.status==='finished'){downloadBtn.textContent='Done';progressMeta.children[1].innerHTML='<span class="job-finished">Finished</span>';fetchFile(job);}else if(job.status==='canceled'){downloadBtn.textContent='Canceled';progressMeta.children[1].innerHTML='<span class="status-canceled">Canceled</span>';setTimeout(()=>location.reload(),800);}else{downloadBtn.textContent='Retry';progressMeta.children[1].innerHTML='<span class="job-error">'+(job.error||'Error')+'</span>';}downloadBtn.disabled=false;cancelBtn.style.display='none';activeJob=null;cancelInFlight=false;return;}else if(job.status==='canceling'){progressMeta.children[1].innerHTML='<span class="status-canceling">Canceling...</span>';}pollTimer=setTimeout(pollJob,800);}catch(e){progressMeta.children[1].innerHTML='<span class="job-error">'+e.message+'</span>';downloadBtn.textContent='Retry';downloadBtn.disabled=false;cancelBtn.style.display='none';activeJob=null;cancelInFlight=false;}}
+
+async function cancelDownload(){if(!activeJob||cancelInFlight)return;cancelInFlight=true;cancelBtn.disabled=true;cancelBtn.textContent='Canceling...';try{const res=await fetch(`/api/job/${activeJob}/cancel`,{method:'POST'});await res.json();progressMeta.children[1].innerHTML='<span class="status-canceling">Canceling...</span>';downloadBtn.textContent='Canceling...';}catch(e){progressMeta.children[1].innerHTML='<span class="job-error">Cancel failed</span>';downloadBtn.textContent='Retry';cancelBtn.style.display='none';activeJob=null;cancelInFlight=false;return;} // keep polling until worker marks canceled
+if(!pollTimer) pollJob();}
+
+function updateProgress(job){if(job.percent!=null){progressFill.style.width=(job.percent.toFixed(1))+'%';progressMeta.children[0].textContent=(job.percent.toFixed(1))+'%';}if(job.stage==='postprocess_queue'){progressMeta.children[1].textContent='Waiting for converter...';}else if(job.stage==='postprocess'){progressMeta.children[1].textContent='Converting...';}else if(job.speed){progressMeta.children[1].textContent=`${(job.speed/1024/1024).toFixed(2)} MB/s`;}}
+
+async function fetchFile(job){try{const res=await fetch(`/api/job/${job.id}/file`);if(!res.ok) throw new Error('File not ready');const blob=await res.blob();let fname='download.'+(job.ext||'bin');const cd=res.headers.get('Content-Disposition')||'';const m=cd.match(/filename="?([^";]+)"?/i);if(m)fname=m[1];const a=document.createElement('a');a.href=URL.createObjectURL(blob);a.download=fname;document.body.appendChild(a);a.click();a.remove();setTimeout(()=>URL.revokeObjectURL(a.href),4000);}catch(e){alert('Download retrieval failed: '+e.message);}}
+
+downloadBtn.addEventListener('click',startDownload);
+cancelBtn.addEventListener('click',cancelDownload);
+window.addEventListener('load',()=>{if(urlInput.value.trim()){fetchPreview(urlInput.value.trim());}});
@@ -0,0 +1,109 @@
+"""Short-lived cache of resolved stream URLs, filled speculatively at preview time.
+
+Most users press Download right after the preview appears. The preview already
+paid for extraction, so it also runs format selection for every quality option
+and parks the result here; a download that finds a warm entry skips extraction
+and starts fetching bytes immediately. Callers key entries by the canonical
+media key (media_keys.py) where the URL has one, so every spelling of a video
+shares them.
+
+Entries expire with the signed URLs they contain (`expire=` on googlevideo,
+`x-expires=` on the TikTok CDN, ...), minus a safety margin.
+"""
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Iterable, Optional
+
+MAX_ENTRIES = int(os.environ.get('MPD_STREAM_CACHE_SIZE', '256'))
+DEFAULT_TTL = int(os.environ.get('MPD_STREAM_CACHE_TTL', '300'))
+# Stop handing out URLs this long before their signature expires
+EXPIRY_MARGIN = 60
+
+_EXPIRY_RE = re.compile(r'[?&/](?:expire|expires|x-expires|exp)[=/](\d{9,11})(?:\D|$)', re.IGNORECASE)
+
+# Keys that are large and not needed to download an already selected format
+_BULKY_KEYS = ('formats', 'thumbnails', 'automatic_captions', 'subtitles', 'heatmap',
+               'requested_subtitles', 'chapters', 'description')
+
+
+def url_expiry(url: Optional[str]) -> Optional[float]:
+    """Unix time a signed URL stops working, if it says so."""
+    if not url:
+        return None
+    m = _EXPIRY_RE.search(url)
+    return float(m.group(1)) if m else None
+
+
+def entry_expiry(urls: Iterable[Optional[str]], now: Optional[float] = None) -> float:
+    now = now or time.time()
+    stamps = [t for t in (url_expiry(u) for u in urls) if t]
+    if not stamps:
+        return now + DEFAULT_TTL
+    return min(stamps) - EXPIRY_MARGIN
+
+
+def trim_info(info: dict) -> dict:
+    """Drop everything a format-selected info dict does not need for downloading."""
+    trimmed = {k: v for k, v in info.items() if k not in _BULKY_KEYS}
+    if trimmed.get('requested_formats'):
+        trimmed['requested_formats'] = [dict(f) for f in trimmed['requested_formats']]
+    return trimmed
+
+
+class ResolvedStreamCache:
+    def __init__(self, max_entries: int = MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries: 'OrderedDict[tuple, dict]' = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def put(self, url: str, fmt: str, value: dict, resolve_s: float, urls: Iterable[Optional[str]]):
+        """Store `value` (a trimmed info dict or preview meta) resolved in `resolve_s` seconds."""
+        expires = entry_expiry(urls)
+        if expires <= time.time():
+            return
+        with self._lock:
+            self._entries[(url, fmt)] = {'value': value, 'resolve_s': resolve_s,
+                                         'stored': time.time(), 'expires': expires}
+            self._entries.move_to_end((url, fmt))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get(self, url: str, fmt: str) -> Optional[dict]:
+        """Return the live entry for (url, fmt) or None. Counts hits/misses."""
+        with self._lock:
+            entry = self._entries.get((url, fmt))
+            if entry and entry['expires'] <= time.time():
+                del self._entries[(url, fmt)]
+                entry = None
+            if entry:
+                self.hits += 1
+                self._entries.move_to_end((url, fmt))
+            else:
+                self.misses += 1
+            return entry
+
+    def fresh(self, url: str, fmt: str) -> bool:
+        """Whether a live entry exists, without touching hit/miss counters."""
+        with self._lock:
+            entry = self._entries.get((url, fmt))
+            return bool(entry and entry['expires'] > time.time())
+
+    def peek(self, url: str, fmt: str) -> Optional[dict]:
+        """The live entry for (url, fmt), without touching counters or recency."""
+        with self._lock:
+            entry = self._entries.get((url, fmt))
+            return entry if entry and entry['expires'] > time.time() else None
+
+    def invalidate(self, url: str, fmt: Optional[str] = None):
+        with self._lock:
+            for key in [k for k in self._entries if k[0] == url and (fmt is None or k[1] == fmt)]:
+                del self._entries[key]
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {'entries': len(self._entries), 'hits': self.hits, 'misses': self.misses}
@@ -0,0 +1,10 @@
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+# web_app creates its journal and caches under MPD_DOWNLOAD_DIR at import time
+os.environ.setdefault('MPD_DOWNLOAD_DIR', tempfile.mkdtemp(prefix='mpd-tests-'))
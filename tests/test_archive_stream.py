@@ -0,0 +1,36 @@
+import asyncio
+import io
+import zipfile
+
+import web_app
+
+
+def build(items):
+    async def collect_all():
+        return b''.join([chunk async for chunk in web_app.archive_stream(lambda: (items, False))])
+    return asyncio.run(collect_all())
+
+
+def test_archive_skips_missing_and_changed_files(tmp_path, monkeypatch):
+    good = tmp_path / 'a.mp4'
+    good.write_bytes(b'a' * 100_000)
+    changed = tmp_path / 'b.mp4'
+    changed.write_bytes(b'b' * 5000)
+    later = tmp_path / 'c.mp4'
+    later.write_bytes(b'c' * 10)
+    real_iter_file = web_app.iter_file
+
+    async def iter_file(f):
+        async for chunk in real_iter_file(f):
+            yield chunk
+        if f.name == str(changed):
+            yield b'appended after the stat'
+
+    monkeypatch.setattr(web_app, 'iter_file', iter_file)
+    items = [('1', 'a.mp4', good), ('2', 'gone.mp4', tmp_path / 'gone.mp4'),
+             ('3', 'b.mp4', changed), ('4', 'c.mp4', later)]
+    with zipfile.ZipFile(io.BytesIO(build(items))) as zf:
+        assert zf.testzip() is None
+        assert zf.namelist() == ['a.mp4', 'c.mp4']
+        assert zf.read('a.mp4') == good.read_bytes()
+        assert zf.read('c.mp4') == b'c' * 10
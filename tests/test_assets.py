@@ -0,0 +1,42 @@
+from fastapi.testclient import TestClient
+
+import web_app
+from assets import CompressedBody
+
+client = TestClient(web_app.app)
+
+
+def asset_name():
+    return web_app.ASSETS.url('style.css').removeprefix('/assets/')
+
+
+def test_each_encoding_has_its_own_etag():
+    body = CompressedBody(b'body { color: red; }\n' * 50, 'text/css')
+    assert 'gzip' in body.encodings
+    assert body.etag('identity') != body.etag('gzip')
+    assert body.etag('gzip').endswith('-gzip"')
+    assert body.not_modified(f'W/{body.etag("gzip")}, "other"', 'gzip')
+    assert not body.not_modified(body.etag('identity'), 'gzip')
+    assert body.not_modified('*', 'identity')
+    assert not body.not_modified(None, 'identity')
+
+
+def test_304_only_for_the_negotiated_variant():
+    url = '/assets/' + asset_name()
+    gz = client.get(url, headers={'Accept-Encoding': 'gzip'})
+    assert gz.status_code == 200 and gz.headers['content-encoding'] == 'gzip'
+    etag = gz.headers['etag']
+    assert etag.endswith('-gzip"')
+    again = client.get(url, headers={'Accept-Encoding': 'gzip', 'If-None-Match': etag})
+    assert again.status_code == 304 and again.headers['etag'] == etag
+    # A client without gzip holding the gzip tag must get the identity bytes
+    plain = client.get(url, headers={'Accept-Encoding': 'identity', 'If-None-Match': etag})
+    assert plain.status_code == 200 and 'content-encoding' not in plain.headers
+    assert plain.headers['etag'] != etag
+
+
+def test_index_etag_follows_encoding():
+    gz = client.get('/', headers={'Accept-Encoding': 'gzip'})
+    plain = client.get('/', headers={'Accept-Encoding': 'identity'})
+    assert gz.headers['etag'] != plain.headers['etag']
+    assert client.get('/', headers={'Accept-Encoding': 'identity', 'If-None-Match': plain.headers['etag']}).status_code == 304
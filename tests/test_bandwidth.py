@@ -0,0 +1,79 @@
+import time
+
+import pytest
+
+from bandwidth import BandwidthBudget, TokenBucket, parse_rate
+
+
+def rates(budget: BandwidthBudget) -> dict:
+    return {f['id']: f['rate'] for f in budget.snapshot()['flows']}
+
+
+def test_parse_rate():
+    assert parse_rate('2M') == 2 * 1024 ** 2
+    assert parse_rate('500k') == 500 * 1024
+    assert parse_rate('1048576') == 1048576
+    assert parse_rate('') == 0
+    assert parse_rate('fast') == 0
+    assert parse_rate(None) == 0
+
+
+def test_flows_split_by_weight():
+    budget = BandwidthBudget('test', rate=1000)
+    budget.open('a', weight=4)
+    budget.open('b', weight=1)
+    assert rates(budget) == {'a': 800, 'b': 200}
+
+
+def test_capped_flow_hands_surplus_to_others():
+    budget = BandwidthBudget('test', rate=1000)
+    budget.open('capped', weight=4, cap=100)
+    budget.open('b', weight=1)
+    budget.open('c', weight=1)
+    assert rates(budget) == {'capped': 100, 'b': 450, 'c': 450}
+
+
+def test_closing_a_flow_rebalances():
+    budget = BandwidthBudget('test', rate=1000)
+    a = budget.open('a', weight=1)
+    budget.open('b', weight=1)
+    a.consume(10)
+    a.close()
+    assert rates(budget) == {'b': 1000}
+    assert budget.snapshot()['total_bytes'] == 10
+
+
+def test_interactive_floor_is_reserved_before_weights():
+    budget = BandwidthBudget('test', rate=1000, interactive_floor=300)
+    budget.open('ui', weight=1, interactive=True)
+    for i in range(3):
+        budget.open(f"bulk{i}", weight=4, interactive=False)
+    r = rates(budget)
+    assert r['ui'] == pytest.approx(300 + 700 / 13, abs=1)
+    assert r['bulk0'] == pytest.approx(4 * 700 / 13, abs=1)
+    assert sum(r.values()) == pytest.approx(1000, abs=4)
+
+
+def test_unlimited_budget_applies_only_caps():
+    budget = BandwidthBudget('test', rate=0)
+    budget.open('a', cap=500)
+    budget.open('b')
+    assert rates(budget) == {'a': 500, 'b': None}
+
+
+def test_token_bucket_allows_debt_and_repays_it():
+    bucket = TokenBucket(rate=100_000, burst=1000)
+    # A chunk far larger than the burst still passes, then the debt is slept off
+    assert bucket.reserve(1000) == 0.0
+    delay = bucket.reserve(5000)
+    assert delay == pytest.approx(0.05, abs=0.01)
+    started = time.monotonic()
+    slept = bucket.consume(1)
+    assert slept == pytest.approx(0.05, abs=0.02)
+    assert time.monotonic() - started >= 0.04
+
+
+def test_token_bucket_consume_stops_early():
+    bucket = TokenBucket(rate=1000, burst=1000)
+    bucket.consume(1000)
+    assert bucket.consume(10_000, should_stop=lambda: True) == 0.0
@@ -0,0 +1,50 @@
+import pytest
+
+import capacity
+from capacity import ThroughputMeter, replica_delta, utilization
+
+
+@pytest.mark.parametrize('load, expected', [
+    (0.0, -1),   # idle: this instance may go
+    (0.3, 0),    # some work, well under target: keep it
+    (0.7, 0),    # exactly at target
+    (0.71, 1),
+    (1.4, 1),
+    (2.1, 2),
+    (3.5, 4),
+])
+def test_replica_delta_at_target(load, expected):
+    assert replica_delta(load, draining=False, low_disk=False, target=0.7) == expected
+
+
+def test_draining_asks_for_nothing():
+    assert replica_delta(5.0, draining=True, low_disk=True, target=0.7) == 0
+    assert replica_delta(0.0, draining=True, low_disk=False, target=0.7) == 0
+
+
+def test_low_disk_asks_for_at_least_one_more():
+    assert replica_delta(0.0, draining=False, low_disk=True, target=0.7) == 1
+    assert replica_delta(3.5, draining=False, low_disk=True, target=0.7) == 4
+
+
+def test_zero_target_never_scales():
+    assert replica_delta(3.0, draining=False, low_disk=False, target=0) == 0
+
+
+def test_utilization_picks_the_bottleneck():
+    assert utilization({'fetch': 0.5, 'ffmpeg': 1.2, 'ingress': None}) == (1.2, 'ffmpeg')
+    assert utilization({'ingress': None}) == (0.0, None)
+    assert utilization({}) == (0.0, None)
+
+
+def test_throughput_rates_span_the_window(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(capacity.time, 'monotonic', lambda: now[0])
+    meter = ThroughputMeter(window=10)
+    assert meter.sample(bytes=0)['rates']['bytes'] is None  # no elapsed time yet
+    for t in range(1, 21):
+        now[0] = 1000.0 + t
+        report = meter.sample(bytes=t * 500)
+    # The oldest sample kept is at least one window old, never much more
+    assert report['window_s'] == 10
+    assert report['rates']['bytes'] == pytest.approx(500)
@@ -0,0 +1,107 @@
+import pytest
+
+import web_app
+from stream_cache import ResolvedStreamCache
+from web_app import derivation_plan, upstream_bytes_avoided
+
+KEY = 'youtube:video:dQw4w9WgXcQ'
+VIDEO = {'format_id': '137', 'vcodec': 'avc1.640028', 'acodec': 'none', 'height': 1080, 'bytes': 8_000_000}
+AUDIO = {'format_id': '140', 'vcodec': 'none', 'acodec': 'mp4a.40.2', 'abr': 128, 'bytes': 1_000_000}
+OPUS = dict(AUDIO, format_id='251', acodec='opus')
+PROGRESSIVE = {'format_id': '18', 'vcodec': 'avc1.42001E', 'acodec': 'mp4a.40.2', 'height': 360,
+               'abr': 96, 'bytes': 5_000_000}
+
+
+def source(fmt='best', streams=(VIDEO, AUDIO), ext='mp4', duration=200):
+    return {'format': fmt, 'streams': [dict(s) for s in streams], 'ext': ext, 'duration': duration}
+
+
+@pytest.fixture(autouse=True)
+def ffmpeg(monkeypatch):
+    monkeypatch.setattr(web_app, 'FFMPEG_AVAILABLE', True)
+    monkeypatch.setattr(web_app, 'DERIVE_DOWNSCALE', False)
+    monkeypatch.setattr(web_app, 'STREAMS', ResolvedStreamCache())
+
+
+def test_same_format_links():
+    assert derivation_plan('best', source()) == {'op': 'link'}
+    assert derivation_plan('audio', source('audio_fast', [AUDIO], ext='mp3')) == {'op': 'link'}
+
+
+def test_720p_links_to_a_best_that_found_nothing_higher():
+    assert derivation_plan('720p', source(streams=[dict(VIDEO, height=720), AUDIO])) == {'op': 'link'}
+    assert derivation_plan('720p', source()) is None
+
+
+def test_720p_downscales_only_when_enabled(monkeypatch):
+    monkeypatch.setattr(web_app, 'DERIVE_DOWNSCALE', True)
+    assert derivation_plan('720p', source()) == {'op': 'downscale', 'ext': 'mp4', 'height': 720}
+
+
+def test_audio_out_of_a_video():
+    assert derivation_plan('audio_fast', source()) == {'op': 'remux_audio', 'ext': 'm4a'}
+    assert derivation_plan('audio_fast', source(streams=[VIDEO, OPUS])) == {'op': 'remux_audio', 'ext': 'opus'}
+    assert derivation_plan('audio', source()) == {'op': 'extract_audio', 'ext': 'mp3', 'bitrate': '192k'}
+
+
+def test_nothing_to_derive():
+    # Video from audio, audio from a video-only file, anything without ffmpeg
+    assert derivation_plan('best', source('audio', [AUDIO], ext='mp3')) is None
+    assert derivation_plan('audio', source(streams=[VIDEO])) is None
+    assert derivation_plan('audio_fast', source('audio', [AUDIO], ext='mp3')) is None
+
+
+def test_without_ffmpeg_only_links(monkeypatch):
+    monkeypatch.setattr(web_app, 'FFMPEG_AVAILABLE', False)
+    assert derivation_plan('best', source()) == {'op': 'link'}
+    assert derivation_plan('audio', source()) is None
+
+
+def test_avoided_bytes_from_the_source_streams():
+    src = source()
+    assert upstream_bytes_avoided('best', KEY, {'op': 'link'}, src) == (9_000_000, 'source')
+    assert upstream_bytes_avoided('audio_fast', KEY, {'op': 'remux_audio', 'ext': 'm4a'}, src) == \
+        (1_000_000, 'source')
+
+
+def test_avoided_audio_bytes_of_a_progressive_source_are_estimated():
+    src = source(streams=[PROGRESSIVE], duration=100)
+    assert upstream_bytes_avoided('audio', KEY, {'op': 'extract_audio'}, src) == (96_000 // 8 * 100, 'estimate')
+    src['streams'][0]['abr'] = None
+    assert upstream_bytes_avoided('audio', KEY, {'op': 'extract_audio'}, src) == (0, 'estimate')
+
+
+def test_avoided_bytes_of_a_downscale_scale_with_the_area():
+    plan = {'op': 'downscale', 'ext': 'mp4', 'height': 720}
+    assert upstream_bytes_avoided('720p', KEY, plan, source()) == \
+        (1_000_000 + int(8_000_000 * (720 / 1080) ** 2), 'estimate')
+
+
+def test_resolved_sizes_win_when_cached():
+    resolved = {'requested_formats': [{'filesize': 3_000_000}, {'filesize_approx': 700_000}]}
+    web_app.STREAMS.put(KEY, '720p', resolved, 1.0, [])
+    plan = {'op': 'downscale', 'ext': 'mp4', 'height': 720}
+    assert upstream_bytes_avoided('720p', KEY, plan, source()) == (3_700_000, 'resolved')
+    # Any unknown size falls back to the source-based number
+    web_app.STREAMS.put(KEY, 'audio', {'filesize': None}, 1.0, [])
+    assert upstream_bytes_avoided('audio', KEY, {'op': 'extract_audio'}, source())[1] == 'source'
+
+
+def test_find_derivation_prefers_the_cheapest_source(tmp_path, monkeypatch):
+    files = {}
+    for name in ('best', 'audio_fast'):
+        files[name] = tmp_path / f"{name}.bin"
+        files[name].write_bytes(b'x')
+    jobs = {
+        'v': dict(source(), id='v', status='finished', media_key=KEY, created=1, file=str(files['best'])),
+        'a': dict(source('audio_fast', [AUDIO], ext='m4a'), id='a', status='finished', media_key=KEY,
+                  created=2, file=str(files['audio_fast'])),
+        'gone': dict(source('audio_fast', [AUDIO], ext='m4a'), id='gone', status='finished', media_key=KEY,
+                     created=3, file=str(tmp_path / 'deleted.m4a')),
+    }
+    monkeypatch.setattr(web_app, 'JOBS', jobs)
+    src, plan = web_app.find_derivation('new', 'audio_fast', KEY)
+    assert (src['id'], plan) == ('a', {'op': 'link'})  # a link beats remuxing the video's audio
+    src, plan = web_app.find_derivation('new', 'audio', KEY)
+    assert src['id'] in ('v', 'a') and plan['op'] == 'extract_audio'
+    assert web_app.find_derivation('new', 'best', 'youtube:video:other') is None
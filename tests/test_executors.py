@@ -0,0 +1,74 @@
+import asyncio
+import threading
+
+import pytest
+
+from executors import Bulkhead, BulkheadTimeout
+
+
+def saturate(bulkhead):
+    """Occupy every worker until the returned event is set."""
+    release = threading.Event()
+    started = [threading.Event() for _ in range(bulkhead.max_workers)]
+    for s in started:
+        bulkhead.submit_admitted(lambda s=s: (s.set(), release.wait(5)))
+    for s in started:
+        assert s.wait(5)
+    return release
+
+
+def drain(bulkhead):
+    bulkhead.shutdown(wait=True)
+
+
+def test_run_timeout_is_counted_once():
+    b = Bulkhead('t', 1, queue_timeout=0.2)
+    release = saturate(b)
+
+    async def run():
+        with pytest.raises(BulkheadTimeout):
+            await b.run(lambda: 'never')
+    asyncio.run(run())
+    assert b.stats()['queued'] == 0
+    assert b.stats()['timed_out'] == 1
+    release.set()
+    drain(b)
+    stats = b.stats()
+    assert (stats['queued'], stats['running'], stats['timed_out'], stats['completed']) == (0, 0, 1, 1)
+
+
+def test_submitted_work_that_waited_too_long_is_refused_once():
+    b = Bulkhead('t', 1, queue_timeout=0.1)
+    release = saturate(b)
+    future = b.submit(lambda: 'late')
+    threading.Timer(0.3, release.set).start()
+    with pytest.raises(BulkheadTimeout):
+        future.result(5)
+    drain(b)
+    stats = b.stats()
+    assert (stats['queued'], stats['running'], stats['timed_out'], stats['completed']) == (0, 0, 1, 1)
+
+
+def test_admitted_work_survives_a_saturated_pool():
+    b = Bulkhead('t', 2, queue_timeout=0.1)
+    release = saturate(b)
+    futures = [b.submit_admitted(lambda i=i: i * 2) for i in range(3)]
+    threading.Timer(0.4, release.set).start()  # well past the queue timeout
+    assert [f.result(5) for f in futures] == [0, 2, 4]
+    drain(b)
+    stats = b.stats()
+    assert stats['timed_out'] == 0
+    assert (stats['queued'], stats['running'], stats['completed']) == (0, 0, 5)
+    assert stats['max_wait_s'] >= 0.3
+
+
+def test_run_returns_results_and_errors():
+    b = Bulkhead('t', 2, queue_timeout=1)
+
+    async def run():
+        assert await b.run(sum, [1, 2, 3]) == 6
+        with pytest.raises(ZeroDivisionError):
+            await b.run(lambda: 1 / 0)
+    asyncio.run(run())
+    drain(b)
+    assert b.stats()['completed'] == 2
@@ -0,0 +1,83 @@
+import pytest
+
+from web_app import FetchProgress
+
+
+def tick(filename, downloaded, total=None, status='downloading', speed=None, format_id=None, **extra):
+    d = {'status': status, 'filename': filename, 'downloaded_bytes': downloaded, 'speed': speed,
+         'info_dict': {'format_id': format_id}, **extra}
+    if total is not None:
+        d['total_bytes'] = total
+    return d
+
+
+def test_single_file():
+    p = FetchProgress()
+    fields = p.update(tick('v.mp4', 250, 1000, speed=100))
+    assert fields['percent'] == pytest.approx(25)
+    assert fields['eta'] == 7
+    assert fields['components'] is None
+
+
+def test_merged_formats_sum_bytes_and_speed_and_weight_percent_by_size():
+    p = FetchProgress()
+    p.update(tick('v.f137.mp4', 400, 900, speed=300, format_id='137'))
+    fields = p.update(tick('a.f140.m4a', 100, 100, speed=50, format_id='140'))
+    assert fields['downloaded'] == 500 and fields['total'] == 1000
+    assert fields['speed'] == 350
+    assert fields['percent'] == pytest.approx(50)
+    assert fields['eta'] == 1
+    assert [(c['format_id'], c['percent']) for c in fields['components']] == [('137', 44.4), ('140', 100.0)]
+
+
+def test_finished_components_stop_counting_speed():
+    p = FetchProgress()
+    p.update(tick('v.mp4', 500, 1000, speed=300))
+    fields = p.update(tick('a.m4a', 100, 100, status='finished', speed=999))
+    assert fields['speed'] == 300
+
+
+def test_percent_never_moves_backwards():
+    p = FetchProgress()
+    # A fragmented download re-estimates its size upward as it goes
+    assert p.update(tick('v.mp4', 500, total_bytes_estimate=1000))['percent'] == pytest.approx(50)
+    assert p.update(tick('v.mp4', 600, total_bytes_estimate=2000))['percent'] == pytest.approx(50)
+    assert p.update(tick('v.mp4', 1800, total_bytes_estimate=2000))['percent'] == pytest.approx(90)
+
+
+def test_fragment_share_is_a_floor():
+    p = FetchProgress()
+    fields = p.update(tick('v.mp4', 10, total_bytes_estimate=1000, fragment_index=30, fragment_count=100))
+    assert fields['percent'] == pytest.approx(30)
+
+
+def test_unknown_sizes_average_fractions():
+    p = FetchProgress()
+    p.update(tick('a.m4a', 10))
+    fields = p.update(tick('v.mp4', 10, fragment_index=1, fragment_count=2))
+    assert fields['total'] == 0
+    assert fields['percent'] == pytest.approx(25)
+    assert fields['eta'] is None
+
+
+def test_no_size_information_reports_no_percent():
+    assert FetchProgress().update(tick('v.mp4', 10))['percent'] is None
+
+
+def test_expected_and_already_fetched_files_count():
+    p = FetchProgress()
+    p.expect('v.mp4', '137', 3000, done=True)  # left over from before a restart
+    p.expect('a.m4a', '140', 1000)
+    fields = p.update(tick('a.m4a', 500, 1000, speed=100, format_id='140'))
+    assert fields['downloaded'] == 3500
+    assert fields['percent'] == pytest.approx(87.5)
+    assert fields['eta'] == 5
+
+
+def test_reset_starts_over():
+    p = FetchProgress()
+    p.update(tick('v.mp4', 900, 1000))
+    p.reset()
+    fields = p.update(tick('fallback.mp4', 100, 1000))
+    assert fields['percent'] == pytest.approx(10)
+    assert fields['components'] is None
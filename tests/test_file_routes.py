@@ -0,0 +1,36 @@
+import pytest
+from fastapi.testclient import TestClient
+
+import web_app
+from executors import BulkheadTimeout
+
+client = TestClient(web_app.app)
+
+
+@pytest.fixture
+def finished_job(tmp_path, monkeypatch):
+    path = tmp_path / 'clip.mp4'
+    path.write_bytes(b'\x00media' * 50_000)
+    job = {'id': 'f1', 'status': 'finished', 'file': str(path), 'ext': 'mp4', 'created': 1}
+    monkeypatch.setitem(web_app.JOBS, 'f1', job)
+    return job, path
+
+
+def test_job_file_streams(finished_job):
+    _, path = finished_job
+    r = client.get('/api/job/f1/file')
+    assert r.status_code == 200
+    assert r.content == path.read_bytes()
+
+
+def test_job_file_busy_is_503_before_streaming(finished_job, monkeypatch):
+    async def saturated(path):
+        raise BulkheadTimeout('file_io: still queued')
+    monkeypatch.setattr(web_app, 'open_file', saturated)
+    assert client.get('/api/job/f1/file').status_code == 503
+
+
+def test_job_file_missing_is_404(finished_job):
+    _, path = finished_job
+    path.unlink()
+    assert client.get('/api/job/f1/file').status_code == 404
@@ -0,0 +1,107 @@
+import io
+
+import pytest
+
+yt_dlp = pytest.importorskip('yt_dlp')
+from yt_dlp.networking.common import Response  # noqa: E402
+from yt_dlp.networking.exceptions import HTTPError, IncompleteRead  # noqa: E402
+
+import fragments  # noqa: E402
+from fragments import ConnectionBudget, _GatedFragments, retry_after  # noqa: E402
+
+
+def http_error(status, **headers):
+    return HTTPError(Response(io.BytesIO(b''), 'https://cdn.example/frag', headers, status=status))
+
+
+class StubFD:
+    """Stands in for a yt-dlp FragmentFD: fails with the queued errors, then succeeds."""
+
+    def __init__(self, ydl, params):
+        self.params = params
+        self.errors = []
+        self.calls = 0
+
+    def _download_fragment(self, ctx, frag_url, info_dict, headers=None, request_data=None):
+        self.calls += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        ctx['fragment_filename_sanitized'] = 'frag'
+        return True
+
+    def filesize_or_none(self, name):
+        return 1000
+
+
+Gated = type('GatedStub', (_GatedFragments, StubFD), {})
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    slept = []
+    monkeypatch.setattr(fragments.FragmentGate, 'pause', lambda self, s: slept.append(s))
+    return slept
+
+
+def test_http_errors_are_retried_by_the_gate(no_backoff):
+    gate = ConnectionBudget(8).gate('job')
+    fd = Gated(None, {}, gate)
+    fd.errors = [http_error(503), IncompleteRead(10, 100)]
+    assert fd._download_fragment({}, 'u', {})
+    assert fd.calls == 3
+    assert gate.errors == 2 and gate.fragments == 3
+    assert gate.in_flight == 0 and gate.budget.in_use == 0
+    assert len(no_backoff) == 2
+
+
+def test_congestion_halves_the_limit_once_per_window(no_backoff):
+    gate = ConnectionBudget(32).gate('job')
+    gate.limit = 8
+    fd = Gated(None, {}, gate)
+    fd.errors = [http_error(429, **{'Retry-After': '3'}), http_error(403)]
+    assert fd._download_fragment({}, 'u', {})
+    assert gate.limit == 4  # the second refusal landed in the same window
+    assert gate.decreases == 1
+    assert no_backoff[0] == 3.0  # Retry-After beats the exponential backoff
+
+
+def test_exhausted_retries_raise_the_last_error(monkeypatch):
+    monkeypatch.setattr(fragments, 'FRAGMENT_RETRIES', 2)
+    fd = Gated(None, {}, ConnectionBudget(8).gate('job'))
+    fd.errors = [http_error(404) for _ in range(3)]
+    with pytest.raises(HTTPError):
+        fd._download_fragment({}, 'u', {})
+    assert fd.calls == 3
+
+
+def test_fixed_gates_ignore_congestion():
+    gate = ConnectionBudget(32).gate('job', ceiling=6)
+    gate.acquire()
+    gate.release(0, False, congested=True)
+    assert gate.limit == 6
+
+
+def test_retry_after():
+    assert retry_after(http_error(429, **{'Retry-After': '2.5'})) == 2.5
+    assert retry_after(http_error(429, **{'Retry-After': '3600'})) == fragments.RETRY_AFTER_MAX_S
+    assert retry_after(http_error(429, **{'Retry-After': 'Wed, 21 Oct 2015 07:28:00 GMT'})) == 0
+    assert retry_after(http_error(503)) == 0
+    assert retry_after(None) == 0
+
+
+def test_gated_downloader_disables_ytdlp_retries(monkeypatch):
+    from yt_dlp.downloader import hls
+
+    seen = {}
+
+    def fake_download(self, name, info):
+        seen.update(self.params)
+        return True
+
+    monkeypatch.setattr(hls.HlsFD, 'download', fake_download)
+    ydl = yt_dlp.YoutubeDL({'quiet': True, 'fragment_retries': 10, 'retries': 10})
+    info = {'url': 'https://cdn.example/a.m3u8', 'protocol': 'm3u8_native', 'http_headers': {}}
+    gate = ConnectionBudget(8).gate('job')
+    assert fragments.download(ydl, 'out.mp4', info, gate)
+    assert seen['fragment_retries'] == 0 and seen['retries'] == 0
+    assert seen['concurrent_fragment_downloads'] == gate.ceiling
@@ -0,0 +1,35 @@
+import asyncio
+import threading
+import time
+
+from web_app import JobChanges
+
+
+async def timed_wait(changes, notify, timeout=2.0):
+    """Seconds until a waiter is woken after `notify` runs on another thread."""
+    waiter = asyncio.create_task(changes.wait(timeout))
+    await asyncio.sleep(0.01)
+    started = time.monotonic()
+    threading.Thread(target=notify).start()
+    await waiter
+    return time.monotonic() - started
+
+
+def test_progress_wakes_are_coalesced():
+    async def run():
+        changes = JobChanges(interval=0.3)
+        first = await timed_wait(changes, lambda: changes.notify(coalesce=True))
+        # A burst of progress ticks right after a wake: one wake, one interval later
+        second = await timed_wait(changes, lambda: [changes.notify(coalesce=True) for _ in range(50)])
+        return first, second
+    first, second = asyncio.run(run())
+    assert first < 0.2
+    assert 0.2 < second < 1.0
+
+
+def test_transitions_wake_at_once():
+    async def run():
+        changes = JobChanges(interval=5)
+        await timed_wait(changes, lambda: changes.notify(coalesce=True))
+        return await timed_wait(changes, changes.notify)
+    assert asyncio.run(run()) < 0.2
@@ -0,0 +1,104 @@
+import json
+
+import journal
+from journal import JobJournal
+
+
+def job(job_id, version, status='downloading', **fields):
+    return {'id': job_id, 'version': version, 'status': status, 'created': version, **fields}
+
+
+def entries(n, status='queued'):
+    return [{'index': i, 'status': status, 'file': None} for i in range(1, n + 1)]
+
+
+def lines(path):
+    return [json.loads(line) for line in path.read_text().splitlines()]
+
+
+def test_latest_snapshot_wins_and_torn_lines_are_skipped(tmp_path):
+    j = JobJournal(tmp_path / 'jobs.jsonl')
+    j.append(job('a', 2, stage='fetch'))
+    j.append(job('a', 1, stage='queued'))  # written late by another thread
+    j.append(job('b', 3, status='finished'))
+    with open(j.path, 'a') as f:
+        f.write('{"id": "c", "vers')
+    jobs = j.load()
+    assert set(jobs) == {'a', 'b'}
+    assert jobs['a']['stage'] == 'fetch'
+    # load() compacted the file to one line per job
+    assert sorted(r['id'] for r in lines(j.path)) == ['a', 'b']
+
+
+def test_entry_records_replay_on_top_of_the_snapshot(tmp_path):
+    j = JobJournal(tmp_path / 'jobs.jsonl')
+    j.append(job('p', 10, entries=entries(3), entries_done=0))
+    j.append_entry('p', 12, {'index': 2, 'status': 'finished', 'file': 'two.mp4'}, entries_done=1)
+    j.append_entry('p', 11, {'index': 1, 'status': 'finished', 'file': 'one.mp4'}, entries_done=1)
+    j.append_entry('p', 9, {'index': 3, 'status': 'error', 'file': None}, entries_done=0)  # older than the snapshot
+    p = j.load()['p']
+    assert [e['status'] for e in p['entries']] == ['finished', 'finished', 'queued']
+    assert p['version'] == 12
+    assert p['entries_done'] == 1
+    # Compaction folds the entry records into the snapshot
+    assert [('entry' in r) for r in lines(j.path)] == [False]
+
+
+def test_newer_snapshot_supersedes_entry_records(tmp_path):
+    j = JobJournal(tmp_path / 'jobs.jsonl')
+    j.append(job('p', 1, entries=entries(2)))
+    j.append_entry('p', 2, {'index': 1, 'status': 'downloading', 'file': None}, entries_done=0)
+    j.append(job('p', 3, status='finished', entries=entries(2, 'finished'), entries_done=2))
+    p = j.load()['p']
+    assert p['status'] == 'finished'
+    assert [e['status'] for e in p['entries']] == ['finished', 'finished']
+
+
+def test_finished_jobs_beyond_keep_are_dropped(tmp_path):
+    j = JobJournal(tmp_path / 'jobs.jsonl', keep_finished=2)
+    for v in range(1, 5):
+        j.append(job(f"f{v}", v, status='finished'))
+    j.append(job('running', 5))
+    assert set(j.load()) == {'f3', 'f4', 'running'}
+
+
+def test_compacts_past_the_record_threshold(tmp_path, monkeypatch):
+    monkeypatch.setattr(journal, 'COMPACT_MIN_RECORDS', 20)
+    j = JobJournal(tmp_path / 'jobs.jsonl')
+    for v in range(1, 22):
+        j.append(job('a', v))
+    # The 21st record crossed the threshold: one snapshot left, counters reset
+    assert len(lines(j.path)) == 1
+    assert lines(j.path)[0]['version'] == 21
+    j.append(job('a', 22))
+    assert len(lines(j.path)) == 2
+
+
+def test_compacts_past_the_size_threshold(tmp_path):
+    j = JobJournal(tmp_path / 'jobs.jsonl', compact_bytes=2000)
+    for v in range(1, 40):
+        j.append(job('a', v, title='x' * 100))
+    assert j.path.stat().st_size <= 2000
+    assert j.load()['a']['version'] == 39
+
+
+def test_rewrite_replaces_history(tmp_path):
+    j = JobJournal(tmp_path / 'jobs.jsonl')
+    for v in range(1, 6):
+        j.append(job('a', v))
+    j.rewrite([job('a', 7), job('b', 8)])
+    assert [(r['id'], r['version']) for r in lines(j.path)] == [('a', 7), ('b', 8)]
+
+
+def test_update_entry_journals_only_the_entry(monkeypatch, tmp_path):
+    import web_app
+    monkeypatch.setattr(web_app, 'JOURNAL', JobJournal(tmp_path / 'jobs.jsonl'))
+    web_app.JOBS['pl'] = job('pl', 1, entries=entries(50), entries_done=0)
+    try:
+        web_app.update_entry('pl', 7, status='finished', file='seven.mp4')
+    finally:
+        del web_app.JOBS['pl']
+    (record,) = lines(tmp_path / 'jobs.jsonl')
+    assert 'entries' not in record
+    assert record['entry'] == {'index': 7, 'status': 'finished', 'file': 'seven.mp4'}
+    assert record['entries_done'] == 1
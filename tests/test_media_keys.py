@@ -0,0 +1,105 @@
+import pytest
+
+import media_keys
+from media_keys import MediaKey, filename_base, parse
+
+VID = 'dQw4w9WgXcQ'
+
+
+@pytest.mark.parametrize('url', [
+    f'https://www.youtube.com/watch?v={VID}',
+    f'http://m.youtube.com/watch?feature=share&v={VID}&si=abc123',
+    f'youtube.com/watch?v={VID}&t=42s#comments',
+    f'https://youtu.be/{VID}?si=tracking',
+    f'https://www.youtube.com/shorts/{VID}/',
+    f'https://www.youtube-nocookie.com/embed/{VID}',
+    f'  https://music.youtube.com/watch?v={VID}  ',
+    f'//YOUTUBE.COM:443/live/{VID}',
+])
+def test_youtube_spellings_share_one_key(url):
+    assert parse(url) == MediaKey('youtube', VID, 'video')
+
+
+def test_youtube_playlists_and_channels():
+    assert parse('https://www.youtube.com/playlist?list=PLabc_123-x&si=1') == \
+        MediaKey('youtube', 'PLabc_123-x', 'playlist')
+    assert parse('https://www.youtube.com/@SomeHandle/') == MediaKey('youtube', '@somehandle', 'channel')
+    cid = 'channel/UC' + 'a' * 21 + 'B'
+    assert parse(f'https://www.youtube.com/{cid}') == MediaKey('youtube', cid, 'channel')
+
+
+@pytest.mark.parametrize('url', [
+    'https://www.youtube.com/watch?v=short',
+    'https://www.youtube.com/watch?vv=' + VID,
+    'https://www.youtube.com/results?search_query=x',
+    'https://youtu.be/',
+])
+def test_youtube_unrecognized_paths_are_unknown(url):
+    assert parse(url) == MediaKey('youtube', None, 'unknown')
+
+
+def test_tiktok():
+    assert parse('https://www.tiktok.com/@user.name/video/7234567890123456789?is_from_webapp=1') == \
+        MediaKey('tiktok', '7234567890123456789', 'video')
+    assert parse('https://www.tiktok.com/@user/photo/7234567890123456789') == \
+        MediaKey('tiktok', '7234567890123456789', 'photo')
+    assert parse('https://www.tiktok.com/embed/v2/7234567890123456789') == \
+        MediaKey('tiktok', '7234567890123456789', 'video')
+    assert parse('https://m.tiktok.com/v/7234567890123456789.html') == \
+        MediaKey('tiktok', '7234567890123456789', 'video')
+    assert parse('https://www.tiktok.com/@Some.User') == MediaKey('tiktok', 'some.user', 'profile')
+    assert parse('https://vm.tiktok.com/ZMabc123/') == MediaKey('tiktok', 'ZMabc123', 'short_link')
+    assert parse('https://www.tiktok.com/t/ZTabc123/') == MediaKey('tiktok', 'ZTabc123', 'short_link')
+
+
+def test_instagram_posts_and_reels_share_a_key():
+    post = MediaKey('instagram', 'Cabc_12-x', 'post')
+    assert parse('https://www.instagram.com/p/Cabc_12-x/?igsh=xyz') == post
+    assert parse('https://instagram.com/reel/Cabc_12-x') == post
+    assert parse('https://www.instagram.com/someone/reels/Cabc_12-x/') == post
+    assert parse('https://www.instagram.com/stories/someone/3141592653589793/') == \
+        MediaKey('instagram', '3141592653589793', 'story')
+
+
+@pytest.mark.parametrize('url', ['', 'not a url', 'https://vimeo.com/12345', 'https://notyoutube.com/watch?v=' + VID])
+def test_other_hosts_are_not_handled(url):
+    assert parse(url) is None
+
+
+def test_key_and_resolved():
+    key = parse(f'https://youtu.be/{VID}')
+    assert key.key == f'youtube:video:{VID}'
+    assert key.resolved
+    assert not parse('https://vm.tiktok.com/ZMabc123/').resolved
+    assert not parse('https://www.youtube.com/results').resolved
+
+
+def test_filename_base():
+    assert filename_base(parse(f'https://youtu.be/{VID}')) == f'youtube_{VID}'
+    assert filename_base(None, 'https://example.com/a b?c') == 'https_example_com_a_b_c'
+    assert filename_base(None, '') == 'video'
+
+
+def test_resolve_follows_short_links_once(monkeypatch):
+    calls = []
+
+    class Hop:
+        headers = {'Location': 'https://www.tiktok.com/@u/video/7000000000000000001?_r=1'}
+
+    class Resp:
+        url = 'https://www.tiktok.com/@u/video/7000000000000000001?_r=1'
+        history = [Hop()]
+
+        def close(self):
+            pass
+
+    class Session:
+        def get(self, url, **kwargs):
+            calls.append(url)
+            return Resp()
+
+    monkeypatch.setattr(media_keys, 'SHORT_LINKS', media_keys.ShortLinkCache())
+    for _ in range(3):
+        key = media_keys.resolve('vm.tiktok.com/ZMresolve1/', session=Session())
+        assert key == MediaKey('tiktok', '7000000000000000001', 'video')
+    assert calls == ['https://vm.tiktok.com/ZMresolve1/']
@@ -0,0 +1,50 @@
+import time
+from concurrent.futures import Future
+
+import web_app
+
+
+def playlist_job(job_id, tmp_path):
+    outputs = []
+    for index in (1, 2):
+        out = tmp_path / f'{job_id}_{index:03d}.mp4'
+        out.write_bytes(b'x' * 10 * index)
+        outputs.append(out)
+    web_app.JOBS[job_id] = {
+        'id': job_id, 'status': 'downloading', 'stage': 'fetch', 'created': time.time(), 'version': 0,
+        'entries': [{'index': i, 'title': str(i), 'url': f'u{i}', 'status': 'processing', 'file': None,
+                     'ext': None, 'size': None, 'error': None} for i in (1, 2)],
+        'entries_done': 0,
+    }
+    return outputs
+
+
+def settle(job_id, index, output, outstanding, ok=True):
+    future = Future()
+    future.set_result({'ok': ok, 'error': None if ok else 'boom', 'started': 1.0, 'finished': 2.0})
+    task = {'op': 'remux', 'inputs': [], 'output': str(output)}
+    web_app.entry_settled(job_id, index, task, outstanding, job_id, future)
+
+
+def test_last_callback_finishes_playlist(tmp_path):
+    first, second = playlist_job('pl1', tmp_path)
+    outstanding = {'parts': 3}  # the fetch loop plus two ffmpeg tasks
+    settle('pl1', 1, first, outstanding)
+    # The fetch loop returns without waiting for the second task
+    web_app.playlist_part_done('pl1', outstanding, 'pl1')
+    assert web_app.JOBS['pl1']['status'] == 'downloading'
+    settle('pl1', 2, second, outstanding)
+    job = web_app.JOBS['pl1']
+    assert (job['status'], job['stage'], job['size']) == ('finished', 'done', 30)
+    assert outstanding['parts'] == 0
+
+
+def test_callbacks_before_the_fetch_loop_ends_do_not_finish(tmp_path):
+    first, second = playlist_job('pl2', tmp_path)
+    outstanding = {'parts': 3}
+    settle('pl2', 1, first, outstanding, ok=False)
+    settle('pl2', 2, second, outstanding, ok=False)
+    assert web_app.JOBS['pl2']['status'] == 'downloading'
+    web_app.playlist_part_done('pl2', outstanding, 'pl2')
+    job = web_app.JOBS['pl2']
+    assert (job['status'], job['error']) == ('error', 'No playlist entry could be downloaded')
@@ -0,0 +1,79 @@
+import postprocess
+import web_app
+
+
+def fetched(info: dict, *names: str) -> dict:
+    paths = []
+    for name in names:
+        path = web_app.DOWNLOAD_DIR / name
+        path.write_bytes(b'media')
+        paths.append(path)
+    return {'info': info, 'paths': paths, 'base': names[0].split('.')[0]}
+
+
+def test_plain_progressive_download_needs_no_fixup():
+    assert web_app.fixup_args({'ext': 'mp4', 'protocol': 'https', 'acodec': 'mp4a.40.2'}) is None
+
+
+def test_stretched_video_gets_aspect_ratio():
+    assert web_app.fixup_args({'ext': 'mp4', 'protocol': 'https', 'stretched_ratio': 1.5}) == ['-aspect', '1.500000']
+
+
+def test_dash_m4a_is_rewritten_as_mp4():
+    info = {'ext': 'm4a', 'container': 'm4a_dash', 'protocol': 'https', 'acodec': 'mp4a.40.2', 'vcodec': 'none'}
+    assert web_app.fixup_args(info) == ['-f', 'mp4']
+
+
+def test_hls_aac_gets_adts_bitstream_filter():
+    info = {'ext': 'mp4', 'protocol': 'm3u8_native', 'acodec': 'mp4a.40.2', 'vcodec': 'avc1'}
+    assert web_app.fixup_args(info) == ['-bsf:a', 'aac_adtstoasc']
+
+
+def test_merged_formats_always_carry_their_args():
+    info = {'requested_formats': [{'protocol': 'https', 'vcodec': 'avc1', 'acodec': 'none'},
+                                  {'protocol': 'https', 'vcodec': 'none', 'acodec': 'opus'}]}
+    assert web_app.fixup_args(info) == []
+
+
+def test_fixup_task_keeps_the_final_name(monkeypatch):
+    monkeypatch.setattr(web_app, 'FFMPEG_AVAILABLE', True)
+    info = {'ext': 'mp4', 'protocol': 'm3u8_native', 'acodec': 'mp4a.40.2', 'vcodec': 'avc1'}
+    task = web_app.plan_postprocess('best', fetched(info, 'hls1.mp4'))
+    assert task['op'] == 'fixup'
+    assert task['output'] == str(web_app.DOWNLOAD_DIR / 'hls1.mp4')
+    assert task['inputs'] == [str(web_app.DOWNLOAD_DIR / 'hls1.src.mp4')]
+    cmd = postprocess.build_command(task)
+    assert cmd[-3:] == ['-bsf:a', 'aac_adtstoasc', task['output']]
+
+
+def test_merge_task_passes_fixup_args():
+    info = {'stretched_ratio': 2, 'requested_formats': [
+        {'protocol': 'https', 'vcodec': 'avc1', 'acodec': 'none'},
+        {'protocol': 'https', 'vcodec': 'none', 'acodec': 'mp4a.40.2'}]}
+    task = web_app.plan_postprocess('best', fetched(info, 'm1.f1.mp4', 'm1.f2.m4a'))
+    assert task['op'] == 'merge'
+    assert postprocess.build_command(task)[-3:] == ['-aspect', '2.000000', str(web_app.DOWNLOAD_DIR / 'm1.mp4')]
+
+
+def test_audio_fast_in_its_own_container_is_not_remuxed(monkeypatch):
+    monkeypatch.setattr(web_app, 'FFMPEG_AVAILABLE', True)
+    info = {'ext': 'm4a', 'protocol': 'https', 'acodec': 'mp4a.40.2', 'vcodec': 'none'}
+    result = fetched(info, 'af1.m4a')
+    assert web_app.plan_postprocess('audio_fast', result) is None
+    assert result['paths'][0].exists()
+
+
+def test_audio_fast_dash_m4a_is_still_remuxed(monkeypatch):
+    monkeypatch.setattr(web_app, 'FFMPEG_AVAILABLE', True)
+    info = {'ext': 'm4a', 'container': 'm4a_dash', 'protocol': 'https', 'acodec': 'mp4a.40.2', 'vcodec': 'none'}
+    task = web_app.plan_postprocess('audio_fast', fetched(info, 'af2.m4a'))
+    assert task['op'] == 'remux_audio'
+    assert task['inputs'] == [str(web_app.DOWNLOAD_DIR / 'af2.src.m4a')]
+
+
+def test_audio_fast_webm_opus_is_remuxed_into_opus(monkeypatch):
+    monkeypatch.setattr(web_app, 'FFMPEG_AVAILABLE', True)
+    info = {'ext': 'webm', 'protocol': 'https', 'acodec': 'opus', 'vcodec': 'none'}
+    task = web_app.plan_postprocess('audio_fast', fetched(info, 'af3.webm'))
+    assert task == {'op': 'remux_audio', 'inputs': [str(web_app.DOWNLOAD_DIR / 'af3.webm')],
+                    'output': str(web_app.DOWNLOAD_DIR / 'af3.opus')}
@@ -0,0 +1,41 @@
+import asyncio
+
+import pytest
+
+yt_dlp = pytest.importorskip('yt_dlp')
+from yt_dlp.extractor.common import InfoExtractor  # noqa: E402
+
+import web_app  # noqa: E402
+
+
+def video(n):
+    return {'id': f'vid{n:08d}', 'title': f'Upload {n}', 'duration': 60 + n,
+            'thumbnail': f'https://i.stub.example/{n}.jpg',
+            'formats': [{'format_id': '18', 'url': f'https://stub.example/{n}.mp4',
+                         'ext': 'mp4', 'width': 640, 'height': 360}]}
+
+
+class StubTabIE(InfoExtractor):
+    """Behaves like YoutubeTabIE: a channel tab whose entries are a generator."""
+    _VALID_URL = r'https://stub\.example/@(?P<id>\w+)/videos'
+
+    def _real_extract(self, url):
+        return self.playlist_result((video(n) for n in range(3)), self._match_id(url), 'Stub channel')
+
+
+class StubYoutubeDL(yt_dlp.YoutubeDL):
+    def __init__(self, params=None):
+        super().__init__(params, auto_init=False)
+        self.add_info_extractor(StubTabIE())
+
+
+def test_channel_preview_with_generator_entries(monkeypatch):
+    monkeypatch.setattr(web_app.yt_dlp, 'YoutubeDL', StubYoutubeDL)
+    warmed = []
+    monkeypatch.setattr(web_app, 'warm_stream_cache', lambda *a: warmed.append(a))
+    meta = asyncio.run(web_app.get_ytdlp_info('https://stub.example/@someone/videos'))
+    assert meta is not None
+    assert meta['title'] == 'Upload 0'
+    assert meta['embed_url'] == 'https://www.youtube.com/embed/vid00000000'
+    assert meta['duration'] == 60
+    assert warmed == []  # Only single videos warm the stream cache
@@ -0,0 +1,37 @@
+import os
+
+from thumbs import ThumbnailCache
+
+
+def fill(cache, url, size, mtime):
+    key = cache.register(url).split('/')[-1].split('?')[0]
+    cache._data_path(key, None).write_bytes(b'x' * size)
+    cache._data_path(key, 320).write_bytes(b'x' * (size // 2))
+    for p in cache.dir.glob(f"{key}*"):
+        os.utime(p, (mtime, mtime))
+    return key
+
+
+def test_eviction_removes_whole_entries_least_recent_first(tmp_path):
+    cache = ThumbnailCache(tmp_path, max_bytes=10_000)
+    old = fill(cache, 'https://cdn.example/old.jpg', 4000, 1000)
+    new = fill(cache, 'https://cdn.example/new.jpg', 4000, 2000)
+    cache._evict()
+    names = {p.name for p in tmp_path.iterdir()}
+    assert not any(n.startswith(old) for n in names)
+    assert {f"{new}.img", f"{new}_w320.img", f"{new}.json"} <= names
+    assert old not in cache._urls
+
+
+def test_metadata_counts_toward_the_bound(tmp_path):
+    cache = ThumbnailCache(tmp_path, max_bytes=10_000)
+    key = fill(cache, 'https://cdn.example/a.jpg', 4000, 1000)
+    stats = cache.stats()
+    meta = cache._meta_path(key).stat().st_size
+    assert stats['entries'] == 1
+    assert stats['bytes'] == 4000 + 2000 + meta
+    # Only metadata, no image yet: still bounded
+    cache.max_bytes = 0
+    cache.register('https://cdn.example/b.jpg')
+    cache._evict()
+    assert list(tmp_path.iterdir()) == []
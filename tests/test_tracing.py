@@ -0,0 +1,96 @@
+import pytest
+
+from tracing import SpanRecorder
+
+
+def test_nested_spans_are_recorded_inside_each_other():
+    t = SpanRecorder()
+    with t.span('job1', 'fetch', selector='best'):
+        with t.span('job1', 'fragment', index=3):
+            pass
+    outer, inner = t.job_spans('job1')
+    assert (outer['name'], inner['name']) == ('fetch', 'fragment')
+    assert outer['start'] <= inner['start'] <= inner['end'] <= outer['end']
+    assert outer['args'] == {'selector': 'best'} and inner['args'] == {'index': 3}
+    assert outer['duration_s'] >= 0
+
+
+def test_failed_span_records_the_error():
+    t = SpanRecorder()
+    with pytest.raises(RuntimeError):
+        with t.span('job1', 'extract'):
+            raise RuntimeError('HTTP 429')
+    (span,) = t.job_spans('job1')
+    assert span['end'] is not None
+    assert span['args'] == {'error': 'HTTP 429'}
+
+
+def test_end_on_unknown_or_ended_spans_is_a_no_op():
+    t = SpanRecorder()
+    t.end(None)
+    assert t.start(None, 'no job') is None  # no job id: no-op span
+    span = t.start('job1', 'postprocess', 100.0)
+    t.end(span, 105.0, ok=True)
+    t.end(span, 200.0, ok=False)
+    (recorded,) = t.job_spans('job1')
+    assert recorded['end'] == 105.0 and recorded['duration_s'] == 5.0
+    assert recorded['args'] == {'ok': True}
+
+
+def test_open_spans_have_no_end():
+    t = SpanRecorder()
+    t.start('job1', 'fetch', 100.0)
+    (span,) = t.job_spans('job1')
+    assert span['end'] is None and span['duration_s'] is None
+    assert t.job_spans('unknown') == []
+
+
+def test_jobs_beyond_max_jobs_are_evicted_oldest_first():
+    t = SpanRecorder(max_jobs=2)
+    for job_id in ('a', 'b', 'c'):
+        t.record(job_id, 'queue_wait', 1.0, 2.0)
+    assert t.job_spans('a') == []
+    assert [len(t.job_spans(j)) for j in ('b', 'c')] == [1, 1]
+    # Adding spans to a kept job does not evict anything
+    t.record('b', 'fetch', 2.0, 3.0)
+    assert len(t.job_spans('b')) == 2 and len(t.job_spans('c')) == 1
+
+
+def test_ring_keeps_the_latest_spans():
+    t = SpanRecorder(max_spans=3)
+    for i in range(5):
+        t.record('job1', f"s{i}", float(i), i + 0.5)
+    names = [e['name'] for e in t.chrome_trace()['traceEvents'] if e['ph'] == 'X']
+    assert names == ['s2', 's3', 's4']
+
+
+def test_chrome_trace_window_and_fields():
+    t = SpanRecorder()
+    t.record('jobA', 'extract', 100.0, 101.5, entry=1)
+    t.record('jobA', 'fetch', 101.5, 110.0)
+    t.record('jobB', 'merge', 200.0, 200.0000001)
+    t.record('jobB', 'late', 300.0, 301.0)
+
+    trace = t.chrome_trace(since=101.0, until=250.0)
+    events = trace['traceEvents']
+    meta = [e for e in events if e['ph'] == 'M']
+    spans = [e for e in events if e['ph'] == 'X']
+    # Spans overlapping the window, including one that started before it
+    assert [e['name'] for e in spans] == ['extract', 'fetch', 'merge']
+    assert trace['otherData'] == {'since': 101.0, 'until': 250.0, 'spans': 3}
+    extract, fetch, merge = spans
+    assert extract['ts'] == 100_000_000 and extract['dur'] == 1_500_000
+    assert extract['args']['entry'] == 1 and extract['args']['job'] == 'jobA'
+    assert merge['dur'] == 1  # never zero, so viewers still draw it
+    # One lane (tid) per job, each named once by a metadata event
+    assert extract['tid'] == fetch['tid'] != merge['tid']
+    assert sorted(e['tid'] for e in meta) == sorted({extract['tid'], merge['tid']})
+    assert {e['args']['name'] for e in meta} == {'job jobA', 'job jobB'}
+
+
+def test_chrome_trace_marks_open_spans():
+    t = SpanRecorder()
+    t.start('job1', 'fetch', 100.0)
+    (event,) = [e for e in t.chrome_trace(since=50.0)['traceEvents'] if e['ph'] == 'X']
+    assert event['args']['open'] is True
+    assert event['dur'] > 0
@@ -0,0 +1,90 @@
+import io
+import os
+import zipfile
+
+import pytest
+
+from zipstream import ZipStream
+
+MTIME = 1_700_000_000
+
+
+def build(files, zs=None, chunk=7):
+    zs = zs or ZipStream()
+    out = io.BytesIO()
+    for name, data in files.items():
+        out.write(zs.begin_entry(name, len(data), MTIME))
+        for i in range(0, len(data), chunk):
+            out.write(zs.add(data[i:i + chunk]))
+        out.write(zs.end_entry())
+    out.write(zs.finish())
+    assert zs.offset == out.tell()
+    return out.getvalue()
+
+
+def check_round_trip(archive, files):
+    with zipfile.ZipFile(io.BytesIO(archive)) as zf:
+        assert zf.testzip() is None  # every CRC matches
+        assert zf.namelist() == list(files)
+        for name, data in files.items():
+            info = zf.getinfo(name)
+            assert info.compress_type == zipfile.ZIP_STORED
+            assert info.file_size == len(data)
+            assert zf.read(name) == data
+        return zf.infolist()
+
+
+FILES = {'01 - intro.mp4': os.urandom(1000), 'Überschrift – ✓.m4a': b'', 'sub/dir/c.bin': os.urandom(333)}
+
+
+def test_round_trip():
+    infos = check_round_trip(build(FILES), FILES)
+    assert infos[0].date_time[0] >= 2023
+    assert infos[1].flag_bits & 0x800  # UTF-8 names
+
+
+def test_zip64_entries_and_offsets():
+    # A low limit exercises the ZIP64 sizes, offsets and end records without 4 GiB of data
+    zs = ZipStream(zip64_limit=500)
+    archive = build(FILES, zs)
+    infos = check_round_trip(archive, FILES)
+    assert infos[0].extract_version == 45  # entry over the limit
+    assert infos[2].header_offset > 500  # offset over the limit, read from the extra field
+    assert b'PK\x06\x06' in archive and b'PK\x06\x07' in archive  # ZIP64 end record and locator
+
+
+def test_many_entries_use_the_zip64_count():
+    files = {f"{i:05d}.txt": b'x' for i in range(0xFFFF + 1)}
+    check_round_trip(build(files), files)
+
+
+def test_wrong_size_is_rejected():
+    zs = ZipStream()
+    zs.begin_entry('a', 10)
+    zs.add(b'short')
+    with pytest.raises(ValueError):
+        zs.end_entry()
+
+
+def test_entries_must_be_ended():
+    zs = ZipStream()
+    zs.begin_entry('a', 0)
+    with pytest.raises(RuntimeError):
+        zs.begin_entry('b', 0)
+    with pytest.raises(RuntimeError):
+        zs.finish()
+
+
+def test_abandoned_entry_is_left_out_of_a_valid_archive():
+    zs = ZipStream()
+    out = io.BytesIO()
+    out.write(zs.begin_entry('grew.mp4', 10, MTIME))
+    out.write(zs.add(b'0123456789abc'))
+    with pytest.raises(ValueError):
+        zs.end_entry()
+    out.write(zs.abandon_entry())
+    out.write(zs.begin_entry('ok.mp4', 3, MTIME))
+    out.write(zs.add(b'abc'))
+    out.write(zs.end_entry())
+    out.write(zs.finish())
+    check_round_trip(out.getvalue(), {'ok.mp4': b'abc'})
@@ -0,0 +1,198 @@
+"""On-disk thumbnail cache behind the /thumb/{key} proxy.
+
+Preview metadata hands the browser `/thumb/<key>` instead of the raw CDN URL.
+The first request fetches the image once, later requests are served from disk
+with an ETag. The key names the upstream URL, not the bytes, so browsers may
+keep a copy for REVALIDATE_AFTER and then revalidate it against the ETag.
+Entries older than REVALIDATE_AFTER are revalidated upstream with
+If-None-Match / If-Modified-Since; if the signed CDN URL has expired meanwhile
+we simply keep serving the copy we have.
+
+Methods touching the disk (register, get, stats) block; the app runs them on
+the FILE_IO bulkhead.
+"""
+import hashlib
+import io
+import json
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+import requests
+
+try:
+    from PIL import Image
+except ImportError:  # Downscaling is optional
+    Image = None
+
+MAX_BYTES = int(os.environ.get('MPD_THUMB_CACHE_MB', '200')) * 1024 * 1024
+REVALIDATE_AFTER = int(os.environ.get('MPD_THUMB_REVALIDATE_S', str(24 * 3600)))
+# Width of the preview card; only these widths may be requested to bound variants
+ALLOWED_WIDTHS = (320, 480, 640, 960)
+PREVIEW_WIDTH = int(os.environ.get('MPD_THUMB_WIDTH', '640'))
+
+
+class ThumbnailCache:
+    def __init__(self, directory: Path, max_bytes: int = MAX_BYTES, headers: Optional[dict] = None):
+        self.dir = Path(directory)
+        self.dir.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.headers = headers or {}
+        self.session = requests.Session()
+        self._lock = threading.Lock()
+        # Striped per-key locks so concurrent first requests fetch upstream only once
+        self._stripes = [threading.Lock() for _ in range(64)]
+        self._urls: Dict[str, str] = {}
+
+    @staticmethod
+    def key_for(url: str) -> str:
+        return hashlib.sha1(url.encode('utf-8')).hexdigest()[:24]
+
+    def register(self, url: Optional[str]) -> Optional[str]:
+        """Remember `url` and return the proxy path for it (None passes through)."""
+        if not url:
+            return None
+        key = self.key_for(url)
+        with self._lock:
+            self._urls[key] = url
+        meta = self._meta_path(key)
+        if not meta.exists():
+            # Persist the mapping so a restart can still resolve keys already handed out
+            meta.write_text(json.dumps({'url': url}))
+        return f"/thumb/{key}" + (f"?w={PREVIEW_WIDTH}" if Image is not None and PREVIEW_WIDTH else '')
+
+    def _meta_path(self, key: str) -> Path:
+        return self.dir / f"{key}.json"
+
+    def _data_path(self, key: str, width: Optional[int]) -> Path:
+        return self.dir / (f"{key}_w{width}.img" if width else f"{key}.img")
+
+    def _read_meta(self, key: str) -> dict:
+        try:
+            return json.loads(self._meta_path(key).read_text())
+        except (OSError, ValueError):
+            return {}
+
+    def get(self, key: str, width: Optional[int] = None) -> Optional[Tuple[Path, dict]]:
+        """Return (file, meta) for `key`, fetching/revalidating upstream as needed."""
+        if width not in ALLOWED_WIDTHS or Image is None:
+            width = None
+        with self._stripes[int(key[:4], 16) % len(self._stripes)]:
+            meta = self._read_meta(key)
+            url = meta.get('url') or self._urls.get(key)
+            if not url:
+                return None
+            original = self._data_path(key, None)
+            if not original.exists():
+                meta = self._fetch(key, url, meta)
+                if not meta:
+                    return None
+            elif time.time() - meta.get('fetched', 0) > REVALIDATE_AFTER:
+                meta = self._revalidate(key, url, meta)
+            path = original
+            if width:
+                path = self._variant(key, width, meta) or original
+        try:
+            os.utime(path)  # LRU clock
+        except OSError:
+            pass
+        if path != original:
+            meta = dict(meta, etag=f"{meta['etag']}-w{width}", content_type='image/jpeg')
+        return path, meta
+
+    def _fetch(self, key: str, url: str, meta: dict) -> Optional[dict]:
+        try:
+            r = self.session.get(url, headers=self.headers, timeout=10)
+        except Exception:
+            return None
+        if r.status_code != 200 or not r.content:
+            return None
+        return self._store(key, url, r)
+
+    def _revalidate(self, key: str, url: str, meta: dict) -> dict:
+        headers = dict(self.headers)
+        if meta.get('upstream_etag'):
+            headers['If-None-Match'] = meta['upstream_etag']
+        if meta.get('last_modified'):
+            headers['If-Modified-Since'] = meta['last_modified']
+        try:
+            r = self.session.get(url, headers=headers, timeout=10)
+        except Exception:
+            r = None
+        if r is not None and r.status_code == 200 and r.content:
+            return self._store(key, url, r)
+        # 304, expired signature or network trouble: keep what we have
+        meta['fetched'] = time.time()
+        self._meta_path(key).write_text(json.dumps(meta))
+        return meta
+
+    def _store(self, key: str, url: str, r: requests.Response) -> dict:
+        data = r.content
+        tmp = self._data_path(key, None).with_suffix('.tmp')
+        tmp.write_bytes(data)
+        os.replace(tmp, self._data_path(key, None))
+        for variant in self.dir.glob(f"{key}_w*.img"):
+            variant.unlink(missing_ok=True)
+        meta = {
+            'url': url,
+            'content_type': r.headers.get('Content-Type', 'image/jpeg').split(';')[0],
+            'etag': hashlib.sha1(data).hexdigest()[:20],
+            'upstream_etag': r.headers.get('ETag'),
+            'last_modified': r.headers.get('Last-Modified'),
+            'fetched': time.time(),
+        }
+        self._meta_path(key).write_text(json.dumps(meta))
+        self._evict()
+        return meta
+
+    def _variant(self, key: str, width: int, meta: dict) -> Optional[Path]:
+        path = self._data_path(key, width)
+        if path.exists():
+            return path
+        try:
+            with Image.open(self._data_path(key, None)) as im:
+                if im.width <= width:
+                    return None
+                im = im.convert('RGB')
+                im.thumbnail((width, width * 4))
+                buf = io.BytesIO()
+                im.save(buf, 'JPEG', quality=82, optimize=True, progressive=True)
+        except Exception:
+            return None
+        path.write_bytes(buf.getvalue())
+        return path
+
+    def _entries(self) -> Dict[str, list]:
+        """Cache files grouped by key: the image, its variants and its metadata."""
+        entries: Dict[str, list] = {}
+        for p in self.dir.iterdir():
+            if p.suffix not in ('.img', '.json'):
+                continue
+            try:
+                st = p.stat()
+            except FileNotFoundError:  # Evicted or replaced by another request meanwhile
+                continue
+            entries.setdefault(p.name[:24], []).append((st, p))
+        return entries
+
+    def _evict(self):
+        entries = self._entries()
+        total = sum(st.st_size for files in entries.values() for st, _ in files)
+        if total <= self.max_bytes:
+            return
+        # Least recently served (or registered) first; a key goes with all of its files
+        for key, files in sorted(entries.items(), key=lambda e: max(st.st_mtime for st, _ in e[1])):
+            if total <= self.max_bytes:
+                break
+            with self._lock:
+                self._urls.pop(key, None)
+            for st, p in files:
+                p.unlink(missing_ok=True)
+                total -= st.st_size
+
+    def stats(self) -> dict:
+        entries = self._entries()
+        return {'entries': len(entries), 'bytes': sum(st.st_size for files in entries.values() for st, _ in files),
+                'max_bytes': self.max_bytes, 'downscale': Image is not None}
@@ -1,19 +1,8 @@
 import requests
-import re
 
-def extract_video_id(url):
-    """Extract video ID from TikTok URL"""
-    patterns = [
-        r'/video/(\d+)',
-        r'vm\.tiktok\.com/([a-zA-Z0-9]+)',
-        r'vt\.tiktok\.com/([a-zA-Z0-9]+)'
-    ]
-    
-    for pattern in patterns:
-        match = re.search(pattern, url)
-        if match:
-            return match.group(1)
-    return None
+import media_keys
+import tiktok_core
+from tiktok_core import extract_video_id
 
 def get_tik_info(tik):
     url = f"https://api.tiktokv.com/aweme/v1/aweme/detail/?aweme_id={tik}"
@@ -21,7 +10,7 @@ def get_tik_info(tik):
         "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
     }
     
-    response = requests.get(url, headers=headers)
+    response = tiktok_core.get_session().get(url, headers=headers, timeout=15)
     
     if response.status_code == 200:
         data = response.json()
@@ -44,26 +33,35 @@ def download_tiktok_video_no_watermark():
     url = input("Enter TikTok video URL: ").strip()
     
     # Validate that it's a TikTok URL
-    if "tiktok.com" not in url:
+    if media_keys.platform_of(url) != 'tiktok':
         print("❌ Please enter a valid TikTok URL (must contain 'tiktok.com')")
         return
     
-    # List of alternative APIs to try
+    # List of alternative APIs to try (TikWM first, through the shared engine)
     apis = [
-        f"https://api.tikwm.com/v1/video/info?url={url}",
+        None,
         f"https://api.tiktokv.com/v1/download?url={url}",
         f"https://tikdownload.org/api/v1/download?url={url}"
     ]
-    
+    session = tiktok_core.get_session()
+
     for i, api_url in enumerate(apis, 1):
         try:
             print(f"Trying API {i}...")
-            response = requests.get(api_url, timeout=10)
-            
-            if response.status_code == 200:
+            if api_url is None:
+                data = tiktok_core.lookup(url, session, timeout=10)
+                if not data:
+                    print(f"API {i}: Video not found")
+                    continue
+                video_url = data['play']
+            else:
+                response = session.get(api_url, timeout=10)
+                if response.status_code != 200:
+                    print(f"API {i}: HTTP Error {response.status_code}")
+                    continue
                 data = response.json()
                 print(f"API {i} response received successfully")
-                
+
                 # Try different response formats from different APIs
                 video_url = None
                 if 'data' in data and 'url' in data['data']:
@@ -74,26 +72,26 @@ def download_tiktok_video_no_watermark():
                     video_url = data['video_url']
                 elif 'download_url' in data:
                     video_url = data['download_url']
-                
-                if video_url:
-                    print("Video URL (No Watermark):", video_url)
-                    
-                    try:
-                        with open("tiktok_video.mp4", "wb") as file:
-                            video_response = requests.get(video_url, timeout=30)
-                            file.write(video_response.content)
-                        print("Video downloaded successfully as tiktok_video.mp4")
-                        return
-                    except Exception as download_error:
-                        print(f"Failed to download video: {download_error}")
-                        continue
-                else:
-                    print(f"API {i}: Video URL not found in response")
+
+            if video_url:
+                print("Video URL (No Watermark):", video_url)
+
+                def progress(done, total):
+                    if total:
+                        print(f"\rProgress: {done / total * 100:5.1f}%", end='', flush=True)
+
+                try:
+                    # Streamed to disk in CHUNK_SIZE pieces; the video is never held in memory
+                    tiktok_core.download(video_url, "tiktok_video.mp4", session=session, progress=progress)
+                    print("\nVideo downloaded successfully as tiktok_video.mp4")
+                    return
+                except Exception as download_error:
+                    print(f"\nFailed to download video: {download_error}")
                     continue
             else:
-                print(f"API {i}: HTTP Error {response.status_code}")
+                print(f"API {i}: Video URL not found in response")
                 continue
-                
+
         except requests.exceptions.ConnectionError as e:
             print(f"API {i}: Connection failed - {e}")
             continue
@@ -106,7 +104,7 @@ def download_tiktok_video_no_watermark():
         except Exception as e:
             print(f"API {i}: Unexpected error - {e}")
             continue
-    
+
     print("\n❌ All APIs failed. This could be due to:")
     print("1. Network connectivity issues")
     print("2. TikTok URL format not supported")
@@ -128,7 +126,7 @@ if __name__ == "__main__":
         url_or_id = input("Enter TikTok video URL or ID: ").strip()
         
         # Try to extract ID from URL if it's a URL
-        if "tiktok.com" in url_or_id:
+        if media_keys.platform_of(url_or_id) == 'tiktok':
             video_id = extract_video_id(url_or_id)
             if video_id:
                 print(f"Extracted video ID: {video_id}")
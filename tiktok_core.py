@@ -0,0 +1,140 @@
+"""Shared TikTok engine: TikWM lookup, short-link resolution and streamed downloads.
+
+web_app.py, tiktok_downloader.py (CLI, batch mode, GUI queue) and tik.py all
+resolve and fetch TikTok videos through this module, so they share one pooled
+HTTP session (keep-alive to TikWM and the CDN instead of a new TLS handshake
+per request) and one streaming implementation that never holds a whole video
+in memory.
+
+Progress callbacks everywhere are `progress(downloaded_bytes, total_bytes)`;
+`total_bytes` is 0 when the server sends no Content-Length.
+"""
+import os
+import threading
+from typing import Callable, Iterator, Optional
+from urllib.parse import quote
+
+import requests
+
+import media_keys
+
+# Overridable so the load test (benchmarks/loadtest) can point it at a local stand-in
+TIKWM_API = os.environ.get('MPD_TIKWM_API', 'https://www.tikwm.com/api/')
+HEADERS = {"User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/128.0.0.0 Safari/537.36"}
+
+# Read/write buffer for video streams; larger buffers mean fewer syscalls per MB
+CHUNK_SIZE = int(os.environ.get('MPD_TIKTOK_CHUNK_KB', '256')) * 1024
+POOL_SIZE = int(os.environ.get('MPD_TIKTOK_POOL', '32'))
+
+ProgressCallback = Callable[[int, int], None]
+
+_session: Optional[requests.Session] = None
+_session_pool = 0
+_session_lock = threading.Lock()
+
+
+class DownloadCanceled(Exception):
+    """The caller's should_stop() turned true mid-download."""
+
+
+def get_session(min_pool: int = 0) -> requests.Session:
+    """The process-wide session; its connection pool grows to at least `min_pool`."""
+    global _session, _session_pool
+    with _session_lock:
+        if _session is None:
+            _session = requests.Session()
+            _session.headers.update(HEADERS)
+        size = max(POOL_SIZE, min_pool)
+        if size > _session_pool:
+            adapter = requests.adapters.HTTPAdapter(pool_connections=size, pool_maxsize=size)
+            _session.mount('https://', adapter)
+            _session.mount('http://', adapter)
+            _session_pool = size
+        return _session
+
+
+def resolve_short_link(url: str, session: Optional[requests.Session] = None, timeout: float = 10) -> Optional[str]:
+    """Follow a vm./vt./tiktok.com/t/ short link to the video id it points at (cached)."""
+    key = media_keys.parse(url)
+    if key is None or key.kind != 'short_link':
+        return None
+    key = media_keys.resolve(url, session or get_session(), timeout)
+    return key.id if key.platform == 'tiktok' and key.kind in ('video', 'photo') else None
+
+
+def extract_video_id(url: str, resolve: bool = True, session: Optional[requests.Session] = None) -> Optional[str]:
+    """Numeric video id of a TikTok URL; short links are resolved unless `resolve` is False."""
+    key = media_keys.parse(url)
+    if key is None or key.platform != 'tiktok':
+        return None
+    if key.kind in ('video', 'photo'):
+        return key.id
+    if key.kind == 'short_link' and resolve:
+        return resolve_short_link(url, session)
+    return None
+
+
+def lookup(url: str, session: Optional[requests.Session] = None, timeout: float = 12) -> Optional[dict]:
+    """Look up a TikTok URL on TikWM; returns its data dict (with 'play') or None."""
+    r = (session or get_session()).get(f"{TIKWM_API}?url={quote(url)}", timeout=timeout)
+    if r.status_code != 200:
+        return None
+    data = r.json()
+    if data.get('code') == 0 and (data.get('data') or {}).get('play'):
+        return data['data']
+    return None
+
+
+def open_stream(video_url: str, session: Optional[requests.Session] = None, timeout: float = 30) -> requests.Response:
+    """Start a streamed GET for a video; the caller checks status_code and iterates chunks."""
+    return (session or get_session()).get(video_url, stream=True, timeout=timeout)
+
+
+def iter_chunks(response: requests.Response, chunk_size: int = CHUNK_SIZE,
+                progress: Optional[ProgressCallback] = None,
+                should_stop: Optional[Callable[[], bool]] = None) -> Iterator[bytes]:
+    """Yield the body of `response` chunk by chunk, reporting progress; closes the response."""
+    total = int(response.headers.get('content-length') or 0)
+    done = 0
+    try:
+        for chunk in response.iter_content(chunk_size=chunk_size):
+            if should_stop and should_stop():
+                raise DownloadCanceled()
+            if chunk:
+                done += len(chunk)
+                if progress:
+                    progress(done, total)
+                yield chunk
+    finally:
+        response.close()
+
+
+def download(video_url: str, dest: str, chunk_size: int = CHUNK_SIZE,
+             session: Optional[requests.Session] = None,
+             progress: Optional[ProgressCallback] = None,
+             should_stop: Optional[Callable[[], bool]] = None,
+             timeout: float = 30) -> int:
+    """Stream `video_url` to `dest` (via `dest.part`). Returns bytes written.
+
+    Raises requests.HTTPError for non-200 responses and DownloadCanceled when
+    `should_stop()` turns true; the partial file is removed in both cases.
+    """
+    r = open_stream(video_url, session, timeout)
+    if r.status_code != 200:
+        r.close()
+        raise requests.HTTPError(f"HTTP {r.status_code}", response=r)
+    part = f"{dest}.part"
+    written = 0
+    try:
+        with open(part, 'wb', buffering=chunk_size) as f:
+            for chunk in iter_chunks(r, chunk_size, progress, should_stop):
+                f.write(chunk)
+                written += len(chunk)
+        os.replace(part, dest)
+    except BaseException:
+        try:
+            os.remove(part)
+        except OSError:
+            pass
+        raise
+    return written
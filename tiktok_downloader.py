@@ -1,9 +1,21 @@
 import requests
 import re
 import os
-from urllib.parse import quote
+import sys
+import glob
+import json
+import time
+import argparse
+import collections
+import itertools
+import queue
+from concurrent.futures import ThreadPoolExecutor
 import threading
 
+import media_keys
+import tiktok_core
+from tiktok_core import DownloadCanceled, extract_video_id
+
 try:
     import yt_dlp
 except ImportError:  # Lazy import notice
@@ -13,20 +25,6 @@ DOWNLOAD_DIR = os.path.join(os.getcwd(), "downloads")
 if not os.path.isdir(DOWNLOAD_DIR):
     os.makedirs(DOWNLOAD_DIR, exist_ok=True)
 
-def extract_video_id(url):
-    """Extract video ID from TikTok URL"""
-    patterns = [
-        r'/video/(\d+)',
-        r'vm\.tiktok\.com/([a-zA-Z0-9]+)',
-        r'vt\.tiktok\.com/([a-zA-Z0-9]+)'
-    ]
-    
-    for pattern in patterns:
-        match = re.search(pattern, url)
-        if match:
-            return match.group(1)
-    return None
-
 def test_connection():
     """Test internet connection"""
     try:
@@ -35,6 +33,10 @@ def test_connection():
     except:
         return False
 
+def fetch_tiktok_data(url, session=None):
+    """Look up a TikTok URL on TikWM; returns its data dict (with 'play') or None"""
+    return tiktok_core.lookup(url, session, timeout=15)
+
 def download_tiktok_video():
     """Download TikTok video with improved error handling"""
     
@@ -46,7 +48,7 @@ def download_tiktok_video():
     url = input("Enter TikTok video URL: ").strip()
     
     # Validate URL
-    if not url or "tiktok.com" not in url:
+    if media_keys.platform_of(url) != 'tiktok':
         print("❌ Please enter a valid TikTok URL")
         return
     
@@ -58,22 +60,16 @@ def download_tiktok_video():
     # Method 1: Try tikwm API
     try:
         print("📡 Trying TikWM API...")
-        api_url = f"https://www.tikwm.com/api/?url={quote(url)}"
-        response = requests.get(api_url, timeout=15)
-        
-        if response.status_code == 200:
-            data = response.json()
-            if data.get('code') == 0 and 'data' in data:
-                video_data = data['data']
-                if 'play' in video_data:
-                    video_url = video_data['play']
-                    title = video_data.get('title', 'tiktok_video')
-                    
-                    print(f"✅ Video found: {title}")
-                    success = download_video_file(video_url, title)
-                    if success:
-                        return
-        
+        video_data = fetch_tiktok_data(url)
+        if video_data:
+            video_url = video_data['play']
+            title = video_data.get('title', 'tiktok_video')
+
+            print(f"✅ Video found: {title}")
+            success = download_video_file(video_url, title)
+            if success:
+                return
+
         print("❌ TikWM API failed")
     except Exception as e:
         print(f"❌ TikWM API error: {str(e)}")
@@ -97,44 +93,48 @@ def download_tiktok_video():
         print("• Use browser extensions")
         print("• Try different TikTok downloader apps")
 
-def download_video_file(video_url, title):
-    """Download the actual video file"""
+def download_video_file(video_url, title, session=None, dest_dir=None, quiet=False,
+                        progress=None, should_stop=None):
+    """Download the actual video file. Returns the saved path, or False on failure.
+
+    `progress(downloaded, total)` is called per chunk; when `should_stop()` turns
+    true the partial file is removed and False is returned.
+    """
+    # Clean filename
+    filename = re.sub(r'[<>:"/\\|?*]', '', title)[:50] + '.mp4'
+    if dest_dir:
+        filename = os.path.join(dest_dir, filename)
+
+    def report(done, total):
+        if progress:
+            progress(done, total)
+        if total > 0 and not quiet:
+            print(f"\r📥 Progress: {done / total * 100:.1f}%", end='', flush=True)
+
     try:
-        print("⬇️ Downloading video...")
-        response = requests.get(video_url, timeout=30, stream=True)
-        
-        if response.status_code == 200:
-            # Clean filename
-            filename = re.sub(r'[<>:"/\\|?*]', '', title)[:50] + '.mp4'
-            
-            total_size = int(response.headers.get('content-length', 0))
-            downloaded = 0
-            
-            with open(filename, 'wb') as f:
-                for chunk in response.iter_content(chunk_size=8192):
-                    if chunk:
-                        f.write(chunk)
-                        downloaded += len(chunk)
-                        if total_size > 0:
-                            percent = (downloaded / total_size) * 100
-                            print(f"\r📥 Progress: {percent:.1f}%", end='', flush=True)
-            
-            print(f"\n✅ Video downloaded successfully: {filename}")
-            print(f"📂 File size: {os.path.getsize(filename) / (1024*1024):.1f} MB")
-            return True
-        else:
-            print(f"❌ Failed to download video (HTTP {response.status_code})")
-            return False
-            
+        if not quiet:
+            print("⬇️ Downloading video...")
+        tiktok_core.download(video_url, filename, session=session, progress=report, should_stop=should_stop)
+    except tiktok_core.DownloadCanceled:
+        return False
+    except requests.HTTPError as e:
+        if not quiet:
+            print(f"❌ Failed to download video ({e})")
+        return False
     except Exception as e:
-        print(f"❌ Download error: {str(e)}")
+        if not quiet:
+            print(f"❌ Download error: {str(e)}")
         return False
+    if not quiet:
+        print(f"\n✅ Video downloaded successfully: {filename}")
+        print(f"📂 File size: {os.path.getsize(filename) / (1024*1024):.1f} MB")
+    return filename
 
 def get_video_info():
     """Get TikTok video information"""
     url_or_id = input("Enter TikTok video URL or ID: ").strip()
     
-    if "tiktok.com" in url_or_id:
+    if media_keys.platform_of(url_or_id) == 'tiktok':
         video_id = extract_video_id(url_or_id)
         if video_id:
             print(f"📝 Extracted video ID: {video_id}")
@@ -168,39 +168,66 @@ def ytdlp_progress_hook(d):
     elif d.get('status') == 'finished':
         print("\n✅ Download finished. Processing...")
 
-def download_youtube():
-    if not ensure_yt_dlp():
-        return
-    if not test_connection():
-        print("❌ No internet connection.")
-        return
-    url = input("Enter YouTube video/playlist URL: ").strip()
-    if not url or not any(k in url for k in ["youtube.com", "youtu.be"]):
-        print("❌ Invalid YouTube URL.")
-        return
-    print("Select format:\n 1. Best video+audio (mp4)\n 2. Audio only (mp3)")
-    choice = input("Choose (1/2): ").strip()
-    is_audio = (choice == '2')
-    out_tmpl = os.path.join(DOWNLOAD_DIR, '%(title).60s.%(ext)s')
+YOUTUBE_MODES = ('best', '1080p', '720p', 'audio', 'audio_fast')
+
+def youtube_options(mode='best', progress_hooks=None):
+    """yt-dlp options for a YouTube download in the given mode (see YOUTUBE_MODES)"""
+    # The id keeps same-titled items (e.g. concurrent batch downloads) from overwriting each other
+    out_tmpl = os.path.join(DOWNLOAD_DIR, '%(title).60s [%(id)s].%(ext)s')
     ydl_opts = {
         'outtmpl': out_tmpl,
-        'progress_hooks': [ytdlp_progress_hook],
+        'progress_hooks': progress_hooks or [],
         'restrictfilenames': False,
         'ignoreerrors': True,
-        'nopart': True,
         'noprogress': False,
         'quiet': True,
         'no_warnings': True,
     }
-    if is_audio:
+    if mode == 'audio':
         ydl_opts.update({
             'format': 'bestaudio/best',
             'postprocessors': [
                 {'key': 'FFmpegExtractAudio', 'preferredcodec': 'mp3', 'preferredquality': '192'}
             ]
         })
+    elif mode == 'audio_fast':
+        # Stream-copy the native AAC/Opus track; only the container changes
+        ydl_opts.update({
+            'format': 'bestaudio[ext=m4a]/bestaudio[acodec=opus]/bestaudio/best',
+            'postprocessors': [{'key': 'FFmpegExtractAudio', 'preferredcodec': 'best'}]
+        })
+    elif mode in ('1080p', '720p'):
+        height = mode[:-1]
+        ydl_opts.update({'format': f'bv*[height<={height}]+ba/best[height<={height}]'})
     else:
         ydl_opts.update({'format': 'bv*+ba/best'})
+    return ydl_opts
+
+def instagram_options(progress_hooks=None):
+    return {
+        'outtmpl': os.path.join(DOWNLOAD_DIR, '%(title).60s [%(id)s].%(ext)s'),
+        'progress_hooks': progress_hooks or [],
+        'quiet': True,
+        'no_warnings': True,
+        'ignoreerrors': True,
+        'nocheckcertificate': True,
+        'format': 'mp4/best'
+    }
+
+def download_youtube():
+    if not ensure_yt_dlp():
+        return
+    if not test_connection():
+        print("❌ No internet connection.")
+        return
+    url = input("Enter YouTube video/playlist URL: ").strip()
+    if media_keys.platform_of(url) != 'youtube':
+        print("❌ Invalid YouTube URL.")
+        return
+    print("Select format:\n 1. Best video+audio (mp4)\n 2. Audio only (mp3)\n 3. Audio only (original codec, no re-encode)")
+    choice = input("Choose (1/2/3): ").strip()
+    mode = {'2': 'audio', '3': 'audio_fast'}.get(choice, 'best')
+    ydl_opts = youtube_options(mode, [ytdlp_progress_hook])
     try:
         print("🚀 Starting YouTube download...")
         with yt_dlp.YoutubeDL(ydl_opts) as ydl:
@@ -223,19 +250,11 @@ def download_instagram():
         print("❌ No internet connection.")
         return
     url = input("Enter Instagram post/reel URL: ").strip()
-    if not url or "instagram.com" not in url:
+    if media_keys.platform_of(url) != 'instagram':
         print("❌ Invalid Instagram URL.")
         return
     print("ℹ️ Public content only. Private / login-required media will fail.")
-    ydl_opts = {
-        'outtmpl': os.path.join(DOWNLOAD_DIR, '%(title).60s.%(ext)s'),
-        'progress_hooks': [ytdlp_progress_hook],
-        'quiet': True,
-        'no_warnings': True,
-        'ignoreerrors': True,
-        'nocheckcertificate': True,
-        'format': 'mp4/best'
-    }
+    ydl_opts = instagram_options([ytdlp_progress_hook])
     try:
         print("🚀 Starting Instagram download...")
         with yt_dlp.YoutubeDL(ydl_opts) as ydl:
@@ -247,9 +266,279 @@ def download_instagram():
     except Exception as e:
         print(f"❌ Instagram download failed: {e}")
 
+# BATCH (HEADLESS) MODE
+
+def read_url_list(source):
+    """Read URLs from a file path or '-' (stdin); skips blanks, '#' comments and duplicates"""
+    stream = sys.stdin if source == '-' else open(source, encoding='utf-8')
+    try:
+        seen = set()
+        urls = []
+        for line in stream:
+            url = line.strip()
+            if url and not url.startswith('#') and url not in seen:
+                seen.add(url)
+                urls.append(url)
+        return urls
+    finally:
+        if stream is not sys.stdin:
+            stream.close()
+
+class BatchManifest:
+    """Append-only JSON lines log of batch results; completed URLs are skipped on re-run"""
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.completed = set()
+        if os.path.exists(path):
+            with open(path, encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue  # torn last line from an interrupted run
+                    if entry.get('status') == 'done':
+                        self.completed.add(entry.get('url'))
+                    else:
+                        self.completed.discard(entry.get('url'))
+
+    def record(self, **entry):
+        entry['ts'] = time.time()
+        with self.lock:
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(entry) + '\n')
+                f.flush()
+                os.fsync(f.fileno())
+
+def ytdlp_written_bytes(info):
+    """Total size of the files yt-dlp wrote for `info` (video or playlist)"""
+    entries = info.get('entries') if info.get('_type') == 'playlist' else [info]
+    total = 0
+    for entry in entries or []:
+        for d in (entry or {}).get('requested_downloads') or []:
+            path = d.get('filepath')
+            if path and os.path.exists(path):
+                total += os.path.getsize(path)
+    return total
+
+def remove_partials(paths):
+    """Delete what a canceled yt-dlp download left behind.
+
+    `paths` are the .part files its hooks reported; besides them this removes
+    their fragments and resume state, and formats that already completed
+    (e.g. the video track when the audio track was canceled).
+    """
+    for path in paths:
+        base = path[:-len('.part')] if path.endswith('.part') else path
+        for leftover in {path, base, base + '.ytdl', *glob.glob(glob.escape(path) + '-Frag*')}:
+            try:
+                os.remove(leftover)
+            except OSError:
+                pass
+
+def download_url(url, session=None, youtube_mode='best', progress=None, should_stop=None):
+    """Download one URL without any prompts. Returns (file, bytes); raises on failure.
+
+    Shared by batch mode and the GUI queue. `progress(downloaded, total, title)`
+    reports byte progress; `should_stop()` cancels (DownloadCanceled is raised).
+    """
+    platform = media_keys.platform_of(url)
+    if platform == 'tiktok':
+        data = fetch_tiktok_data(url, session)
+        if not data:
+            raise RuntimeError('TikWM lookup failed')
+        # Video id keeps same-titled clips from overwriting each other
+        title = f"{(data.get('title') or 'tiktok_video')[:40]}_{data.get('id') or extract_video_id(url) or ''}"
+        if progress:
+            progress(0, data.get('size') or 0, data.get('title'))
+        path = download_video_file(data['play'], title, session=session, dest_dir=DOWNLOAD_DIR, quiet=True,
+                                   progress=progress and (lambda done, total: progress(done, total, None)),
+                                   should_stop=should_stop)
+        if should_stop and should_stop():
+            raise DownloadCanceled()
+        if not path:
+            raise RuntimeError('Video download failed')
+        return path, os.path.getsize(path)
+    if not ensure_yt_dlp():
+        raise RuntimeError('yt-dlp not installed')
+
+    partials = set()
+
+    def hook(d):
+        if d.get('tmpfilename'):
+            partials.add(d['tmpfilename'])
+        if should_stop and should_stop():
+            raise DownloadCanceled()
+        if progress and d.get('status') in ('downloading', 'finished'):
+            total = d.get('total_bytes') or d.get('total_bytes_estimate') or 0
+            done = d.get('downloaded_bytes') or total
+            progress(done, total, (d.get('info_dict') or {}).get('title'))
+
+    if platform == 'youtube':
+        opts = youtube_options(youtube_mode, [hook])
+    elif platform == 'instagram':
+        opts = instagram_options([hook])
+    else:
+        raise RuntimeError('Unsupported URL')
+    opts.update({'noprogress': True, 'ignoreerrors': False})
+    try:
+        with yt_dlp.YoutubeDL(opts) as ydl:
+            info = ydl.extract_info(url, download=True)
+    except Exception:
+        # yt-dlp wraps exceptions raised from hooks; the flag is the reliable signal
+        if should_stop and should_stop():
+            remove_partials(partials)
+            raise DownloadCanceled()
+        raise
+    if not info:
+        raise RuntimeError('Nothing downloaded')
+    files = [d.get('filepath') for d in info.get('requested_downloads') or []]
+    return (files[0] if files else None), ytdlp_written_bytes(info)
+
+def run_batch(urls, concurrency=4, manifest_path=None, youtube_mode='best'):
+    """Download `urls` concurrently; returns the number of failures"""
+    manifest = BatchManifest(manifest_path or os.path.join(DOWNLOAD_DIR, 'batch_manifest.jsonl'))
+    pending = [u for u in urls if u not in manifest.completed]
+    skipped = len(urls) - len(pending)
+    print(f"📋 {len(urls)} URLs, {skipped} already done, {len(pending)} to download (concurrency {concurrency})")
+    session = tiktok_core.get_session(concurrency)
+    counts = {'done': 0, 'failed': 0, 'bytes': 0}
+    counts_lock = threading.Lock()
+    started = time.time()
+
+    def work(url):
+        t0 = time.time()
+        try:
+            path, size = download_url(url, session, youtube_mode)
+            manifest.record(url=url, status='done', file=path, bytes=size, elapsed=round(time.time() - t0, 3))
+            return url, True, size, None
+        except Exception as e:
+            manifest.record(url=url, status='failed', error=str(e), elapsed=round(time.time() - t0, 3))
+            return url, False, 0, str(e)
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for url, ok, size, error in pool.map(work, pending):
+            with counts_lock:
+                counts['done' if ok else 'failed'] += 1
+                counts['bytes'] += size
+                n = counts['done'] + counts['failed']
+            if ok:
+                print(f"[{n}/{len(pending)}] ✅ {url} ({size / (1024*1024):.1f} MB)")
+            else:
+                print(f"[{n}/{len(pending)}] ❌ {url}: {error}")
+
+    elapsed = max(time.time() - started, 1e-6)
+    print(f"\n📊 Done: {counts['done']}  Failed: {counts['failed']}  Skipped: {skipped}  in {elapsed:.1f}s")
+    print(f"📈 Throughput: {counts['bytes'] / (1024*1024) / elapsed:.2f} MB/s, "
+          f"{counts['done'] / elapsed * 60:.1f} items/min")
+    return counts['failed']
+
 # GUI SUPPORT
 
-def launch_gui():
+# How often the GUI drains worker events; progress is coalesced per item in between
+UI_REFRESH_MS = 100
+# Minimum seconds between progress events posted for one item
+PROGRESS_INTERVAL = 0.25
+
+def detect_platform(url):
+    platform = media_keys.platform_of(url)
+    return media_keys.PLATFORM_NAMES.get(platform) if platform else None
+
+class DownloadQueue:
+    """Bounded-concurrency download queue with no Tk dependency.
+
+    Workers never touch widgets: every state change is put on `events` as
+    (item_id, fields) and the GUI applies them from its own thread.
+    """
+
+    def __init__(self, concurrency=3):
+        self.concurrency = max(1, concurrency)
+        self.session = tiktok_core.get_session()
+        self.events = queue.Queue()
+        self.items = {}
+        self._pending = collections.deque()
+        self._active = 0
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def add(self, url, youtube_mode='best'):
+        item_id = next(self._ids)
+        item = {'id': item_id, 'url': url, 'mode': youtube_mode, 'status': 'Queued',
+                'cancel': threading.Event()}
+        with self._lock:
+            self.items[item_id] = item
+            self._pending.append(item_id)
+        self._post(item_id, status='Queued', name=url, platform=detect_platform(url) or '?')
+        self._pump()
+        return item_id
+
+    def cancel(self, item_id):
+        with self._lock:
+            item = self.items.get(item_id)
+            if not item or item['status'] in ('Done', 'Failed', 'Canceled'):
+                return
+            item['cancel'].set()
+            if item_id in self._pending:
+                self._pending.remove(item_id)
+                item['status'] = 'Canceled'
+            else:
+                item['status'] = 'Canceling'
+        self._post(item_id, status=item['status'])
+
+    def set_concurrency(self, n):
+        self.concurrency = max(1, int(n))
+        self._pump()
+
+    def counts(self):
+        with self._lock:
+            return {'active': self._active, 'queued': len(self._pending), 'total': len(self.items)}
+
+    def _post(self, item_id, **fields):
+        self.events.put((item_id, fields))
+
+    def _pump(self):
+        with self._lock:
+            while self._active < self.concurrency and self._pending:
+                item = self.items[self._pending.popleft()]
+                item['status'] = 'Starting'
+                self._active += 1
+                threading.Thread(target=self._run, args=(item,), daemon=True).start()
+
+    def _run(self, item):
+        item_id = item['id']
+        last = [0.0]
+        self._post(item_id, status='Starting')
+
+        def progress(done, total, title):
+            now = time.monotonic()
+            if title:
+                self._post(item_id, name=title)
+            if now - last[0] < PROGRESS_INTERVAL and (not total or done < total):
+                return
+            last[0] = now
+            pct = f"{done / total * 100:5.1f}%" if total else ''
+            self._post(item_id, status='Downloading', progress=pct,
+                       size=f"{(total or done) / (1024*1024):.1f} MB")
+
+        try:
+            if not detect_platform(item['url']):
+                raise RuntimeError('Unsupported URL')
+            path, size = download_url(item['url'], self.session, item['mode'],
+                                      progress, item['cancel'].is_set)
+            status, fields = 'Done', {'progress': '100%', 'size': f"{size / (1024*1024):.1f} MB",
+                                      'detail': path or ''}
+        except DownloadCanceled:
+            status, fields = 'Canceled', {}
+        except Exception as e:
+            status, fields = ('Canceled', {}) if item['cancel'].is_set() else ('Failed', {'detail': str(e)})
+        with self._lock:
+            item['status'] = status
+            self._active -= 1
+        self._post(item_id, status=status, **fields)
+        self._pump()
+
+def launch_gui(concurrency=3):
     """Launch a Tkinter based GUI for multi-platform downloading."""
     try:
         import tkinter as tk
@@ -262,7 +551,7 @@ def launch_gui():
 
     root = tk.Tk()
     root.title("Multi Platform Downloader")
-    root.geometry("760x540")
+    root.geometry("860x580")
 
     style = ttk.Style()
     try:
@@ -270,209 +559,120 @@ def launch_gui():
     except Exception:
         pass
 
+    dq = DownloadQueue(concurrency)
+
     notebook = ttk.Notebook(root)
     notebook.pack(fill='both', expand=True, padx=6, pady=6)
 
-    # Shared log widget
-    def make_log(parent):
-        text = tk.Text(parent, height=12, wrap='word', bg='#1e1e1e', fg='#dcdcdc')
-        text.configure(font=('Consolas', 9))
-        text.pack(fill='both', expand=True, padx=4, pady=4)
-        return text
-
-    def append(log_widget, msg):
-        log_widget.after(0, lambda: (log_widget.insert('end', msg + '\n'), log_widget.see('end')))
-
-    # ---- TikTok TAB ----
-    tiktok_frame = ttk.Frame(notebook)
-    notebook.add(tiktok_frame, text='TikTok')
-
-    tk.Label(tiktok_frame, text="TikTok Video URL:").pack(anchor='w', padx=6, pady=(6,2))
-    tiktok_url_var = tk.StringVar()
-    tk.Entry(tiktok_frame, textvariable=tiktok_url_var, width=90).pack(anchor='w', padx=6)
-    tiktok_status = tk.StringVar(value='Idle')
-    tk.Label(tiktok_frame, textvariable=tiktok_status, foreground='#888').pack(anchor='w', padx=6, pady=4)
-    tiktok_log = make_log(tiktok_frame)
-
-    def tiktok_worker(url):
-        append(tiktok_log, f"▶ Starting TikTok download: {url}")
-        # Reuse existing logic but adapted
-        if not url or 'tiktok.com' not in url:
-            append(tiktok_log, '❌ Invalid TikTok URL')
-            tiktok_status.set('Error')
-            return
-        api_url = f"https://www.tikwm.com/api/?url={quote(url)}"
-        try:
-            r = requests.get(api_url, timeout=15)
-            if r.status_code == 200:
-                j = r.json()
-                data = j.get('data') or {}
-                play = data.get('play')
-                title = data.get('title','tiktok_video')
-                if play:
-                    append(tiktok_log, f"✅ Found: {title}")
-                    ok = download_video_file(play, title)
-                    if ok:
-                        append(tiktok_log, '✅ Download complete')
-                        tiktok_status.set('Done')
-                        return
-                append(tiktok_log, '❌ Video URL not in response')
-            else:
-                append(tiktok_log, f"❌ HTTP {r.status_code}")
-        except Exception as e:
-            append(tiktok_log, f"❌ Error: {e}")
-        tiktok_status.set('Failed')
-
-    def start_tiktok():
-        if not test_connection():
-            messagebox.showerror('Network', 'No internet connection.')
-            return
-        tiktok_status.set('Working...')
-        threading.Thread(target=tiktok_worker, args=(tiktok_url_var.get().strip(),), daemon=True).start()
-
-    ttk.Button(tiktok_frame, text='Download TikTok', command=start_tiktok).pack(padx=6, pady=6, anchor='w')
-
-    # ---- YouTube TAB ----
-    youtube_frame = ttk.Frame(notebook)
-    notebook.add(youtube_frame, text='YouTube')
+    # ---- Downloads TAB ----
+    dl_frame = ttk.Frame(notebook)
+    notebook.add(dl_frame, text='Downloads')
 
-    yt_url_var = tk.StringVar()
-    tk.Label(youtube_frame, text="YouTube URL (video / playlist):").pack(anchor='w', padx=6, pady=(6,2))
-    tk.Entry(youtube_frame, textvariable=yt_url_var, width=90).pack(anchor='w', padx=6)
+    tk.Label(dl_frame, text="TikTok / YouTube / Instagram URLs (one per line):").pack(anchor='w', padx=6, pady=(6,2))
+    urls_text = tk.Text(dl_frame, height=4, wrap='none')
+    urls_text.pack(fill='x', padx=6)
 
-    tk.Label(youtube_frame, text="Format:").pack(anchor='w', padx=6, pady=(6,2))
+    controls = ttk.Frame(dl_frame)
+    controls.pack(fill='x', padx=6, pady=6)
+    tk.Label(controls, text="YouTube format:").pack(side='left')
     yt_format_var = tk.StringVar(value='Best (<=1080p)')
-    yt_formats = ['Best (<=1080p)', '720p', 'Audio MP3']
-    ttk.Combobox(youtube_frame, values=yt_formats, textvariable=yt_format_var, state='readonly', width=20).pack(anchor='w', padx=6)
-
-    yt_status = tk.StringVar(value='Idle')
-    tk.Label(youtube_frame, textvariable=yt_status, foreground='#888').pack(anchor='w', padx=6, pady=4)
-    yt_log = make_log(youtube_frame)
-
-    def youtube_worker(url, fmt_choice):
-        append(yt_log, f"▶ Starting YouTube download: {url}")
-        if not ensure_yt_dlp():
-            append(yt_log, '❌ yt-dlp not installed')
-            yt_status.set('Missing yt-dlp')
-            return
-        if not url or not any(k in url for k in ['youtube.com','youtu.be']):
-            append(yt_log, '❌ Invalid YouTube URL')
-            yt_status.set('Error')
-            return
-        import yt_dlp
-        out_tmpl = os.path.join(DOWNLOAD_DIR, '%(title).60s.%(ext)s')
-        base_opts = {
-            'outtmpl': out_tmpl,
-            'progress_hooks': [lambda d: yt_progress(d)],
-            'quiet': True,
-            'no_warnings': True,
-            'ignoreerrors': True,
-            'restrictfilenames': False,
-            'noprogress': False,
-        }
-        if fmt_choice.startswith('Best'):
-            base_opts['format'] = 'bv*[height<=1080]+ba/best[height<=1080]'
-        elif fmt_choice == '720p':
-            base_opts['format'] = 'bv*[height<=720]+ba/best[height<=720]'
-        else:  # Audio MP3
-            base_opts['format'] = 'bestaudio/best'
-            base_opts['postprocessors'] = [{
-                'key': 'FFmpegExtractAudio', 'preferredcodec': 'mp3', 'preferredquality': '192'
-            }]
+    yt_formats = {'Best (<=1080p)': '1080p', '720p': '720p', 'Audio MP3': 'audio',
+                  'Audio (original, no re-encode)': 'audio_fast'}
+    ttk.Combobox(controls, values=list(yt_formats), textvariable=yt_format_var,
+                 state='readonly', width=28).pack(side='left', padx=(4, 12))
+    tk.Label(controls, text="Parallel:").pack(side='left')
+    concurrency_var = tk.IntVar(value=dq.concurrency)
+    tk.Spinbox(controls, from_=1, to=16, width=4, textvariable=concurrency_var).pack(side='left', padx=4)
+
+    def concurrency_changed(*_):
+        # Arrows and typed values alike; ignore the field while it is empty or half typed
         try:
-            with yt_dlp.YoutubeDL(base_opts) as ydl:
-                info = ydl.extract_info(url, download=True)
-            if info:
-                if isinstance(info, dict) and info.get('_type') == 'playlist':
-                    append(yt_log, f"✅ Playlist processed. Items: {len(info.get('entries') or [])}")
-                else:
-                    append(yt_log, '✅ Download complete')
-                yt_status.set('Done')
-            else:
-                append(yt_log, '❌ Nothing downloaded')
-                yt_status.set('Failed')
-        except Exception as e:
-            append(yt_log, f"❌ Error: {e}")
-            yt_status.set('Failed')
-
-    def yt_progress(d):
-        if d.get('status') == 'downloading':
-            total = d.get('total_bytes') or d.get('total_bytes_estimate') or 0
-            done = d.get('downloaded_bytes', 0)
-            pct = (done/total*100) if total else 0
-            yt_status.set(f'Downloading {pct:4.1f}%')
-        elif d.get('status') == 'finished':
-            yt_status.set('Processing...')
-
-    def start_youtube():
-        if not test_connection():
-            messagebox.showerror('Network', 'No internet connection.')
+            n = concurrency_var.get()
+        except tk.TclError:
             return
-        yt_status.set('Starting...')
-        threading.Thread(target=youtube_worker, args=(yt_url_var.get().strip(), yt_format_var.get()), daemon=True).start()
-
-    ttk.Button(youtube_frame, text='Download YouTube', command=start_youtube).pack(anchor='w', padx=6, pady=6)
-
-    # ---- Instagram TAB ----
-    insta_frame = ttk.Frame(notebook)
-    notebook.add(insta_frame, text='Instagram')
-
-    insta_url_var = tk.StringVar()
-    tk.Label(insta_frame, text="Instagram Reel/Post URL:").pack(anchor='w', padx=6, pady=(6,2))
-    tk.Entry(insta_frame, textvariable=insta_url_var, width=90).pack(anchor='w', padx=6)
-    insta_status = tk.StringVar(value='Idle')
-    tk.Label(insta_frame, textvariable=insta_status, foreground='#888').pack(anchor='w', padx=6, pady=4)
-    insta_log = make_log(insta_frame)
-
-    def insta_worker(url):
-        append(insta_log, f"▶ Starting Instagram download: {url}")
-        if not ensure_yt_dlp():
-            append(insta_log, '❌ yt-dlp not installed')
-            insta_status.set('Missing yt-dlp')
-            return
-        if 'instagram.com' not in url:
-            append(insta_log, '❌ Invalid Instagram URL')
-            insta_status.set('Error')
-            return
-        import yt_dlp
-        opts = {
-            'outtmpl': os.path.join(DOWNLOAD_DIR, '%(title).60s.%(ext)s'),
-            'quiet': True,
-            'no_warnings': True,
-            'ignoreerrors': True,
-            'progress_hooks': [lambda d: insta_progress(d)],
-            'format': 'mp4/best'
-        }
-        try:
-            with yt_dlp.YoutubeDL(opts) as ydl:
-                info = ydl.extract_info(url, download=True)
-            if info:
-                append(insta_log, '✅ Download complete')
-                insta_status.set('Done')
-            else:
-                append(insta_log, '❌ Nothing downloaded')
-                insta_status.set('Failed')
-        except Exception as e:
-            append(insta_log, f"❌ Error: {e}")
-            insta_status.set('Failed')
+        if 1 <= n <= 16:
+            dq.set_concurrency(n)
 
-    def insta_progress(d):
-        if d.get('status') == 'downloading':
-            total = d.get('total_bytes') or d.get('total_bytes_estimate') or 0
-            done = d.get('downloaded_bytes', 0)
-            pct = (done/total*100) if total else 0
-            insta_status.set(f'Downloading {pct:4.1f}%')
-        elif d.get('status') == 'finished':
-            insta_status.set('Processing...')
-
-    def start_insta():
-        if not test_connection():
-            messagebox.showerror('Network', 'No internet connection.')
-            return
-        insta_status.set('Starting...')
-        threading.Thread(target=insta_worker, args=(insta_url_var.get().strip(),), daemon=True).start()
+    concurrency_var.trace_add('write', concurrency_changed)
 
-    ttk.Button(insta_frame, text='Download Instagram', command=start_insta).pack(anchor='w', padx=6, pady=6)
+    def add_urls():
+        urls = [u.strip() for u in urls_text.get('1.0', 'end').splitlines() if u.strip()]
+        bad = [u for u in urls if not detect_platform(u)]
+        if bad:
+            messagebox.showerror('Unsupported URL', '\n'.join(bad[:5]))
+            return
+        for url in urls:
+            dq.add(url, yt_formats[yt_format_var.get()])
+        urls_text.delete('1.0', 'end')
+
+    ttk.Button(controls, text='Add to queue', command=add_urls).pack(side='left', padx=12)
+
+    columns = ('name', 'platform', 'status', 'progress', 'size')
+    tree = ttk.Treeview(dl_frame, columns=columns, show='headings', selectmode='extended')
+    for col, width in zip(columns, (380, 80, 90, 70, 80)):
+        tree.heading(col, text=col.title())
+        tree.column(col, width=width, anchor='w' if col == 'name' else 'center')
+    tree.pack(fill='both', expand=True, padx=6)
+
+    actions = ttk.Frame(dl_frame)
+    actions.pack(fill='x', padx=6, pady=6)
+    summary_var = tk.StringVar(value='Idle')
+
+    def cancel_selected():
+        for iid in tree.selection():
+            dq.cancel(int(iid))
+
+    def cancel_all():
+        for item_id in list(dq.items):
+            dq.cancel(item_id)
+
+    def clear_finished():
+        for iid in tree.get_children():
+            if tree.set(iid, 'status') in ('Done', 'Failed', 'Canceled'):
+                tree.delete(iid)
+
+    ttk.Button(actions, text='Cancel selected', command=cancel_selected).pack(side='left')
+    ttk.Button(actions, text='Cancel all', command=cancel_all).pack(side='left', padx=6)
+    ttk.Button(actions, text='Clear finished', command=clear_finished).pack(side='left')
+    tk.Label(actions, textvariable=summary_var, foreground='#888').pack(side='right')
+
+    detail_var = tk.StringVar()
+    tk.Label(dl_frame, textvariable=detail_var, foreground='#888', anchor='w').pack(fill='x', padx=6, pady=(0, 6))
+    details = {}
+
+    def show_detail(_event=None):
+        sel = tree.selection()
+        detail_var.set(details.get(int(sel[0]), '') if sel else '')
+
+    tree.bind('<<TreeviewSelect>>', show_detail)
+
+    def drain_events():
+        # Coalesce everything posted since the last tick, then touch each row once
+        latest = {}
+        try:
+            while True:
+                item_id, fields = dq.events.get_nowait()
+                latest.setdefault(item_id, {}).update(fields)
+        except queue.Empty:
+            pass
+        for item_id, fields in latest.items():
+            iid = str(item_id)
+            if 'detail' in fields:
+                details[item_id] = fields.pop('detail')
+            if not tree.exists(iid):
+                if 'platform' not in fields:
+                    continue  # row was cleared; only add() posts the platform
+                tree.insert('', 'end', iid=iid, values=('', '', '', '', ''))
+            for col, value in fields.items():
+                if col in columns:
+                    tree.set(iid, col, value)
+        if latest:
+            c = dq.counts()
+            summary_var.set(f"{c['active']} active, {c['queued']} queued, {c['total']} total")
+            show_detail()
+        root.after(UI_REFRESH_MS, drain_events)
+
+    root.after(UI_REFRESH_MS, drain_events)
 
     # ---- About TAB ----
     about = ttk.Frame(notebook)
@@ -484,9 +684,25 @@ def launch_gui():
 
     root.mainloop()
 
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Multi Platform Downloader (interactive menu when run without options)")
+    parser.add_argument('--batch', metavar='FILE', help="download every URL in FILE (one per line, '-' for stdin) without prompts")
+    parser.add_argument('-j', '--concurrency', type=int, default=4, help='parallel downloads in batch mode / GUI queue (default 4)')
+    parser.add_argument('--manifest', help='resumable results log (default downloads/batch_manifest.jsonl)')
+    parser.add_argument('--format', choices=YOUTUBE_MODES, default='best', help='YouTube format in batch mode')
+    parser.add_argument('--gui', action='store_true', help='launch the GUI directly')
+    return parser.parse_args(argv)
+
 # Extend existing main menu to include GUI option
 
-def main():
+def main(argv=None):
+    args = parse_args(argv)
+    if args.batch:
+        failed = run_batch(read_url_list(args.batch), max(1, args.concurrency), args.manifest, args.format)
+        sys.exit(1 if failed else 0)
+    if args.gui:
+        launch_gui(max(1, args.concurrency))
+        return
     print("🎬 Multi Platform Downloader")
     print("=" * 34)
     print("1. Download TikTok video")
@@ -0,0 +1,117 @@
+"""Per-job phase spans, exportable as Chrome trace-event JSON.
+
+Every phase of a download job (queue wait, extraction, each downloaded format,
+the fallback attempt, ffmpeg post-processing, output file detection) is
+recorded as a span with wall-clock start/end times. Spans are kept per job for
+/api/job/{id} and in a bounded process-wide ring for /api/trace, which renders
+any time window as trace events: one lane per job, so a busy period opened in
+chrome://tracing or Perfetto shows where capacity went.
+
+Timestamps are `time.time()` so spans measured in other threads or in the
+post-processing worker processes line up on one axis.
+"""
+import itertools
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional
+
+MAX_SPANS = int(os.environ.get('MPD_TRACE_SPANS', '20000'))
+MAX_JOBS = int(os.environ.get('MPD_TRACE_JOBS', '1000'))
+
+
+class SpanRecorder:
+    def __init__(self, max_spans: int = MAX_SPANS, max_jobs: int = MAX_JOBS):
+        self._lock = threading.Lock()
+        self._spans: deque = deque(maxlen=max_spans)
+        self._jobs: 'OrderedDict[str, List[dict]]' = OrderedDict()
+        self._lanes: Dict[str, int] = {}
+        self._lane_ids = itertools.count(1)
+        self.max_jobs = max_jobs
+
+    def start(self, job_id: Optional[str], name: str, start: Optional[float] = None, **args) -> Optional[dict]:
+        """Open a span; close it with end(). Returns None (a no-op span) without a job id."""
+        if not job_id:
+            return None
+        span = {'name': name, 'start': start or time.time(), 'end': None,
+                'thread': threading.current_thread().name, 'args': args}
+        with self._lock:
+            spans = self._jobs.get(job_id)
+            if spans is None:
+                spans = self._jobs[job_id] = []
+                self._lanes[job_id] = next(self._lane_ids)
+                while len(self._jobs) > self.max_jobs:
+                    old, _ = self._jobs.popitem(last=False)
+                    self._lanes.pop(old, None)
+            spans.append(span)
+            self._spans.append((job_id, span))
+        return span
+
+    def end(self, span: Optional[dict], end: Optional[float] = None, **args):
+        """Close `span`; closing an already closed (or None) span does nothing."""
+        if span is None or span['end'] is not None:
+            return
+        if args:
+            # Replace rather than mutate: readers may be serializing the old dict
+            span['args'] = {**span['args'], **args}
+        span['end'] = end or time.time()
+
+    def record(self, job_id: Optional[str], name: str, start: float, end: float, **args):
+        """Add a span measured elsewhere (e.g. by a worker process)."""
+        self.end(self.start(job_id, name, start, **args), end)
+
+    @contextmanager
+    def span(self, job_id: Optional[str], name: str, **args) -> Iterator[Optional[dict]]:
+        s = self.start(job_id, name, **args)
+        try:
+            yield s
+        except BaseException as e:
+            self.end(s, error=str(e)[:200] or type(e).__name__)
+            raise
+        self.end(s)
+
+    def job_spans(self, job_id: str) -> List[dict]:
+        """Spans of one job with durations; open spans have end None."""
+        with self._lock:
+            spans = list(self._jobs.get(job_id) or ())
+        out = []
+        for s in spans:
+            end = s['end']
+            out.append({'name': s['name'], 'start': round(s['start'], 6),
+                        'end': round(end, 6) if end else None,
+                        'duration_s': round(end - s['start'], 4) if end else None,
+                        'thread': s['thread'], **({'args': s['args']} if s['args'] else {})})
+        return out
+
+    def chrome_trace(self, since: Optional[float] = None, until: Optional[float] = None) -> dict:
+        """Trace-event JSON for every span overlapping [since, until]; open spans end at now."""
+        now = time.time()
+        until = until or now
+        since = since or 0.0
+        with self._lock:
+            spans = [(job_id, dict(s)) for job_id, s in self._spans]
+            lanes = dict(self._lanes)
+        events = []
+        seen_lanes = set()
+        for job_id, s in spans:
+            end = s['end'] or now
+            if end < since or s['start'] > until:
+                continue
+            tid = lanes.get(job_id, 0)
+            if tid not in seen_lanes:
+                seen_lanes.add(tid)
+                events.append({'ph': 'M', 'name': 'thread_name', 'pid': 1, 'tid': tid,
+                               'args': {'name': f"job {job_id[:8]}"}})
+            events.append({
+                'ph': 'X', 'name': s['name'], 'cat': 'job', 'pid': 1, 'tid': tid,
+                'ts': int(s['start'] * 1e6), 'dur': max(int((end - s['start']) * 1e6), 1),
+                'args': {**s['args'], 'job': job_id, 'thread': s['thread'],
+                         **({} if s['end'] else {'open': True})},
+            })
+        return {'traceEvents': events, 'displayTimeUnit': 'ms',
+                'otherData': {'since': since, 'until': until, 'spans': len(events) - len(seen_lanes)}}
+
+
+TRACES = SpanRecorder()
@@ -1,15 +1,20 @@
 import os
 import re
 import asyncio
+import contextlib
+import copy
+import functools
+import itertools
 import threading
 import uuid
 import shutil
+import time
+from concurrent.futures import FIRST_EXCEPTION, ThreadPoolExecutor, wait as wait_futures
 from pathlib import Path
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List, Tuple
 
-import requests
-from fastapi import FastAPI, Request, Form
-from fastapi.responses import HTMLResponse, StreamingResponse
+from fastapi import FastAPI, Request, Form, Query
+from fastapi.responses import FileResponse, HTMLResponse, JSONResponse, Response, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 
@@ -18,43 +23,134 @@ try:
 except ImportError:
     yt_dlp = None
 
-app = FastAPI(title="Multi Platform Downloader")
+import postprocess
+from assets import AssetManifest, CompressedBody, CONTENT_TYPES, IMMUTABLE
+import tiktok_core
+import media_keys
+from media_keys import MediaKey
+from bandwidth import INGRESS, EGRESS, PRIORITY_WEIGHTS, parse_rate, ytdlp_throttle_hook
+import fragments
+from fragments import FRAGMENTS
+from thumbs import REVALIDATE_AFTER as THUMB_MAX_AGE, ThumbnailCache
+from executors import METADATA, DOWNLOADS, FILE_IO, Bulkhead, BulkheadTimeout
+import executors
+import capacity
+from capacity import THROUGHPUT
+from stream_cache import ResolvedStreamCache, trim_info
+from tracing import TRACES
+from journal import JobJournal, TERMINAL_STATUSES
+from zipstream import ZipStream
+
+@contextlib.asynccontextmanager
+async def lifespan(_app: FastAPI):
+    recover_jobs()
+    sampler = asyncio.get_running_loop().create_task(sample_capacity_forever())
+    yield
+    sampler.cancel()
+    await shutdown_drain_jobs()
+
+app = FastAPI(title="Multi Platform Downloader", lifespan=lifespan)
 BASE_DIR = Path(__file__).parent
-DOWNLOAD_DIR = BASE_DIR / "downloads"
-DOWNLOAD_DIR.mkdir(exist_ok=True)
+DOWNLOAD_DIR = Path(os.environ.get('MPD_DOWNLOAD_DIR') or BASE_DIR / "downloads")
+DOWNLOAD_DIR.mkdir(parents=True, exist_ok=True)
 
 templates = Jinja2Templates(directory=str(BASE_DIR / "templates"))
+# Plain /static stays mounted for old links; pages reference the fingerprinted /assets URLs
 app.mount("/static", StaticFiles(directory=str(BASE_DIR / "static")), name="static")
+ASSETS = AssetManifest(BASE_DIR / "static")
+templates.env.globals['asset_url'] = ASSETS.url
 
-YOUTUBE_RE = re.compile(r"(youtu.be/|youtube.com)")
-TIKTOK_RE = re.compile(r"tiktok.com")
-INSTAGRAM_RE = re.compile(r"instagram.com")
+MIME_MAP = {
+    'mp4': 'video/mp4',
+    'mkv': 'video/x-matroska',
+    'webm': 'video/webm',
+    'mp3': 'audio/mpeg',
+    'm4a': 'audio/mp4',
+    'opus': 'audio/ogg',
+    'ogg': 'audio/ogg',
+    'wav': 'audio/wav'
+}
+# 'audio' always delivers MP3; 'audio_fast' keeps the native AAC/Opus track and only remuxes
+FAST_AUDIO_SELECTOR = 'bestaudio[ext=m4a]/bestaudio[acodec=opus]/bestaudio/best'
 
 # -------- Utility ---------
 
 def get_basic_headers():
     return {"User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/128.0.0.0 Safari/537.36"}
 
+FILE_CHUNK = 64 * 1024
+
+async def open_file(path: Path):
+    """Open `path` for streaming on the file I/O bulkhead.
+
+    Routes call this before they build their response, so a saturated bulkhead
+    (BulkheadTimeout) or a missing file still becomes a proper error status
+    instead of a download cut off after its 200.
+    """
+    return await FILE_IO.run(open, path, 'rb')
+
+async def file_io_admitted(fn, *args):
+    """Run `fn(*args)` on the file I/O bulkhead as part of a request that is already answering."""
+    return await asyncio.wrap_future(FILE_IO.submit_admitted(fn, *args))
+
+async def iter_file(f):
+    """Stream an open file (and close it) with reads on the file I/O bulkhead instead of the event loop."""
+    try:
+        while True:
+            chunk = await file_io_admitted(f.read, FILE_CHUNK)
+            if not chunk:
+                break
+            yield chunk
+    finally:
+        f.close()
+
+THUMBS = ThumbnailCache(DOWNLOAD_DIR / '.thumbs', headers=get_basic_headers())
+STREAMS = ResolvedStreamCache()
+
+def stream_key(url: str) -> str:
+    """Stream cache key of a URL: its canonical media key, or the URL itself. May follow a short link."""
+    key = media_keys.resolve(url, tiktok_core.get_session())
+    return key.key if key is not None and key.resolved else url
+
+async def astream_key(url: str) -> str:
+    """stream_key() for the event loop: only short links need the (cached) network lookup."""
+    key = media_keys.parse(url)
+    if key is not None and key.kind == 'short_link':
+        return await METADATA.run(stream_key, url)
+    return key.key if key is not None and key.resolved else url
+
 # -------- Extract preview metadata ---------
+async def thumb_path(url: Optional[str]) -> Optional[str]:
+    """Proxy path for a thumbnail URL; the raw URL if the file bulkhead is saturated."""
+    try:
+        return await FILE_IO.run(THUMBS.register, url)
+    except BulkheadTimeout:
+        return url
+
 async def get_tiktok_preview(url: str) -> Optional[dict]:
     try:
-        api = f"https://www.tikwm.com/api/?url={url}"
-        r = requests.get(api, headers=get_basic_headers(), timeout=12)
-        if r.status_code == 200:
-            j = r.json()
-            if j.get('code') == 0:
-                d = j.get('data', {})
-                # Duration may be provided as 'duration'
-                return {
-                    'title': d.get('title') or 'TikTok Video',
-                    'thumbnail': d.get('cover') or d.get('origin_cover'),
-                    'preview_url': d.get('play'),
-                    'embed_url': None,
-                    'video_type': 'video',
-                    'platform': 'tiktok',
-                    'duration': d.get('duration'),
-                    'filesize': d.get('size') or d.get('download_addr_size')
-                }
+        started = time.perf_counter()
+        d = await METADATA.run(tiktok_core.lookup, url)
+        if d:
+            # Duration may be provided as 'duration'
+            meta = {
+                'title': d.get('title') or 'TikTok Video',
+                'thumbnail': await thumb_path(d.get('cover') or d.get('origin_cover')),
+                'preview_url': d.get('play'),
+                'embed_url': None,
+                'video_type': 'video',
+                'platform': 'tiktok',
+                'duration': d.get('duration'),
+                'filesize': d.get('size') or d.get('download_addr_size')
+            }
+            # TikWM answers with the video id, which also settles a short link without a redirect
+            short = media_keys.parse(url)
+            if d.get('id') and short is not None and short.kind == 'short_link':
+                media_keys.SHORT_LINKS.put(short, MediaKey('tiktok', str(d['id']), 'video'))
+            key = MediaKey('tiktok', str(d['id']), 'video').key if d.get('id') else await astream_key(url)
+            # The play URL is what /download needs; keep it until its signature expires
+            STREAMS.put(key, 'tiktok', meta, time.perf_counter() - started, [meta['preview_url']])
+            return meta
     except Exception:
         pass
     return None
@@ -63,16 +159,32 @@ async def get_tiktok_preview(url: str) -> Optional[dict]:
 async def get_ytdlp_info(url: str) -> Optional[dict]:
     if yt_dlp is None:
         return None
-    loop = asyncio.get_event_loop()
     def extract():
         try:
             with yt_dlp.YoutubeDL({'quiet': True, 'skip_download': True}) as ydl:
-                return ydl.extract_info(url, download=False)
+                started = time.perf_counter()
+                # Extract once unprocessed so format selection can be replayed per quality option
+                raw = ydl.extract_info(url, download=False, process=False)
+                extract_s = time.perf_counter() - started
+                if raw.get('_type', 'video') != 'video':
+                    # Playlists and channel tabs may carry a generator of entries, which cannot be
+                    # copied and has no formats to replay anyway
+                    return raw, extract_s, ydl.process_ie_result(raw, download=False)
+                return raw, extract_s, ydl.process_ie_result(copy.deepcopy(raw), download=False)
         except Exception:
             return None
-    info = await loop.run_in_executor(None, extract)
+    try:
+        extracted = await METADATA.run(extract)
+    except BulkheadTimeout:
+        return None
+    if not extracted:
+        return None
+    raw, extract_s, info = extracted
     if not info:
         return None
+    if raw.get('_type', 'video') == 'video':
+        # Speculatively resolve every download option while the user looks at the preview
+        METADATA.submit(warm_stream_cache, url, raw, extract_s)
     if info.get('_type') == 'playlist':
         first = next((e for e in info.get('entries') or [] if e), None)
         base = first or {}
@@ -83,15 +195,14 @@ async def get_ytdlp_info(url: str) -> Optional[dict]:
     progressive_url = None
     thumb = base.get('thumbnail')
     if not thumb and base.get('thumbnails'):
-        try:
-            thumb = sorted([t for t in base['thumbnails'] if isinstance(t, dict)], key=lambda x: x.get('width', 0), reverse=True)[0].get('url')
-        except Exception:
-            thumb = None
+        candidates = [t for t in base['thumbnails'] if isinstance(t, dict) and t.get('url')]
+        if candidates:
+            thumb = max(candidates, key=lambda x: x.get('width') or 0)['url']
     duration = base.get('duration')
     filesize = base.get('filesize') or base.get('filesize_approx')
     return {
         'title': base.get('title') or 'Video',
-        'thumbnail': thumb,
+        'thumbnail': await thumb_path(thumb),
         'preview_url': progressive_url,
         'embed_url': f"https://www.youtube.com/embed/{video_id}" if video_id else None,
         'video_type': 'iframe',
@@ -100,20 +211,62 @@ async def get_ytdlp_info(url: str) -> Optional[dict]:
         'filesize': filesize
     }
 
+def warm_stream_cache(url: str, raw: dict, extract_s: float):
+    key = stream_key(url)
+    for fmt, selector in job_format_selectors().items():
+        if STREAMS.fresh(key, fmt):
+            continue
+        started = time.perf_counter()
+        try:
+            with yt_dlp.YoutubeDL({'quiet': True, 'no_warnings': True, 'format': selector}) as ydl:
+                info = ydl.process_ie_result(copy.deepcopy(raw), download=False)
+        except Exception:
+            continue
+        if not info:
+            continue
+        components = info.get('requested_formats') or [info]
+        STREAMS.put(key, fmt, trim_info(info), extract_s + time.perf_counter() - started,
+                    [c.get('url') for c in components])
+
 async def get_instagram_info(url: str) -> Optional[dict]:
     return await get_ytdlp_info(url)
 
 async def detect_and_preview(url: str) -> Optional[dict]:
-    if TIKTOK_RE.search(url):
+    key = media_keys.parse(url)
+    if key is None:
+        return None
+    if key.platform == 'tiktok':
         return await get_tiktok_preview(url)
-    if YOUTUBE_RE.search(url) or INSTAGRAM_RE.search(url):
-        return await get_ytdlp_info(url)
-    return None
+    return await get_ytdlp_info(url)
+
+def compressed_response(request: Request, body: CompressedBody, cache_control: str) -> Response:
+    encoding, data = body.negotiate(request.headers.get('accept-encoding'))
+    if body.not_modified(request.headers.get('if-none-match'), encoding):
+        return Response(status_code=304, headers=body.headers(encoding, cache_control))
+    return Response(data, media_type=body.content_type, headers=body.headers(encoding, cache_control))
+
+# The empty-state index does not depend on the request: render it once per process
+_INDEX_PAGE: Optional[CompressedBody] = None
+
+def index_page() -> CompressedBody:
+    global _INDEX_PAGE
+    if _INDEX_PAGE is None:
+        html = templates.get_template('index.html').render(preview=None, url='')
+        _INDEX_PAGE = CompressedBody(html.encode('utf-8'), CONTENT_TYPES['.html'])
+    return _INDEX_PAGE
 
 # -------- Routes ---------
 @app.get('/', response_class=HTMLResponse)
 async def index(request: Request):
-    return templates.TemplateResponse('index.html', {"request": request, 'preview': None, 'url': ''})
+    # no-cache: browsers revalidate (304 via ETag) so a deploy's new asset URLs are picked up
+    return compressed_response(request, index_page(), 'no-cache')
+
+@app.get('/assets/{name:path}')
+async def asset(request: Request, name: str):
+    body = ASSETS.get(name)
+    if body is None:
+        return Response(status_code=404)
+    return compressed_response(request, body, IMMUTABLE)
 
 @app.post('/preview', response_class=HTMLResponse)
 async def preview(request: Request, url: str = Form(...)):
@@ -126,34 +279,41 @@ async def download(request: Request, url: str = Form(...), format: str = Form('b
     if not url:
         return HTMLResponse("<h3>Invalid URL</h3>", status_code=400)
 
-    platform = 'generic'
-    if TIKTOK_RE.search(url):
-        platform = 'tiktok'
-    elif YOUTUBE_RE.search(url):
-        platform = 'youtube'
-    elif INSTAGRAM_RE.search(url):
-        platform = 'instagram'
+    key = media_keys.parse(url)
+    platform = key.platform if key else 'generic'
 
-    filename_base = re.sub(r'[^a-zA-Z0-9_-]+', '_', url)[:40] or 'video'
+    # Every spelling of a video gets the same readable stem; the suffix keeps concurrent requests apart
+    filename_base = f"{media_keys.filename_base(key, url, 33)}_{uuid.uuid4().hex[:6]}"
     temp_path = DOWNLOAD_DIR / f"{filename_base}.temp"
 
-    if TIKTOK_RE.search(url):
-        meta = await get_tiktok_preview(url)
+    if platform == 'tiktok':
+        cached = STREAMS.get(await astream_key(url), 'tiktok')
+        meta = cached['value'] if cached else await get_tiktok_preview(url)
         if not meta or not meta.get('preview_url'):
             return HTMLResponse("<h3>Failed to fetch TikTok video.</h3>", status_code=502)
         video_url = meta['preview_url']
         try:
-            r = requests.get(video_url, stream=True, headers=get_basic_headers(), timeout=20)
+            r = await DOWNLOADS.run(tiktok_core.open_stream, video_url, timeout=20)
+        except BulkheadTimeout:
+            return HTMLResponse("<h3>Server busy, try again shortly.</h3>", status_code=503)
         except Exception:
             return HTMLResponse("<h3>Upstream TikTok stream error.</h3>", status_code=502)
         if r.status_code != 200:
+            r.close()
             return HTMLResponse(f"<h3>TikTok stream HTTP {r.status_code}</h3>", status_code=502)
         def tstream():
-            with open(temp_path, 'wb') as f:
-                for chunk in r.iter_content(chunk_size=8192):
-                    if chunk:
+            ingress = INGRESS.open(f"download:{filename_base}")
+            egress = EGRESS.open(f"download:{filename_base}")
+            try:
+                with open(temp_path, 'wb', buffering=tiktok_core.CHUNK_SIZE) as f:
+                    for chunk in tiktok_core.iter_chunks(r):
+                        ingress.consume(len(chunk))
                         f.write(chunk)
+                        egress.consume(len(chunk))
                         yield chunk
+            finally:
+                ingress.close()
+                egress.close()
             final_path = DOWNLOAD_DIR / f"{filename_base}.mp4"
             os.replace(temp_path, final_path)
         return StreamingResponse(
@@ -168,7 +328,8 @@ async def download(request: Request, url: str = Form(...), format: str = Form('b
     quality_map = {
         'best': 'bv*[height<=1080]+ba/best[height<=1080]',
         '720p': 'bv*[height<=720]+ba/best[height<=720]',
-        'audio': 'bestaudio/best'
+        'audio': 'bestaudio/best',
+        'audio_fast': FAST_AUDIO_SELECTOR
     }
     ydl_opts = {
         'format': quality_map.get(format, 'best'),
@@ -180,49 +341,66 @@ async def download(request: Request, url: str = Form(...), format: str = Form('b
         ydl_opts['postprocessors'] = [{
             'key': 'FFmpegExtractAudio', 'preferredcodec': 'mp3', 'preferredquality': '192'
         }]
+    elif format == 'audio_fast':
+        # 'best' makes yt-dlp stream-copy the track into its natural container
+        ydl_opts['postprocessors'] = [{'key': 'FFmpegExtractAudio', 'preferredcodec': 'best'}]
 
-    loop = asyncio.get_event_loop()
     def run_download():
+        flow = INGRESS.open(f"download:{filename_base}")
+        ydl_opts['progress_hooks'] = [ytdlp_throttle_hook(flow)]
         try:
             with yt_dlp.YoutubeDL(ydl_opts) as ydl:
                 ydl.extract_info(url, download=True)
             # Detect produced file
-            for ext in ['mp4','mkv','webm','mp3','m4a','wav']:
+            for ext in ['mp4','mkv','webm','mp3','m4a','opus','ogg','wav']:
                 p = DOWNLOAD_DIR / f"{filename_base}.{ext}"
                 if p.exists():
                     return p, ext
         except Exception:
             return None, None
+        finally:
+            flow.close()
         return None, None
 
-    file_path, ext = await loop.run_in_executor(None, run_download)
+    try:
+        file_path, ext = await DOWNLOADS.run(run_download)
+    except BulkheadTimeout:
+        return HTMLResponse("<h3>Server busy, try again shortly.</h3>", status_code=503)
     if not file_path:
         return HTMLResponse("<h3>Download failed.</h3>", status_code=502)
 
-    mime_map = {
-        'mp4': 'video/mp4',
-        'mkv': 'video/x-matroska',
-        'webm': 'video/webm',
-        'mp3': 'audio/mpeg',
-        'm4a': 'audio/mp4',
-        'wav': 'audio/wav'
-    }
-    media_type = mime_map.get(ext, 'application/octet-stream')
-
-    def file_iter():
-        with open(file_path, 'rb') as f:
-            while True:
-                data = f.read(8192)
-                if not data:
-                    break
-                yield data
+    media_type = MIME_MAP.get(ext, 'application/octet-stream')
+    try:
+        f = await open_file(file_path)
+    except BulkheadTimeout:
+        return HTMLResponse("<h3>Server busy, try again shortly.</h3>", status_code=503)
+    except OSError:
+        return HTMLResponse("<h3>Download failed.</h3>", status_code=502)
 
     return StreamingResponse(
-        file_iter(),
+        EGRESS.athrottle(iter_file(f), f"download:{filename_base}"),
         media_type=media_type,
         headers={'Content-Disposition': f'attachment; filename="{file_path.name}"'}
     )
 
+@app.get('/thumb/{key}')
+async def thumb(key: str, request: Request, w: Optional[int] = None):
+    if not re.fullmatch(r'[0-9a-f]{24}', key):
+        return Response(status_code=404)
+    try:
+        found = await FILE_IO.run(THUMBS.get, key, w)
+    except BulkheadTimeout:
+        return Response(status_code=503)
+    if not found:
+        return Response(status_code=404)
+    path, meta = found
+    etag = f'"{meta["etag"]}"'
+    # Not immutable: the key names the upstream URL and its bytes change when revalidation finds a new image
+    headers = {'ETag': etag, 'Cache-Control': f'public, max-age={THUMB_MAX_AGE}'}
+    if request.headers.get('if-none-match') == etag:
+        return Response(status_code=304, headers=headers)
+    return FileResponse(path, media_type=meta.get('content_type') or 'image/jpeg', headers=headers)
+
 @app.get('/api/preview')
 async def api_preview(url: str):
     meta = await detect_and_preview(url.strip()) if url else None
@@ -231,6 +409,82 @@ async def api_preview(url: str):
 
 JOBS: Dict[str, Dict[str, Any]] = {}
 JOBS_LOCK = threading.Lock()
+# Every job change takes the next value of one process-wide sequence as the job's
+# `version`, so a single cursor tells a client which of many jobs moved
+_JOB_SEQ = itertools.count(1)
+# Internal fields never sent to clients
+PRIVATE_JOB_FIELDS = ('cancel', 'postprocess_task')
+
+# Transitions of these fields are journaled; progress ticks are not
+JOURNAL_FIELDS = ('status', 'stage', 'file', 'error', 'entries')
+JOURNAL = JobJournal(DOWNLOAD_DIR / '.jobs.jsonl')
+# Set when the server starts draining (no new jobs) / when running jobs must checkpoint
+DRAINING = threading.Event()
+SHUTDOWN = threading.Event()
+# Why and since when DRAINING is set: 'manual' (POST /api/drain, reversible) or 'shutdown'
+DRAIN = {'reason': None, 'since': None}
+# Jobs that reached each terminal status in this process (throughput for /capacity)
+ENDED_JOBS = {status: 0 for status in TERMINAL_STATUSES}
+SHUTDOWN_GRACE = float(os.environ.get('MPD_SHUTDOWN_GRACE', '20'))
+RECOVERY = {'restored_jobs': 0, 'resumed_jobs': 0, 'resumed_bytes': 0, 'redownloaded_bytes': 0}
+
+# Progress-only changes wake long-pollers at most this often; transitions wake them at once
+PROGRESS_NOTIFY_S = 0.5
+
+class JobChanges:
+    """Wakes long-polling /api/jobs requests when any job changes.
+
+    Jobs are updated from worker threads; waiters are futures on the event loop.
+    Progress ticks arrive many times a second per job, so those notifications
+    are coalesced into one wake per PROGRESS_NOTIFY_S.
+    """
+    def __init__(self, interval: float = PROGRESS_NOTIFY_S):
+        self.interval = interval
+        self._waiters = set()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._lock = threading.Lock()
+        self._scheduled = False
+        self._last_wake = 0.0
+
+    async def wait(self, timeout: float):
+        self._loop = asyncio.get_running_loop()
+        fut = self._loop.create_future()
+        self._waiters.add(fut)
+        try:
+            await asyncio.wait_for(fut, timeout)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            self._waiters.discard(fut)
+
+    def notify(self, coalesce: bool = False):
+        if not self._waiters or self._loop is None:
+            return
+        if not coalesce:
+            self._loop.call_soon_threadsafe(self._wake)
+            return
+        with self._lock:
+            if self._scheduled:
+                return
+            self._scheduled = True
+        self._loop.call_soon_threadsafe(self._schedule)
+
+    def _schedule(self):
+        delay = self._last_wake + self.interval - self._loop.time()
+        self._loop.call_later(max(delay, 0), self._wake)
+
+    def _wake(self):
+        with self._lock:
+            self._scheduled = False
+        self._last_wake = self._loop.time()
+        for fut in list(self._waiters):
+            if not fut.done():
+                fut.set_result(None)
+
+JOB_CHANGES = JobChanges()
+
+def public_job(job: Dict[str, Any]) -> Dict[str, Any]:
+    return {k: v for k, v in job.items() if k not in PRIVATE_JOB_FIELDS}
 # Cancellation helper
 def job_canceled(job_id: str) -> bool:
     with JOBS_LOCK:
@@ -238,18 +492,687 @@ def job_canceled(job_id: str) -> bool:
         return bool(j and j.get('cancel'))
 # Utility to safely update job
 def update_job(job_id: str, **fields):
+    snapshot = None
     with JOBS_LOCK:
-        if job_id in JOBS:
-            JOBS[job_id].update(fields)
+        job = JOBS.get(job_id)
+        if job:
+            durable = any(k in fields and job.get(k) != fields[k] for k in JOURNAL_FIELDS)
+            if fields.get('status') in ENDED_JOBS and job.get('status') != fields['status']:
+                ENDED_JOBS[fields['status']] += 1
+            job.update(fields, version=next(_JOB_SEQ))
+            if durable:
+                snapshot = dict(job)
+    if snapshot:
+        JOURNAL.append(snapshot)
+    JOB_CHANGES.notify(coalesce=snapshot is None)
+
+async def journal_append(snapshot: dict):
+    """Journal from the event loop: the fsync runs on the file bulkhead, never timed out (the job is admitted)."""
+    await file_io_admitted(JOURNAL.append, snapshot)
 
 # Add helper to detect ffmpeg
 FFMPEG_AVAILABLE = shutil.which('ffmpeg') is not None
 
-# Background download runner using yt-dlp
+# If ffmpeg missing, force a progressive stream (single file including audio+video)
+PROGRESSIVE_SELECTOR = 'best[ext=mp4][acodec!=none][vcodec!=none][height<=720]/best[acodec!=none][vcodec!=none]'  # safer
+
+def job_format_selectors() -> Dict[str, str]:
+    """Format selector per job format, depending on ffmpeg availability."""
+    return {
+        'best': 'bv*[height<=1080]+ba/best[height<=1080]' if FFMPEG_AVAILABLE else PROGRESSIVE_SELECTOR,
+        '720p': 'bv*[height<=720]+ba/best[height<=720]' if FFMPEG_AVAILABLE else PROGRESSIVE_SELECTOR,
+        'audio': 'bestaudio/best' if FFMPEG_AVAILABLE else 'bestaudio[ext=mp3]/bestaudio[ext=m4a]/bestaudio',
+        'audio_fast': FAST_AUDIO_SELECTOR
+    }
+
+# Background download runner using yt-dlp.
+# A job is a small pipeline: the network fetch stage runs on FETCH_POOL (I/O-bound,
+# many slots) and hands any ffmpeg work to the post-processing process pool
+# (CPU-bound, one slot per core), releasing its fetch slot immediately.
+FETCH_WORKERS = int(os.environ.get('MPD_FETCH_WORKERS', '8'))
+FETCH_POOL = executors.register(Bulkhead('fetch', FETCH_WORKERS))
+PARALLEL_COMPONENTS = os.environ.get('MPD_PARALLEL_COMPONENTS', '1') != '0'
+
+def fetch_stage(url: str, selector: str, filename_base: str, hooks: list, rate_cap: int = 0,
+                resolved: Optional[dict] = None, job_id: Optional[str] = None,
+                gate: Optional[fragments.FragmentGate] = None, http_chunk_size: int = 0,
+                progress: Optional['FetchProgress'] = None) -> dict:
+    """Resolve `url` and download the selected format(s) without any post-processing.
+
+    Merged selectors (`bv*+ba`) yield one file per component; merging them is left
+    to the post-processing stage. `resolved` is a format-selected info dict from the
+    stream cache; when given, extraction is skipped entirely. Phases are traced
+    under `job_id`. HLS / DASH fragments are fetched concurrently as far as `gate`
+    admits, and the components of a merged format are fetched at the same time
+    (MPD_PARALLEL_COMPONENTS), all reporting to the same `hooks`. `progress` is told
+    every component's expected size up front, so combined progress is right from
+    the first tick.
+
+    Leftovers of an interrupted run are reused: a finished component file is kept
+    as is and a `.part` file is continued with a range request. `resumed_bytes`
+    counts what did not have to be fetched again, `redownloaded_bytes` partial data
+    that was thrown away because the server would not resume it.
+    """
+    # downloaded_bytes at the first progress tick per file: below the .part size means
+    # yt-dlp could not resume and started over
+    first_tick: Dict[str, int] = {}
+    sibling_failed = threading.Event()
+
+    def resume_probe(d):
+        if sibling_failed.is_set():
+            raise Exception('Another component failed')
+        if d.get('status') == 'downloading':
+            first_tick.setdefault(d.get('tmpfilename') or d.get('filename') or '', d.get('downloaded_bytes') or 0)
+
+    opts = {
+        'format': selector,
+        'quiet': True,
+        'no_warnings': True,
+        'noprogress': True,
+        'continuedl': True,
+        'progress_hooks': [resume_probe] + hooks,
+    }
+    if rate_cap:
+        opts['ratelimit'] = rate_cap
+    if http_chunk_size:
+        opts['http_chunk_size'] = http_chunk_size
+    with yt_dlp.YoutubeDL(opts) as ydl:
+        started = time.perf_counter()
+        if resolved:
+            info = dict(resolved)
+        else:
+            with TRACES.span(job_id, 'extract'):
+                info = ydl.extract_info(url, download=False)
+        resolve_s = time.perf_counter() - started
+        if info and info.get('_type') == 'playlist':
+            info = next((e for e in info.get('entries') or [] if e), None)
+        if not info:
+            raise Exception('Nothing to download')
+        requested = info.get('requested_formats') or [info]
+        components = []
+        for index, comp in enumerate(requested):
+            comp_info = dict(info)
+            comp_info.update(comp)
+            comp_info.pop('requested_formats', None)
+            ext = comp.get('ext') or 'mp4'
+            if len(requested) > 1:
+                fid = re.sub(r'[^a-zA-Z0-9_-]+', '_', str(comp.get('format_id') or index))
+                path = DOWNLOAD_DIR / f"{filename_base}.f{fid}.{ext}"
+            else:
+                path = DOWNLOAD_DIR / f"{filename_base}.{ext}"
+            components.append((comp_info, path))
+            if progress:
+                done = path.stat().st_size if path.exists() else None
+                progress.expect(str(path), comp.get('format_id'),
+                                done or comp.get('filesize') or comp.get('filesize_approx') or 0, done is not None)
+
+        def fetch_component(comp_info: dict, path: Path) -> Tuple[Path, int, int]:
+            """Download one component; returns its path, resumed and re-downloaded bytes."""
+            ext = comp_info.get('ext') or 'mp4'
+            if path.exists():
+                # Completed before an interruption (.part files are only renamed when done)
+                TRACES.record(job_id, 'download', time.time(), time.time(), format_id=comp_info.get('format_id'),
+                              ext=ext, reused=True)
+                return path, path.stat().st_size, 0
+            part = path.with_name(path.name + '.part')
+            part_size = part.stat().st_size if part.exists() else 0
+            with TRACES.span(job_id, 'download', format_id=comp_info.get('format_id'), ext=ext,
+                             resume_from=part_size) as span:
+                ok, _ = fragments.download(ydl, str(path), comp_info, gate)
+                if not ok or not path.exists():
+                    raise Exception(f"Download of format {comp_info.get('format_id')} failed")
+                TRACES.end(span, bytes=path.stat().st_size)
+            if part_size and first_tick.get(str(part), part_size) < part_size:
+                return path, 0, part_size
+            return path, part_size, 0
+
+        if len(components) > 1 and PARALLEL_COMPONENTS:
+            # Video and audio of a merged format come from independent URLs: fetch them
+            # side by side so the wall time is the longer transfer, not the sum
+            with ThreadPoolExecutor(len(components), thread_name_prefix='fetch-component') as pool:
+                futures = [pool.submit(fetch_component, *comp) for comp in components]
+                wait_futures(futures, return_when=FIRST_EXCEPTION)
+                failed = next((f for f in futures if f.done() and f.exception()), None)
+                if failed:
+                    sibling_failed.set()  # the others stop at their next progress tick
+                    raise failed.exception()
+                results = [f.result() for f in futures]
+        else:
+            results = [fetch_component(*comp) for comp in components]
+        paths = [path for path, _, _ in results]
+        resumed = sum(r for _, r, _ in results)
+        redownloaded = sum(r for _, _, r in results)
+    return {'info': info, 'paths': paths, 'base': filename_base, 'resolve_s': resolve_s,
+            'resumed_bytes': resumed, 'redownloaded_bytes': redownloaded}
+
+def open_fragment_gate(job_id: str, job: Dict[str, Any]) -> fragments.FragmentGate:
+    """The job's share of the fragment connection budget; its limit is mirrored in `fragment_limit`."""
+    gate = FRAGMENTS.gate(f"job:{job_id}", job.get('concurrent_fragment_downloads'),
+                          should_stop=lambda: job_canceled(job_id) or SHUTDOWN.is_set(),
+                          on_change=lambda limit: update_job(job_id, fragment_limit=limit))
+    update_job(job_id, fragment_limit=gate.limit)
+    return gate
+
+def close_fragment_gate(job_id: str, gate: fragments.FragmentGate):
+    gate.close()
+    if gate.fragments:
+        update_job(job_id, fragment_stats=gate.snapshot())
+
+class FetchProgress:
+    """Combined progress of the files of one fetch, fed with yt-dlp progress dicts.
+
+    Merged formats download video and audio at the same time, so the job's
+    bytes, percent, speed and ETA are sums over both; `components` keeps the
+    per-format breakdown. Percent is weighted by size and never moves
+    backwards (fragmented downloads only estimate their size as they go).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """Start over, e.g. for the files of a fallback attempt."""
+        with self._lock:
+            self._files: Dict[str, dict] = {}
+            self._percent = 0.0
+
+    def _entry(self, filename: str, format_id: Optional[str]) -> dict:
+        return self._files.setdefault(filename, {'format_id': format_id, 'downloaded': 0, 'total': 0,
+                                                 'fraction': 0.0, 'speed': None, 'done': False})
+
+    def expect(self, filename: str, format_id: Optional[str], total: int, done: bool = False):
+        """Announce a file before its first tick (`done`: already on disk, nothing to fetch)."""
+        with self._lock:
+            entry = self._entry(filename, format_id)
+            entry['total'] = total
+            if done:
+                entry.update(downloaded=total, fraction=1.0, done=True)
+
+    def update(self, d: dict) -> dict:
+        """Feed one progress dict; returns the job fields to update."""
+        status = d.get('status')
+        with self._lock:
+            entry = self._entry(d.get('filename') or '', (d.get('info_dict') or {}).get('format_id'))
+            entry['downloaded'] = d.get('downloaded_bytes') or entry['downloaded']
+            entry['total'] = fragments.expected_size(d) or entry['total']
+            fraction = 1.0 if status == 'finished' else fragments.progress_fraction(d)
+            if fraction is not None:
+                entry['fraction'] = max(entry['fraction'], fraction)
+            entry['done'] = status == 'finished'
+            entry['speed'] = None if entry['done'] else d.get('speed')
+            files = list(self._files.values())
+            downloaded = sum(f['downloaded'] for f in files)
+            total = sum(f['total'] for f in files)
+            if total and all(f['total'] for f in files):
+                combined = sum(f['fraction'] * f['total'] for f in files) / total
+            elif any(f['fraction'] for f in files):
+                combined = sum(f['fraction'] for f in files) / len(files)
+            else:
+                combined = None
+            if combined is not None:
+                self._percent = max(self._percent, combined * 100)
+            speeds = [f['speed'] for f in files if f['speed']]
+            speed = sum(speeds) if speeds else None
+            return {
+                'downloaded': downloaded,
+                'total': total,
+                'percent': self._percent if combined is not None else None,
+                'speed': speed,
+                'eta': int((total - downloaded) / speed) if speed and total > downloaded else None,
+                'components': [{'format_id': f['format_id'], 'downloaded': f['downloaded'],
+                                'total': f['total'] or None, 'percent': round(f['fraction'] * 100, 1)}
+                               for f in files] if len(files) > 1 else None,
+            }
+
+def fixup_args(info: dict) -> Optional[List[str]]:
+    """ffmpeg options for the fixes yt-dlp would have applied to this download, or None.
+
+    Fetching formats ourselves skips YoutubeDL.process_info and with it the
+    FixupStretched / FixupM4a / FixupM3u8 / FixupDuplicateMoov post-processors;
+    the same corrections go into our own ffmpeg step instead. Merged formats
+    always get one (their args are used with the merge); a single file only
+    when one of the conditions holds.
+    """
+    requested = info.get('requested_formats')
+    formats = requested or [info]
+    args: List[str] = []
+    needed = False
+    ratio = info.get('stretched_ratio')
+    if ratio not in (None, 1):
+        args += ['-aspect', f"{ratio:f}"]
+        needed = True
+    audio = next((f for f in formats if f.get('acodec') not in (None, 'none')), formats[-1])
+    hls = str(audio.get('protocol') or '').startswith('m3u8')
+    if hls and str(audio.get('acodec') or '').startswith('mp4a'):
+        args += ['-bsf:a', 'aac_adtstoasc']  # ADTS AAC from MPEG-TS segments
+    if not requested:
+        protocol = str(info.get('protocol') or '')
+        if info.get('ext') == 'm4a' and info.get('container') == 'm4a_dash':
+            args += ['-f', 'mp4']
+            needed = True
+        if protocol.startswith('m3u8') and info.get('ext') in ('mp4', 'm4a'):
+            needed = True  # MPEG-TS in an MP4 name
+        if protocol == 'http_dash_segments' and (info.get('is_live') or info.get('is_dash_periods')):
+            needed = True  # possible duplicate MOOV atoms
+    return args if needed or requested else None
+
+def plan_postprocess(fmt: str, fetched: dict) -> Optional[dict]:
+    paths = fetched['paths']
+    filename_base = fetched['base']
+    if len(paths) > 1:
+        return {'op': 'merge', 'inputs': [str(p) for p in paths], 'args': fixup_args(fetched['info']),
+                'output': str(DOWNLOAD_DIR / f"{filename_base}.mp4")}
+    if not FFMPEG_AVAILABLE:
+        return None
+    src = paths[0]
+    if fmt == 'audio_fast':
+        ext = postprocess.audio_container(fetched['info'].get('acodec'), src.suffix.lstrip('.'))
+        if ext:
+            out = DOWNLOAD_DIR / f"{filename_base}.{ext}"
+            if out == src:
+                if fixup_args(fetched['info']) is None:
+                    return None  # already the native track in its own container
+                src = src.rename(src.with_name(f"{filename_base}.src.{ext}"))
+            return {'op': 'remux_audio', 'inputs': [str(src)], 'output': str(out)}
+        # Unknown native codec: fall through to the MP3 transcode
+    if fmt in ('audio', 'audio_fast') and src.suffix != '.mp3':
+        return {'op': 'extract_audio', 'inputs': [str(src)], 'bitrate': '192k',
+                'output': str(DOWNLOAD_DIR / f"{filename_base}.mp3")}
+    args = fixup_args(fetched['info'])
+    if args is not None:
+        out = src
+        src = src.rename(src.with_name(f"{filename_base}.src{src.suffix}"))
+        return {'op': 'fixup', 'inputs': [str(src)], 'output': str(out), 'args': args}
+    return None
+
+def cleanup_job_files(filename_base: str):
+    for p in DOWNLOAD_DIR.glob(f"{filename_base}*"):
+        try:
+            p.unlink()
+        except Exception:
+            pass
+
+def stop_requested(job_id: str, filename_base: str) -> bool:
+    """End the job as canceled, or as interrupted during shutdown; True if it was stopped."""
+    if job_canceled(job_id):
+        update_job(job_id, status='canceled', stage='done', error='Canceled')
+        cleanup_job_files(filename_base)
+        return True
+    if SHUTDOWN.is_set():
+        # Partial files stay on disk; the next start resumes from them
+        update_job(job_id, status='interrupted', stage='interrupted')
+        return True
+    return False
+
+def finish_job(job_id: str, produced_file: Path):
+    with TRACES.span(job_id, 'detect_file', file=produced_file.name):
+        size = produced_file.stat().st_size
+    update_job(job_id, status='finished', stage='done', file=str(produced_file),
+               ext=produced_file.suffix.lstrip('.'), size=size)
+
+def submit_postprocess(job_id: str, task: dict, filename_base: str):
+    submitted = time.time()
+    # The task is journaled with the stage so a restart can rerun it without refetching
+    update_job(job_id, status='processing', stage='postprocess_queue', postprocess_task=task)
+    queue_span = TRACES.start(job_id, 'postprocess_queue')
+
+    def on_start():
+        TRACES.end(queue_span)
+        update_job(job_id, stage='postprocess', postprocess_queue_s=round(time.time() - submitted, 3))
+
+    def on_done(future):
+        if future.cancelled():  # pool shut down before the task ran
+            update_job(job_id, status='interrupted', stage='interrupted')
+            return
+        try:
+            result = future.result()
+        except Exception as e:
+            result = {'ok': False, 'error': str(e), 'started': time.time(), 'finished': time.time()}
+        TRACES.end(queue_span)  # no-op unless the task never started
+        TRACES.record(job_id, f"postprocess:{task['op']}", result['started'], result['finished'],
+                      cpu_s=result.get('cpu_s'), ok=result['ok'])
+        update_job(job_id, postprocess_s=round(result['finished'] - result['started'], 3),
+                   postprocess_cpu_s=result.get('cpu_s'))
+        if not result['ok'] and SHUTDOWN.is_set() and not job_canceled(job_id):
+            update_job(job_id, status='interrupted', stage='interrupted')
+            return
+        if job_canceled(job_id):
+            update_job(job_id, status='canceled', stage='done', error='Canceled')
+            cleanup_job_files(filename_base)
+            return
+        if not result['ok'] and task.get('derived_from'):
+            # The source file went away or could not be read: fetch from upstream after all
+            cleanup_job_files(filename_base)
+            update_job(job_id, status='queued', stage='queued', streams=None, derived=None, note='derive_failed')
+            requeue_job(job_id)
+            return
+        if not result['ok']:
+            update_job(job_id, status='error', stage='done', error=f"Post-processing failed: {result['error']}")
+            return
+        if not task.get('keep_inputs'):
+            for p in task['inputs']:
+                try:
+                    os.remove(p)
+                except OSError:
+                    pass
+        if task.get('derived_from'):
+            count_derived(job_id)
+        finish_job(job_id, Path(task['output']))
+
+    postprocess.submit(task, on_start).add_done_callback(on_done)
+
+# -------- Derived formats ---------
+# A job for media that an earlier job already downloaded is served from that job's
+# file when it holds what the new format needs: the same format is hard-linked,
+# audio is copied or converted out of a video and, with MPD_DERIVE_DOWNSCALE, a
+# video above 720p is re-encoded for `720p`. ffmpeg work runs on the
+# post-processing pool; the source file is only read, never moved or removed.
+DERIVE = os.environ.get('MPD_DERIVE', '1') != '0'
+DERIVE_DOWNSCALE = os.environ.get('MPD_DERIVE_DOWNSCALE', '0') != '0'
+VIDEO_FORMATS = ('best', '720p')
+# Cheapest first when several finished jobs could serve a request
+DERIVE_COST = {'link': 0, 'remux_audio': 1, 'extract_audio': 2, 'downscale': 3}
+DERIVED = {'jobs': 0, 'upstream_bytes_avoided': 0}
+
+def fetched_streams(fetched: dict) -> List[dict]:
+    """The upstream streams behind a fetch and the bytes each one took."""
+    info = fetched['info']
+    requested = info.get('requested_formats') or [info]
+    return [{'format_id': f.get('format_id'), 'vcodec': f.get('vcodec'), 'acodec': f.get('acodec'),
+             'height': f.get('height'), 'abr': f.get('abr'),
+             'bytes': path.stat().st_size if path.exists() else 0}
+            for f, path in zip(requested, fetched['paths'])]
+
+def derivation_plan(fmt: str, source: Dict[str, Any]) -> Optional[dict]:
+    """How to make `fmt` out of a finished job's file (op and task params), or None."""
+    src_fmt = source['format']
+    streams = source['streams']
+    video = next((s for s in streams if s.get('vcodec') != 'none'), None) if src_fmt in VIDEO_FORMATS else None
+    audio = next((s for s in streams if s.get('acodec') != 'none'), None)
+    if fmt == src_fmt or (fmt == 'audio' and source.get('ext') == 'mp3'):
+        return {'op': 'link'}
+    if fmt == '720p' and video and video.get('height') and video['height'] <= 720:
+        return {'op': 'link'}  # `best` found nothing above 720p, so `720p` would pick the same
+    if not FFMPEG_AVAILABLE or audio is None:
+        return None
+    if fmt == 'audio_fast' and video:
+        ext = postprocess.audio_container(audio.get('acodec'))
+        if ext:
+            return {'op': 'remux_audio', 'ext': ext}
+        return {'op': 'extract_audio', 'ext': 'mp3', 'bitrate': '192k'}
+    if fmt == 'audio' and src_fmt != 'audio':
+        return {'op': 'extract_audio', 'ext': 'mp3', 'bitrate': '192k'}
+    if fmt == '720p' and video and video.get('height') and DERIVE_DOWNSCALE:
+        return {'op': 'downscale', 'ext': 'mp4', 'height': 720}
+    return None
+
+def upstream_bytes_avoided(fmt: str, key: str, plan: dict, source: Dict[str, Any]) -> Tuple[int, str]:
+    """Bytes a fetch of `fmt` would have taken, and what the number is based on."""
+    entry = STREAMS.peek(key, fmt)
+    if entry:
+        sizes = [c.get('filesize') or c.get('filesize_approx')
+                 for c in entry['value'].get('requested_formats') or [entry['value']]]
+        if all(sizes):
+            return int(sum(sizes)), 'resolved'
+    streams = source['streams']
+    audio_only = sum(s['bytes'] for s in streams if s.get('vcodec') == 'none')
+    if plan['op'] == 'link':
+        return sum(s['bytes'] for s in streams), 'source'
+    if plan['op'] in ('remux_audio', 'extract_audio'):
+        if audio_only:
+            return audio_only, 'source'
+        # Progressive source: its audio share from the bitrate
+        abr = next((s.get('abr') for s in streams if s.get('abr')), None)
+        return int(abr * 1000 / 8 * (source.get('duration') or 0)) if abr else 0, 'estimate'
+    video = [s for s in streams if s.get('vcodec') != 'none']
+    scale = (plan['height'] / max(s.get('height') or 0 for s in video)) ** 2
+    return int(audio_only + sum(s['bytes'] for s in video) * scale), 'estimate'
+
+def find_derivation(job_id: str, fmt: str, key: str) -> Optional[Tuple[Dict[str, Any], dict]]:
+    """The finished job of the same media that can serve `fmt` most cheaply, and the plan."""
+    with JOBS_LOCK:
+        candidates = [dict(j) for j in JOBS.values()
+                      if j['id'] != job_id and j.get('media_key') == key and j['status'] == 'finished'
+                      and j.get('streams') and j.get('file') and not j.get('playlist')]
+    found = None
+    for source in sorted(candidates, key=lambda j: j['created'], reverse=True):
+        plan = derivation_plan(fmt, source)
+        if plan is None or (found and DERIVE_COST[plan['op']] >= DERIVE_COST[found[1]['op']]):
+            continue
+        if os.path.exists(source['file']):
+            found = (source, plan)
+    return found
+
+def count_derived(job_id: str):
+    with JOBS_LOCK:
+        derived = (JOBS.get(job_id) or {}).get('derived') or {}
+        DERIVED['jobs'] += 1
+        DERIVED['upstream_bytes_avoided'] += derived.get('upstream_bytes_avoided') or 0
+
+def derive_job(job_id: str, fmt: str, filename_base: str, key: str) -> bool:
+    """Serve the job from an earlier download of the same media; False if none can."""
+    found = find_derivation(job_id, fmt, key)
+    if not found:
+        return False
+    source, plan = found
+    avoided, basis = upstream_bytes_avoided(fmt, key, plan, source)
+    # A link holds the same streams and an audio copy or conversion the audio ones, so a
+    # repeat request can link to this job; a re-encoded video is not a source
+    if plan['op'] == 'link':
+        streams = source['streams']
+    elif plan['op'] != 'downscale':
+        streams = [s for s in source['streams'] if s.get('vcodec') == 'none'] or None
+    else:
+        streams = None
+    update_job(job_id, stage='derive', streams=streams, duration=source.get('duration'),
+               derived={'from': source['id'], 'source_format': source['format'], 'op': plan['op'],
+                        'upstream_bytes_avoided': avoided, 'basis': basis})
+    src = Path(source['file'])
+    if plan['op'] == 'link':
+        out = DOWNLOAD_DIR / f"{filename_base}{src.suffix}"
+        try:
+            with TRACES.span(job_id, 'derive', op='link', source=source['id']):
+                try:
+                    os.link(src, out)
+                except OSError:
+                    shutil.copyfile(src, out)  # another filesystem, or no hard links
+        except OSError:
+            update_job(job_id, stage='queued', streams=None, derived=None)
+            return False
+        count_derived(job_id)
+        finish_job(job_id, out)
+        return True
+    task = {k: v for k, v in plan.items() if k != 'ext'}
+    task.update(inputs=[str(src)], output=str(DOWNLOAD_DIR / f"{filename_base}.{plan['ext']}"),
+                keep_inputs=True, derived_from=source['id'])
+    submit_postprocess(job_id, task, filename_base)
+    return True
+
+def requeue_job(job_id: str):
+    with JOBS_LOCK:
+        job = dict(JOBS[job_id])
+    FETCH_POOL.submit(run_download_job, job_id, job['url'], job['format'], job['filename_base'])
+
+# -------- Playlist jobs ---------
+# A playlist job downloads its entries one after another; each fetched entry goes
+# to the post-processing pool right away and is listed in the job's `entries`
+# once its file is final, so the ZIP stream can send it while later entries
+# are still downloading.
+PLAYLIST_MAX_ENTRIES = int(os.environ.get('MPD_PLAYLIST_MAX', '200'))
+PLAYLIST_KINDS = ('playlist', 'channel')
+# Serializes read-modify-write of a job's entries list across fetch and post-process threads
+_ENTRIES_LOCK = threading.Lock()
+
+def update_entry(job_id: str, index: int, **fields):
+    """Apply an entry transition; only that entry is journaled, not the whole list."""
+    with _ENTRIES_LOCK:
+        with JOBS_LOCK:
+            job = JOBS.get(job_id)
+            entries = job and job.get('entries')
+            if not entries:
+                return
+            # Replace rather than mutate: readers may be serializing the old list
+            entries = [dict(e, **fields) if e['index'] == index else e for e in entries]
+            entry = next(e for e in entries if e['index'] == index)
+            done = sum(e['status'] == 'finished' for e in entries)
+            job.update(entries=entries, entries_done=done, version=next(_JOB_SEQ))
+            version = job['version']
+        JOURNAL.append_entry(job_id, version, entry, entries_done=done)
+    JOB_CHANGES.notify()
+
+def finish_entry(job_id: str, index: int, produced_file: Path):
+    update_entry(job_id, index, status='finished', file=str(produced_file),
+                 ext=produced_file.suffix.lstrip('.'), size=produced_file.stat().st_size)
+
+def entry_postprocessed(job_id: str, index: int, task: dict, future):
+    if future.cancelled():  # pool shut down: the entry is fetched again after a restart
+        update_entry(job_id, index, status='queued')
+        return
+    try:
+        result = future.result()
+    except Exception as e:
+        result = {'ok': False, 'error': str(e), 'started': time.time(), 'finished': time.time()}
+    TRACES.record(job_id, f"postprocess:{task['op']}", result['started'], result['finished'],
+                  cpu_s=result.get('cpu_s'), ok=result['ok'], entry=index)
+    if not result['ok']:
+        if SHUTDOWN.is_set():
+            update_entry(job_id, index, status='queued')
+        else:
+            update_entry(job_id, index, status='error', error=f"Post-processing failed: {result['error']}")
+        return
+    for p in task['inputs']:
+        try:
+            os.remove(p)
+        except OSError:
+            pass
+    finish_entry(job_id, index, Path(task['output']))
+
+def entry_settled(job_id: str, index: int, task: dict, outstanding: dict, filename_base: str, future):
+    try:
+        entry_postprocessed(job_id, index, task, future)
+    finally:
+        playlist_part_done(job_id, outstanding, filename_base)
+
+def playlist_part_done(job_id: str, outstanding: dict, filename_base: str):
+    """Count down one part of a playlist job (its fetch loop or an entry's ffmpeg task); the last one finishes it.
+
+    The fetch worker does not wait for post-processing: it goes back to the pool and whichever part
+    settles last (usually an ffmpeg callback) runs `finish_playlist_job`.
+    """
+    with _ENTRIES_LOCK:
+        outstanding['parts'] -= 1
+        last = outstanding['parts'] == 0
+    if last:
+        finish_playlist_job(job_id, filename_base)
+
+def finish_playlist_job(job_id: str, filename_base: str):
+    if stop_requested(job_id, filename_base):
+        return
+    with JOBS_LOCK:
+        done = [e for e in JOBS[job_id]['entries'] if e['status'] == 'finished']
+    if not done:
+        update_job(job_id, status='error', stage='done', error='No playlist entry could be downloaded')
+        return
+    update_job(job_id, status='finished', stage='done', ext='zip', percent=100,
+               size=sum(e['size'] or 0 for e in done))
+
+def list_playlist(url: str, job_id: str) -> List[dict]:
+    """Flat entry list of a playlist (no per-entry extraction), capped at PLAYLIST_MAX_ENTRIES."""
+    opts = {'quiet': True, 'no_warnings': True, 'extract_flat': 'in_playlist',
+            'playlistend': PLAYLIST_MAX_ENTRIES}
+    with TRACES.span(job_id, 'extract', playlist=True):
+        with yt_dlp.YoutubeDL(opts) as ydl:
+            info = ydl.extract_info(url, download=False) or {}
+    raw = [e for e in info.get('entries') or [] if e] if info.get('_type') == 'playlist' else [info]
+    return [{'index': i, 'title': e.get('title') or e.get('id') or f"Entry {i}",
+             'url': e.get('webpage_url') or e.get('url'), 'status': 'queued',
+             'file': None, 'ext': None, 'size': None, 'error': None}
+            for i, e in enumerate(raw[:PLAYLIST_MAX_ENTRIES], 1) if e.get('webpage_url') or e.get('url')]
+
+def run_playlist_job(job_id: str, url: str, fmt: str, filename_base: str):
+    job = JOBS[job_id]
+    entries = job.get('entries')
+    if not entries:
+        update_job(job_id, stage='fetch')
+        try:
+            entries = list_playlist(url, job_id)
+        except Exception as e:
+            if not stop_requested(job_id, filename_base):
+                update_job(job_id, status='error', stage='done', error=str(e))
+            return
+        if not entries:
+            update_job(job_id, status='error', stage='done', error='Playlist is empty')
+            return
+        update_job(job_id, entries=entries, entries_done=0)
+    selector = job_format_selectors().get(fmt, PROGRESSIVE_SELECTOR)
+    rate_cap = job.get('rate_limit') or 0
+    flow = INGRESS.open(f"job:{job_id}", cap=rate_cap, interactive=job.get('priority') != 'bulk')
+    throttle = ytdlp_throttle_hook(flow, lambda: job_canceled(job_id))
+    gate = open_fragment_gate(job_id, job)
+    chunk_size = job.get('http_chunk_size') or fragments.HTTP_CHUNK_SIZE
+    progress = FetchProgress()
+    total_entries = len(entries)
+
+    def hook(d):
+        if job_canceled(job_id):
+            raise Exception('Canceled by user')
+        if SHUTDOWN.is_set():
+            raise Exception('Interrupted by shutdown')
+        if d.get('status') == 'downloading':
+            fields = progress.update(d)
+            throttle(d)
+            # Whole entries count as done once fetched; the current one by its byte progress
+            fields['percent'] = (fetched_count + (fields['percent'] or 0) / 100) / total_entries * 100
+            update_job(job_id, status='downloading', **fields)
+
+    # The fetch loop holds one part until it is done, so early callbacks cannot finish the job
+    outstanding = {'parts': 1}
+    postprocessing = False
+    fetched_count = 0
+    try:
+        for entry in entries:
+            if entry['status'] == 'finished' and entry['file'] and os.path.exists(entry['file']):
+                fetched_count += 1  # done before a restart
+                continue
+            if job_canceled(job_id) or SHUTDOWN.is_set():
+                break
+            index = entry['index']
+            progress.reset()
+            update_entry(job_id, index, status='downloading', error=None)
+            try:
+                with TRACES.span(job_id, 'fetch', entry=index, selector=selector):
+                    fetched = fetch_stage(entry['url'], selector, f"{filename_base}_{index:03d}", [hook],
+                                          rate_cap, job_id=job_id, gate=gate, http_chunk_size=chunk_size,
+                                          progress=progress)
+            except Exception as e:
+                if job_canceled(job_id) or SHUTDOWN.is_set():
+                    break
+                update_entry(job_id, index, status='error', error=str(e)[:300])
+                continue
+            finally:
+                fetched_count += 1
+            task = plan_postprocess(fmt, fetched)
+            if task:
+                update_entry(job_id, index, status='processing')
+                with _ENTRIES_LOCK:
+                    outstanding['parts'] += 1
+                postprocessing = True
+                postprocess.submit(task).add_done_callback(
+                    functools.partial(entry_settled, job_id, index, task, outstanding, filename_base))
+            else:
+                finish_entry(job_id, index, fetched['paths'][0])
+    finally:
+        flow.close()
+        close_fragment_gate(job_id, gate)
+    update_job(job_id, stage='postprocess' if postprocessing else 'fetch')
+    playlist_part_done(job_id, outstanding, filename_base)
+
 def run_download_job(job_id: str, url: str, fmt: str, filename_base: str):
     job = JOBS.get(job_id)
     if not job:
         return
+    TRACES.record(job_id, 'queue_wait', job.get('recovered_at') or job['created'], time.time())
     if yt_dlp is None:
         update_job(job_id, status='error', error='yt-dlp not installed')
         return
@@ -258,151 +1181,157 @@ def run_download_job(job_id: str, url: str, fmt: str, filename_base: str):
     if job_canceled(job_id):
         update_job(job_id, status='canceled', error='Canceled before start')
         return
+    if SHUTDOWN.is_set():
+        update_job(job_id, status='interrupted', stage='interrupted')
+        return
+    if job.get('playlist'):
+        run_playlist_job(job_id, url, fmt, filename_base)
+        return
 
     # Build format string depending on user choice and ffmpeg availability
-    # If ffmpeg missing, force a progressive stream (single file including audio+video)
-    progressive_selector = 'best[ext=mp4][acodec!=none][vcodec!=none][height<=720]/best[acodec!=none][vcodec!=none]'  # safer
-    quality_map = {
-        'best': 'bv*[height<=1080]+ba/best[height<=1080]' if FFMPEG_AVAILABLE else progressive_selector,
-        '720p': 'bv*[height<=720]+ba/best[height<=720]' if FFMPEG_AVAILABLE else progressive_selector,
-        'audio': 'bestaudio/best'
-    }
+    selector = job_format_selectors().get(fmt, PROGRESSIVE_SELECTOR)
+    if fmt.startswith('audio'):
+        fallback_selector = 'bestaudio[ext=mp3]/bestaudio[ext=m4a]/bestaudio'
+    else:
+        fallback_selector = PROGRESSIVE_SELECTOR
 
-    outtmpl = str(DOWNLOAD_DIR / f"{filename_base}.%(ext)s")
+    cache_key = stream_key(url)
+    if cache_key != job.get('media_key') and cache_key != url:
+        update_job(job_id, media_key=cache_key)  # a short link resolved
+    # An earlier download of the same media may already hold what this format needs
+    if DERIVE and job.get('media_key') and job.get('note') != 'derive_failed':
+        if derive_job(job_id, fmt, filename_base, job['media_key']):
+            return
+
+    # Share the ingress budget with other jobs; the per-job cap also goes to yt-dlp's own limiter
+    rate_cap = job.get('rate_limit') or 0
+    flow = INGRESS.open(f"job:{job_id}", cap=rate_cap, interactive=job.get('priority') != 'bulk')
+    throttle = ytdlp_throttle_hook(flow, lambda: job_canceled(job_id))
+    gate = open_fragment_gate(job_id, job)
+    chunk_size = job.get('http_chunk_size') or fragments.HTTP_CHUNK_SIZE
+    progress = FetchProgress()
 
     def hook(d):
         if job_canceled(job_id):
             raise Exception('Canceled by user')
-        if d.get('status') == 'downloading':
-            total = d.get('total_bytes') or d.get('total_bytes_estimate') or 0
-            downloaded = d.get('downloaded_bytes') or 0
-            percent = (downloaded / total * 100) if total else None
-            update_job(job_id,
-                       status='downloading',
-                       downloaded=downloaded,
-                       total=total,
-                       percent=percent,
-                       speed=d.get('speed'),
-                       eta=d.get('eta'))
-        elif d.get('status') == 'finished':
-            update_job(job_id, status='processing')
-
-    ydl_opts = {
-        'format': quality_map.get(fmt, progressive_selector),
-        'quiet': True,
-        'no_warnings': True,
-        'outtmpl': outtmpl,
-        'progress_hooks': [hook],
-        'merge_output_format': 'mp4' if FFMPEG_AVAILABLE else None
-    }
+        if SHUTDOWN.is_set():
+            raise Exception('Interrupted by shutdown')
+        if d.get('status') in ('downloading', 'finished'):
+            fields = progress.update(d)
+            if d['status'] == 'downloading':
+                throttle(d)
+                update_job(job_id, status='downloading', fragments_done=d.get('fragment_index'),
+                           fragment_count=d.get('fragment_count'), **fields)
+            else:
+                update_job(job_id, **fields)
 
-    # Only add postprocessor if ffmpeg present and audio requested
-    if fmt == 'audio':
-        if FFMPEG_AVAILABLE:
-            ydl_opts['postprocessors'] = [{
-                'key': 'FFmpegExtractAudio', 'preferredcodec': 'mp3', 'preferredquality': '192'
-            }]
-        else:
-            # Try to pick an existing audio format (no conversion)
-            ydl_opts['format'] = 'bestaudio[ext=mp3]/bestaudio[ext=m4a]/bestaudio'
-
-    produced_file = None
-    produced_ext = None
+    # A warm entry from the preview lets us skip extraction and fetch bytes right away
+    cached = STREAMS.get(cache_key, fmt)
+    update_job(job_id, stage='fetch', stream_cache='hit' if cached else 'miss')
+    fetched = None
     primary_error = None
     try:
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            ydl.extract_info(url, download=True)
-    except Exception as e:
-        primary_error = str(e)
-        if 'Canceled by user' in primary_error:
-            update_job(job_id, status='canceled', error='Canceled')
-            return
-        update_job(job_id, note='primary_failed', status='retrying')
-
-    preferred_exts = ['mp4', 'mp3', 'm4a', 'webm', 'mkv', 'wav']
-    if not primary_error:
-        for ext in preferred_exts:
-            cand = DOWNLOAD_DIR / f"{filename_base}.{ext}"
-            if cand.exists():
-                produced_file = cand
-                produced_ext = ext
-                break
-        if not produced_file:
-            for p in DOWNLOAD_DIR.glob(f"{filename_base}*"):
-                if p.is_file() and p.suffix.replace('.', '') in preferred_exts:
-                    produced_file = p
-                    produced_ext = p.suffix.replace('.', '')
-                    break
-
-    # Fallback attempt only if primary failed or file missing
-    if not produced_file:
-        if job_canceled(job_id):
-            update_job(job_id, status='canceled', error='Canceled')
-            return
-        fallback_fmt = progressive_selector if fmt != 'audio' else ('bestaudio[ext=mp3]/bestaudio[ext=m4a]/bestaudio')
-        fallback_out = str(DOWNLOAD_DIR / f"{filename_base}_fb.%(ext)s")
-        fb_opts = {
-            'format': fallback_fmt,
-            'quiet': True,
-            'no_warnings': True,
-            'outtmpl': fallback_out,
-            'progress_hooks': [hook]
-        }
-        if fmt == 'audio' and FFMPEG_AVAILABLE:
-            fb_opts['postprocessors'] = [{
-                'key': 'FFmpegExtractAudio', 'preferredcodec': 'mp3', 'preferredquality': '192'
-            }]
-        try:
-            with yt_dlp.YoutubeDL(fb_opts) as ydl:
-                if job_canceled(job_id):
-                    update_job(job_id, status='canceled', error='Canceled')
+        if cached:
+            try:
+                with TRACES.span(job_id, 'fetch', attempt='cached', selector=selector):
+                    fetched = fetch_stage(url, selector, filename_base, [hook], rate_cap,
+                                          resolved=cached['value'], job_id=job_id, gate=gate,
+                                          http_chunk_size=chunk_size, progress=progress)
+                update_job(job_id, resolve_saved_s=round(cached['resolve_s'], 3))
+            except Exception:
+                if stop_requested(job_id, filename_base):
                     return
-                ydl.extract_info(url, download=True)
-        except Exception as e2:
-            if job_canceled(job_id):
-                update_job(job_id, status='canceled', error='Canceled')
-                return
-            if not primary_error:
-                primary_error = str(e2)
-        if job_canceled(job_id):
-            update_job(job_id, status='canceled', error='Canceled')
-            return
-        for ext in preferred_exts:
-            cand = DOWNLOAD_DIR / f"{filename_base}_fb.{ext}"
-            if cand.exists():
-                produced_file = cand
-                produced_ext = ext
-                break
+                # Signed URLs can be revoked before their advertised expiry; resolve afresh
+                STREAMS.invalidate(cache_key)
+                update_job(job_id, stream_cache='stale')
+        if not fetched:
+            try:
+                with TRACES.span(job_id, 'fetch', attempt='primary', selector=selector):
+                    fetched = fetch_stage(url, selector, filename_base, [hook], rate_cap, job_id=job_id,
+                                          gate=gate, http_chunk_size=chunk_size, progress=progress)
+                update_job(job_id, resolve_s=round(fetched['resolve_s'], 3))
+            except Exception as e:
+                primary_error = str(e)
+                if stop_requested(job_id, filename_base):
+                    return
+                update_job(job_id, note='primary_failed', status='retrying')
 
-    if job_canceled(job_id):
-        update_job(job_id, status='canceled', error='Canceled')
-        # Optional cleanup of partials
-        for p in DOWNLOAD_DIR.glob(f"{filename_base}*"):
+        # Fallback attempt only if primary failed
+        if not fetched:
+            progress.reset()
             try:
-                p.unlink()
-            except Exception:
-                pass
+                with TRACES.span(job_id, 'fallback', selector=fallback_selector):
+                    fetched = fetch_stage(url, fallback_selector, f"{filename_base}_fb", [hook], rate_cap,
+                                          job_id=job_id, gate=gate, http_chunk_size=chunk_size, progress=progress)
+            except Exception as e2:
+                if stop_requested(job_id, filename_base):
+                    return
+                if not primary_error:
+                    primary_error = str(e2)
+    finally:
+        flow.close()
+        close_fragment_gate(job_id, gate)
+
+    if stop_requested(job_id, filename_base):
         return
 
-    if not produced_file:
-        update_job(job_id, status='error', error=primary_error or 'No file produced (progressive format unavailable)')
+    if not fetched:
+        update_job(job_id, status='error', stage='done', error=primary_error or 'No file produced (progressive format unavailable)')
         return
 
-    size = produced_file.stat().st_size
-    update_job(job_id, status='finished', file=str(produced_file), ext=produced_ext, size=size)
+    # Partial files of formats this run did not pick again can never be resumed
+    redownloaded = fetched['redownloaded_bytes']
+    for part in DOWNLOAD_DIR.glob(f"{filename_base}*.part"):
+        try:
+            redownloaded += part.stat().st_size
+            part.unlink()
+        except OSError:
+            pass
+    # What this file is made of, for later jobs that can be derived from it
+    update_job(job_id, resumed_bytes=fetched['resumed_bytes'], redownloaded_bytes=redownloaded,
+               streams=fetched_streams(fetched), duration=fetched['info'].get('duration'))
+    if job.get('resumed'):
+        with JOBS_LOCK:
+            RECOVERY['resumed_bytes'] += fetched['resumed_bytes']
+            RECOVERY['redownloaded_bytes'] += redownloaded
+
+    task = plan_postprocess(fmt, fetched)
+    if task:
+        submit_postprocess(job_id, task, filename_base)
+    else:
+        finish_job(job_id, fetched['paths'][0])
 
 @app.post('/api/start_download')
-async def api_start_download(url: str = Form(...), format: str = Form('best')):
+async def api_start_download(url: str = Form(...), format: str = Form('best'),
+                             rate_limit: str = Form(''), priority: str = Form('interactive'),
+                             client: str = Form(''), batch: str = Form(''),
+                             concurrent_fragment_downloads: str = Form('auto'), http_chunk_size: str = Form('')):
     url = url.strip()
+    if DRAINING.is_set():
+        error = 'Server is shutting down' if DRAIN['reason'] == 'shutdown' else 'Server is draining'
+        return JSONResponse({'ok': False, 'error': error}, status_code=503)
     if not url:
         return {'ok': False, 'error': 'Empty URL'}
-    # Construct filename base using uuid for uniqueness
-    safe_base = re.sub(r'[^a-zA-Z0-9_-]+', '_', url)[:30] or 'video'
+    if priority not in PRIORITY_WEIGHTS:
+        return {'ok': False, 'error': f"Unknown priority '{priority}'"}
+    rate_cap = parse_rate(rate_limit)
+    fragment_concurrency = None  # adaptive
+    if concurrent_fragment_downloads.strip() not in ('', 'auto'):
+        if not concurrent_fragment_downloads.strip().isdigit() or int(concurrent_fragment_downloads) < 1:
+            return {'ok': False, 'error': "concurrent_fragment_downloads must be 'auto' or a positive number"}
+        fragment_concurrency = min(int(concurrent_fragment_downloads), FRAGMENTS.connections)
+    key = media_keys.parse(url)
+    # Canonical stem (platform_id) plus the job id for uniqueness
+    safe_base = media_keys.filename_base(key, url, 30)
     job_id = uuid.uuid4().hex
     with JOBS_LOCK:
         JOBS[job_id] = {
             'id': job_id,
             'url': url,
+            'media_key': key.key if key is not None and key.id else None,
+            'playlist': key is not None and key.kind in PLAYLIST_KINDS,
+            'entries': None,
+            'entries_done': 0,
             'format': format,
             'status': 'queued',
             'percent': 0,
@@ -414,9 +1343,40 @@ async def api_start_download(url: str = Form(...), format: str = Form('best')):
             'ext': None,
             'size': None,
             'error': None,
+            'stage': 'queued',
+            'created': time.time(),
+            'postprocess_queue_s': None,
+            'postprocess_s': None,
+            'postprocess_cpu_s': None,
+            'stream_cache': None,
+            'resolve_s': None,
+            'resolve_saved_s': None,
+            'rate_limit': rate_cap,
+            'concurrent_fragment_downloads': fragment_concurrency,
+            'http_chunk_size': parse_rate(http_chunk_size),
+            'fragment_limit': None,
+            'fragments_done': None,
+            'fragment_count': None,
+            'fragment_stats': None,
+            'components': None,
+            'streams': None,
+            'duration': None,
+            'derived': None,
+            'priority': priority,
+            'client': client or None,
+            'batch': batch or None,
+            'filename_base': f"{safe_base}_{job_id[:6]}",
+            'resumed': False,
+            'resumed_bytes': 0,
+            'redownloaded_bytes': 0,
+            'postprocess_task': None,
+            'version': next(_JOB_SEQ),
             'cancel': False
         }
-    threading.Thread(target=run_download_job, args=(job_id, url, format, f"{safe_base}_{job_id[:6]}"), daemon=True).start()
+        snapshot = dict(JOBS[job_id])
+    await journal_append(snapshot)
+    JOB_CHANGES.notify()
+    FETCH_POOL.submit(run_download_job, job_id, url, format, snapshot['filename_base'])
     return {'ok': True, 'job_id': job_id}
 
 @app.get('/api/job/{job_id}')
@@ -425,34 +1385,124 @@ async def api_job_status(job_id: str):
         job = JOBS.get(job_id)
         if not job:
             return {'ok': False, 'error': 'Job not found'}
-        return {'ok': True, 'job': job}
+        job = public_job(job)
+    job['spans'] = TRACES.job_spans(job_id)
+    return {'ok': True, 'job': job}
+
+# -------- Streamed ZIP archives ---------
+# An archive is sent while its entries are still being produced: it waits for job
+# changes between entries and only writes the central directory once no more can come.
+ARCHIVE_RECHECK_S = 2.0
+_UNSAFE_NAME_RE = re.compile(r'[\\/:*?"<>|\x00-\x1f]+')
+
+def archive_name(title: str, ext: Optional[str], limit: int = 80) -> str:
+    name = _UNSAFE_NAME_RE.sub('_', title or '').strip(' ._')[:limit] or 'file'
+    return f"{name}.{ext}" if ext else name
+
+def archive_items(job: Dict[str, Any], folder: str = '') -> Tuple[List[Tuple[str, str, Path]], bool]:
+    """Finished files of a job as (key, name in archive, path), and whether more may follow."""
+    items = []
+    if job.get('playlist'):
+        for e in job.get('entries') or []:
+            if e['status'] == 'finished' and e.get('file'):
+                items.append((f"{job['id']}:{e['index']}",
+                              folder + archive_name(f"{e['index']:03d} {e['title']}", e.get('ext')), Path(e['file'])))
+    elif job['status'] == 'finished' and job.get('file'):
+        items.append((job['id'], folder + Path(job['file']).name, Path(job['file'])))
+    return items, job['status'] not in TERMINAL_STATUSES + ('interrupted',)
+
+def batch_archive_items(batch: str) -> Tuple[List[Tuple[str, str, Path]], bool]:
+    with JOBS_LOCK:
+        jobs = [dict(j) for j in JOBS.values() if j.get('batch') == batch]
+    items, more = [], False
+    for job in sorted(jobs, key=lambda j: j['created']):
+        # Playlists get a folder each so their numbered entries do not interleave
+        job_items, job_more = archive_items(job, f"{job['filename_base']}/" if job.get('playlist') else '')
+        items += job_items
+        more = more or job_more
+    return items, more
+
+async def archive_stream(collect):
+    """ZIP of the files `collect()` reports, sent as they become ready.
+
+    The response is already under way, so file work is admitted (never timed
+    out by the bulkhead), and a file that vanished or changed size since it was
+    listed is left out instead of cutting the archive off before its central
+    directory.
+    """
+    zs = ZipStream()
+    sent = set()
+    names = set()
+    while True:
+        items, more = collect()
+        for key, name, path in items:
+            if key in sent:
+                continue
+            sent.add(key)
+            try:
+                st = await file_io_admitted(os.stat, path)
+                f = await file_io_admitted(open, path, 'rb')
+            except OSError:
+                continue  # deleted (job canceled) since it was listed
+            stem, dot, ext = name.rpartition('.')
+            n = 2
+            while name in names:
+                name = f"{stem} ({n}).{ext}" if dot else f"{ext} ({n})"
+                n += 1
+            names.add(name)
+            yield zs.begin_entry(name, st.st_size, st.st_mtime)
+            try:
+                async for chunk in iter_file(f):
+                    yield zs.add(chunk)
+                tail = zs.end_entry()
+            except (OSError, ValueError):
+                tail = zs.abandon_entry()
+                names.discard(name)
+            yield tail
+        if not more:
+            break
+        await JOB_CHANGES.wait(ARCHIVE_RECHECK_S)
+    yield zs.finish()
+
+def archive_response(collect, filename: str, flow_id: str, job: Optional[Dict[str, Any]] = None) -> StreamingResponse:
+    throttled = EGRESS.athrottle(archive_stream(collect), flow_id, cap=(job or {}).get('rate_limit') or 0,
+                                 interactive=(job or {}).get('priority') != 'bulk')
+    return StreamingResponse(throttled, media_type='application/zip',
+                             headers={'Content-Disposition': f'attachment; filename="{filename}"'})
 
 @app.get('/api/job/{job_id}/file')
 async def api_job_file(job_id: str):
     with JOBS_LOCK:
         job = JOBS.get(job_id)
+    if job and job.get('playlist'):
+        if job['status'] in ('error', 'canceled'):
+            return HTMLResponse(f"<h3>Playlist job {job['status']}</h3>", status_code=404)
+        # Streams entries that are done now and the rest as they finish
+        return archive_response(lambda: archive_items(JOBS[job_id]), f"{job['filename_base']}.zip",
+                                f"file:{job_id}", job)
     if not job or job.get('status') != 'finished' or not job.get('file'):
         return HTMLResponse('<h3>File not ready</h3>', status_code=404)
     path = Path(job['file'])
-    if not path.exists():
+    try:
+        f = await open_file(path)
+    except BulkheadTimeout:
+        return HTMLResponse('<h3>Server busy, try again shortly.</h3>', status_code=503)
+    except OSError:
         return HTMLResponse('<h3>File missing</h3>', status_code=404)
-    mime_map = {
-        'mp4': 'video/mp4',
-        'mkv': 'video/x-matroska',
-        'webm': 'video/webm',
-        'mp3': 'audio/mpeg',
-        'm4a': 'audio/mp4',
-        'wav': 'audio/wav'
-    }
-    media_type = mime_map.get(job.get('ext'), 'application/octet-stream')
-    def streamer():
-        with open(path, 'rb') as f:
-            while True:
-                chunk = f.read(8192)
-                if not chunk:
-                    break
-                yield chunk
-    return StreamingResponse(streamer(), media_type=media_type, headers={'Content-Disposition': f'attachment; filename="{path.name}"'})
+    media_type = MIME_MAP.get(job.get('ext'), 'application/octet-stream')
+    throttled = EGRESS.athrottle(iter_file(f), f"file:{job_id}", cap=job.get('rate_limit') or 0,
+                                 interactive=job.get('priority') != 'bulk')
+    return StreamingResponse(throttled, media_type=media_type, headers={'Content-Disposition': f'attachment; filename="{path.name}"'})
+
+@app.get('/api/batch/{batch}/archive')
+async def api_batch_archive(batch: str):
+    """One ZIP of every job tagged `batch`, streamed as the jobs finish."""
+    with JOBS_LOCK:
+        found = any(j.get('batch') == batch for j in JOBS.values())
+    if not found:
+        return HTMLResponse('<h3>Batch not found</h3>', status_code=404)
+    filename = re.sub(r'[^a-zA-Z0-9_-]+', '_', batch)[:40] or 'batch'
+    return archive_response(lambda: batch_archive_items(batch), f"{filename}.zip", f"batch:{batch}")
 
 @app.post('/api/job/{job_id}/cancel')
 async def api_job_cancel(job_id: str):
@@ -466,5 +1516,264 @@ async def api_job_cancel(job_id: str):
         job['cancel'] = True
         if job.get('status') not in ('canceled','finished','error'):
             job['status'] = 'canceling'
+        job['version'] = next(_JOB_SEQ)
+        snapshot = dict(job)
+    await journal_append(snapshot)
+    JOB_CHANGES.notify()
     return {'ok': True, 'status': 'canceling'}
 
+JOBS_MAX_WAIT = 30.0
+
+def select_jobs(ids: List[str], client: Optional[str], batch: Optional[str], since: int):
+    """Jobs in scope that changed after `since`, the scope's cursor and unknown ids."""
+    with JOBS_LOCK:
+        if ids:
+            scope = [JOBS[i] for i in ids if i in JOBS]
+            missing = [i for i in ids if i not in JOBS]
+        else:
+            scope = list(JOBS.values())
+            missing = []
+        if client:
+            scope = [j for j in scope if j.get('client') == client]
+        if batch:
+            scope = [j for j in scope if j.get('batch') == batch]
+        changed = [public_job(j) for j in scope if j['version'] > since]
+        cursor = max([since] + [j['version'] for j in scope])
+    return changed, cursor, missing
+
+@app.get('/api/jobs')
+async def api_jobs(request: Request, ids: List[str] = Query(default=[]), client: Optional[str] = None,
+                   batch: Optional[str] = None, since: int = 0, wait: float = 0):
+    """Jobs (by id list and/or client/batch tag) whose version moved past `since`.
+
+    `ids` may be repeated or comma separated. The response `cursor` is the next
+    `since`; it doubles as ETag so If-None-Match answers 304 when nothing in scope
+    changed. With `wait` > 0 the request is held until something changes or the
+    wait (capped at JOBS_MAX_WAIT seconds) runs out.
+    """
+    ids = [i for part in ids for i in part.split(',') if i]
+    if not since:
+        # A bare If-None-Match works as a cursor too
+        tag = (request.headers.get('if-none-match') or '').strip('W/"')
+        since = int(tag) if tag.isdigit() else 0
+    deadline = time.monotonic() + min(max(wait, 0), JOBS_MAX_WAIT)
+    while True:
+        changed, cursor, missing = select_jobs(ids, client, batch, since)
+        remaining = deadline - time.monotonic()
+        if changed or remaining <= 0:
+            break
+        await JOB_CHANGES.wait(remaining)
+    etag = f'"{cursor}"'
+    if not changed and request.headers.get('if-none-match') == etag:
+        return Response(status_code=304, headers={'ETag': etag, 'Cache-Control': 'no-cache'})
+    return JSONResponse({'ok': True, 'cursor': cursor, 'jobs': changed, 'missing': missing},
+                        headers={'ETag': etag, 'Cache-Control': 'no-cache'})
+
+# -------- Crash-safe restarts ---------
+def active_job_ids() -> List[str]:
+    with JOBS_LOCK:
+        return [j['id'] for j in JOBS.values() if j['status'] not in TERMINAL_STATUSES + ('interrupted',)]
+
+def recover_jobs():
+    """Rebuild JOBS from the journal and resume every job a previous process left unfinished."""
+    global _JOB_SEQ
+    journaled = JOURNAL.load()
+    if not journaled:
+        return
+    # Keep versions (and so client cursors) increasing across restarts
+    _JOB_SEQ = itertools.count(max(j.get('version', 0) for j in journaled.values()) + 1)
+    resume = []
+    for job in journaled.values():
+        job['version'] = next(_JOB_SEQ)
+        if job.get('status') not in TERMINAL_STATUSES and job.get('cancel'):
+            job.update(status='canceled', stage='done', error='Canceled')
+            cleanup_job_files(job['filename_base'])
+        elif job.get('status') not in TERMINAL_STATUSES:
+            job.update(status='queued', resumed=True, recovered_at=time.time(), percent=0, speed=None, eta=None)
+            resume.append(job)
+        with JOBS_LOCK:
+            JOBS[job['id']] = job
+            RECOVERY['restored_jobs'] += 1
+    # The re-stamped versions replace the history just replayed instead of being appended to it
+    JOURNAL.rewrite([dict(job) for job in journaled.values()])
+    for job in resume:
+        RECOVERY['resumed_jobs'] += 1
+        task = job.get('postprocess_task')
+        if task and job.get('stage') in ('postprocess_queue', 'postprocess') and all(
+                os.path.exists(p) for p in task['inputs']):
+            # Fetched files are complete: only redo the (idempotent) ffmpeg step
+            submit_postprocess(job['id'], task, job['filename_base'])
+        else:
+            update_job(job['id'], stage='queued')
+            FETCH_POOL.submit(run_download_job, job['id'], job['url'], job['format'], job['filename_base'])
+
+async def shutdown_drain_jobs():
+    """Let running jobs finish within MPD_SHUTDOWN_GRACE, then checkpoint the rest."""
+    drain('shutdown')
+    deadline = time.monotonic() + SHUTDOWN_GRACE
+    while active_job_ids() and time.monotonic() < deadline:
+        await asyncio.sleep(0.2)
+    # Downloads stop at their next progress tick and keep their .part files
+    SHUTDOWN.set()
+    postprocess.shutdown(wait=False)
+    deadline = time.monotonic() + 5
+    while active_job_ids() and time.monotonic() < deadline:
+        await asyncio.sleep(0.1)
+    def checkpoint(job_ids):
+        for job_id in job_ids:
+            update_job(job_id, status='interrupted', stage='interrupted')
+    await file_io_admitted(checkpoint, active_job_ids())
+
+@app.get('/api/recovery')
+async def api_recovery():
+    with JOBS_LOCK:
+        return {'ok': True, 'draining': DRAINING.is_set(), **RECOVERY}
+
+@app.get('/api/trace')
+async def api_trace(since: Optional[float] = None, until: Optional[float] = None, seconds: Optional[float] = None):
+    """Chrome trace-event JSON of job spans in a window (epoch seconds, or the last `seconds`)."""
+    if seconds and not since:
+        since = time.time() - seconds
+    return TRACES.chrome_trace(since, until)
+
+@app.get('/api/bandwidth')
+async def api_bandwidth():
+    return {'ok': True, 'ingress': INGRESS.snapshot(), 'egress': EGRESS.snapshot(),
+            'fragments': FRAGMENTS.snapshot(), 'derived': dict(DERIVED)}
+
+@app.get('/api/executors')
+async def api_executors():
+    return {'ok': True, 'executors': executors.stats(), 'postprocess': postprocess.stats()}
+
+# -------- Readiness and capacity ---------
+def drain(reason: str):
+    """Stop accepting new jobs while running ones finish; a shutdown drain is never undone."""
+    with JOBS_LOCK:
+        if DRAIN['reason'] != 'shutdown':
+            DRAIN.update(reason=reason, since=DRAIN['since'] or time.time())
+        DRAINING.set()
+
+def sample_throughput() -> dict:
+    with JOBS_LOCK:
+        ended = dict(ENDED_JOBS)
+    return THROUGHPUT.sample(ingress_bytes=INGRESS.snapshot()['total_bytes'],
+                             egress_bytes=EGRESS.snapshot()['total_bytes'],
+                             jobs_finished=ended['finished'],
+                             jobs_failed=ended['error'])
+
+def rounded(value: Optional[float], scale: float = 1.0, digits: Optional[int] = None):
+    return None if value is None else round(value * scale, digits)
+
+def capacity_report() -> Dict[str, Any]:
+    """Jobs, executors, disk and throughput against their limits, and what they call for."""
+    with JOBS_LOCK:
+        live = [j for j in JOBS.values() if j['status'] not in TERMINAL_STATUSES + ('interrupted',)]
+        draining = dict(DRAIN) if DRAINING.is_set() else None
+    queued = sum(j['status'] == 'queued' for j in live)
+    waiting_ffmpeg = sum(j.get('stage') == 'postprocess_queue' for j in live)
+    # Bytes still to land on disk for jobs that know their size (merges need more on top)
+    pending_bytes = sum(max((j.get('total') or 0) - (j.get('downloaded') or 0), 0) for j in live)
+    max_queued = capacity.MAX_QUEUED_JOBS or 2 * FETCH_WORKERS
+    fetch = FETCH_POOL.stats()
+    ffmpeg = postprocess.stats()
+    connections = FRAGMENTS.snapshot()
+    recent = sample_throughput()
+    rates = recent['rates']
+    disk = shutil.disk_usage(DOWNLOAD_DIR)
+    free_after = disk.free - pending_bytes
+    ingress_load = None
+    if INGRESS.rate and rates['ingress_bytes'] is not None:
+        ingress_load = rates['ingress_bytes'] / INGRESS.rate
+    load, bottleneck = capacity.utilization({
+        'fetch': (fetch['running'] + fetch['queued']) / fetch['workers'],
+        'postprocess': (ffmpeg['running'] + ffmpeg['queued']) / ffmpeg['workers'],
+        'ingress': ingress_load,
+    })
+    not_ready = []
+    if draining:
+        not_ready.append('draining')
+    if free_after < capacity.MIN_FREE_DISK:
+        not_ready.append('disk')
+    if queued >= max_queued:
+        not_ready.append('queue')
+    return {
+        'ready': not not_ready,
+        'not_ready': not_ready,
+        'draining': draining,
+        'jobs': {
+            'active': len(live) - queued,
+            'queued': queued,
+            'waiting_ffmpeg': waiting_ffmpeg,
+            'max_active': FETCH_WORKERS,
+            'max_queued': max_queued,
+        },
+        'saturation': {
+            'fetch': fetch['saturation'],
+            'postprocess': round(ffmpeg['running'] / ffmpeg['workers'], 3),
+            'fragment_connections': round(connections['in_use'] / connections['connections'], 3),
+            'ingress': rounded(ingress_load, digits=3),
+        },
+        'executors': {'fetch': fetch, 'postprocess': ffmpeg},
+        'disk': {
+            'path': str(DOWNLOAD_DIR),
+            'free_bytes': disk.free,
+            'pending_bytes': pending_bytes,
+            'free_after_pending': free_after,
+            'min_free_bytes': capacity.MIN_FREE_DISK,
+        },
+        'throughput': {
+            'window_s': recent['window_s'],
+            'ingress_bps': rounded(rates['ingress_bytes']),
+            'egress_bps': rounded(rates['egress_bytes']),
+            'jobs_finished_per_min': rounded(rates['jobs_finished'], 60, 2),
+            'jobs_failed_per_min': rounded(rates['jobs_failed'], 60, 2),
+        },
+        'utilization': round(load, 3),
+        'bottleneck': bottleneck,
+        'target_utilization': capacity.TARGET_UTILIZATION,
+        'recommended_replica_delta': capacity.replica_delta(load, draining is not None, 'disk' in not_ready),
+    }
+
+async def sample_capacity_forever():
+    # Rates need history even when nobody polls /capacity
+    while True:
+        sample_throughput()
+        await asyncio.sleep(capacity.SAMPLE_INTERVAL_S)
+
+
+@app.get('/healthz')
+async def healthz():
+    """Liveness: the event loop answers and the job table is not stuck behind its lock."""
+    deadline = time.monotonic() + 1.0
+    while not JOBS_LOCK.acquire(blocking=False):
+        if time.monotonic() > deadline:
+            return JSONResponse({'ok': False, 'error': 'Job table locked for over 1s'}, status_code=503)
+        await asyncio.sleep(0.01)
+    JOBS_LOCK.release()
+    return {'ok': True}
+
+@app.get('/readyz')
+async def readyz():
+    """Readiness for new jobs; 503 while draining, short of disk or with a full queue."""
+    report = capacity_report()
+    jobs = report['jobs']
+    body = {'ready': report['ready'], 'not_ready': report['not_ready'], 'unfinished_jobs': jobs['active'] + jobs['queued']}
+    return JSONResponse(body, status_code=200 if report['ready'] else 503)
+
+@app.get('/capacity')
+async def api_capacity():
+    return {'ok': True, **capacity_report()}
+
+@app.post('/api/drain')
+async def api_drain():
+    drain('manual')
+    return {'ok': True, 'draining': True, 'unfinished_jobs': len(active_job_ids())}
+
+@app.post('/api/undrain')
+async def api_undrain():
+    with JOBS_LOCK:
+        if DRAIN['reason'] == 'shutdown':
+            return JSONResponse({'ok': False, 'error': 'Server is shutting down'}, status_code=409)
+        DRAIN.update(reason=None, since=None)
+        DRAINING.clear()
+    return {'ok': True, 'draining': False}
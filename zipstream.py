@@ -0,0 +1,136 @@
+"""Streaming ZIP writer: store mode, ZIP64 when needed, no seeking, constant memory.
+
+Media files do not compress, so entries are stored as is and the archive is
+produced front to back while it is being sent: a local header, the file's
+bytes as they are read, a data descriptor with the CRC-32 computed on the way,
+and at the end the central directory. Only one small record per entry is kept
+in memory, never file data, so a 50 GB playlist archive costs the same as a
+5 MB one and the first byte goes out as soon as the first entry is ready.
+
+Entries and offsets past 4 GiB (or more than 65535 entries) switch to the
+ZIP64 forms, which every current unzip tool and Python's zipfile read.
+
+    zs = ZipStream()
+    out.write(zs.begin_entry('a.mp4', size, mtime))
+    for chunk in chunks:
+        out.write(zs.add(chunk))
+    out.write(zs.end_entry())
+    out.write(zs.finish())
+"""
+import struct
+import time
+import zlib
+from typing import List, Optional, Tuple
+
+ZIP64_LIMIT = 0xFFFFFFFF
+ZIP64_COUNT_LIMIT = 0xFFFF
+
+_FLAGS = 0x08 | 0x800  # sizes/CRC in a data descriptor; UTF-8 names
+_VERSION_ZIP64 = 45
+_VERSION_STORE = 20
+_MADE_BY = (3 << 8) | _VERSION_ZIP64  # unix
+_FILE_ATTRS = (0o100644 & 0xFFFF) << 16
+
+
+def _dos_time(mtime: float) -> Tuple[int, int]:
+    t = time.localtime(mtime)
+    if t.tm_year < 1980:
+        return 0, (1 << 5) | 1  # 1980-01-01 00:00
+    return ((t.tm_hour << 11) | (t.tm_min << 5) | (t.tm_sec // 2),
+            ((t.tm_year - 1980) << 9) | (t.tm_mon << 5) | t.tm_mday)
+
+
+class ZipStream:
+    def __init__(self, zip64_limit: int = ZIP64_LIMIT):
+        self.zip64_limit = zip64_limit
+        self.offset = 0
+        self.entries: List[dict] = []
+        self._current: Optional[dict] = None
+
+    def _emit(self, data: bytes) -> bytes:
+        self.offset += len(data)
+        return data
+
+    def begin_entry(self, name: str, size: int, mtime: Optional[float] = None) -> bytes:
+        """Local header for a `size`-byte entry; its data must follow through add()."""
+        if self._current is not None:
+            raise RuntimeError('previous entry not ended')
+        encoded = name.encode('utf-8')
+        zip64 = size >= self.zip64_limit
+        dos_time, dos_date = _dos_time(mtime if mtime is not None else time.time())
+        self._current = {'name': encoded, 'size': size, 'zip64': zip64, 'offset': self.offset,
+                         'time': dos_time, 'date': dos_date, 'crc': 0, 'written': 0}
+        # With a data descriptor the header carries no sizes; ZIP64 entries still announce the extra
+        extra = struct.pack('<HHQQ', 0x0001, 16, 0, 0) if zip64 else b''
+        header = struct.pack('<IHHHHHIIIHH', 0x04034b50,
+                             _VERSION_ZIP64 if zip64 else _VERSION_STORE, _FLAGS, 0, dos_time, dos_date,
+                             0, ZIP64_LIMIT if zip64 else 0, ZIP64_LIMIT if zip64 else 0,
+                             len(encoded), len(extra))
+        return self._emit(header + encoded + extra)
+
+    def add(self, chunk: bytes) -> bytes:
+        entry = self._current
+        entry['crc'] = zlib.crc32(chunk, entry['crc'])
+        entry['written'] += len(chunk)
+        return self._emit(chunk)
+
+    def end_entry(self) -> bytes:
+        """Data descriptor of the current entry; ValueError (entry still open) on a size mismatch."""
+        entry = self._current
+        if entry['written'] != entry['size']:
+            raise ValueError(f"{entry['name'].decode()}: announced {entry['size']} bytes, "
+                             f"got {entry['written']}")
+        self._current = None
+        self.entries.append(entry)
+        size = entry['size']
+        if entry['zip64']:
+            return self._emit(struct.pack('<IIQQ', 0x08074b50, entry['crc'], size, size))
+        return self._emit(struct.pack('<IIII', 0x08074b50, entry['crc'], size, size))
+
+    def abandon_entry(self) -> bytes:
+        """End the current entry without listing it, e.g. when its file changed size while
+        being read. Its bytes stay in the stream (closed by a descriptor of what was
+        written), but the central directory does not point at them, so the archive
+        stays valid without that entry."""
+        entry, self._current = self._current, None
+        if entry['zip64']:
+            return self._emit(struct.pack('<IIQQ', 0x08074b50, entry['crc'], entry['written'], entry['written']))
+        return self._emit(struct.pack('<IIII', 0x08074b50, entry['crc'],
+                                      entry['written'] & ZIP64_LIMIT, entry['written'] & ZIP64_LIMIT))
+
+    def finish(self) -> bytes:
+        """Central directory and end records; the archive is complete after this."""
+        if self._current is not None:
+            raise RuntimeError('entry not ended')
+        cd_offset = self.offset
+        records = []
+        for e in self.entries:
+            size, offset = e['size'], e['offset']
+            fields = []
+            if size >= self.zip64_limit:
+                fields += [size, size]
+            if offset >= self.zip64_limit:
+                fields.append(offset)
+            extra = struct.pack(f'<HH{len(fields)}Q', 0x0001, 8 * len(fields), *fields) if fields else b''
+            records.append(struct.pack(
+                '<IHHHHHHIIIHHHHHII', 0x02014b50, _MADE_BY,
+                _VERSION_ZIP64 if fields else _VERSION_STORE, _FLAGS, 0, e['time'], e['date'], e['crc'],
+                ZIP64_LIMIT if size >= self.zip64_limit else size,
+                ZIP64_LIMIT if size >= self.zip64_limit else size,
+                len(e['name']), len(extra), 0, 0, 0, _FILE_ATTRS,
+                ZIP64_LIMIT if offset >= self.zip64_limit else offset) + e['name'] + extra)
+        central = b''.join(records)
+        count = len(self.entries)
+        cd_size = len(central)
+        tail = b''
+        if count >= ZIP64_COUNT_LIMIT or cd_offset >= self.zip64_limit or cd_size >= self.zip64_limit:
+            eocd64_offset = cd_offset + cd_size
+            tail += struct.pack('<IQHHIIQQQQ', 0x06064b50, 44, _MADE_BY, _VERSION_ZIP64, 0, 0,
+                                count, count, cd_size, cd_offset)
+            tail += struct.pack('<IIQI', 0x07064b50, 0, eocd64_offset, 1)
+            count = min(count, ZIP64_COUNT_LIMIT)
+            cd_size = min(cd_size, ZIP64_LIMIT)
+            cd_offset = min(cd_offset, ZIP64_LIMIT)
+        tail += struct.pack('<IHHHHIIH', 0x06054b50, 0, 0, count, count, cd_size, cd_offset, 0)
+        return self._emit(central + tail)
+